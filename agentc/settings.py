@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -74,12 +77,111 @@ WSGI_APPLICATION = 'agentc.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Configured from the environment:
+#   DB_ENGINE=sqlite (default) or postgresql
+#   DB_NAME, DB_USER, DB_PASSWORD, DB_HOST, DB_PORT
+#   DB_CONN_MAX_AGE: seconds a connection is reused across requests (0 closes it after every request)
+
+DB_ENGINE = os.getenv('DB_ENGINE', 'sqlite')
+DB_CONN_MAX_AGE = int(os.getenv('DB_CONN_MAX_AGE', '600'))
+
+if DB_ENGINE == 'postgresql':
+    # DB_POOL_MAX_SIZE > 0 uses psycopg's connection pool (needs psycopg[pool]), Django then requires
+    # CONN_MAX_AGE = 0 since the pool owns connection reuse
+    DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', '20'))
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('DB_NAME', 'agentc'),
+            'USER': os.getenv('DB_USER', 'agentc'),
+            'PASSWORD': os.getenv('DB_PASSWORD', ''),
+            'HOST': os.getenv('DB_HOST', 'localhost'),
+            'PORT': os.getenv('DB_PORT', '5432'),
+            'CONN_MAX_AGE': 0 if DB_POOL_MAX_SIZE else DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'pool': {
+                    'min_size': int(os.getenv('DB_POOL_MIN_SIZE', '2')),
+                    'max_size': DB_POOL_MAX_SIZE,
+                    'timeout': float(os.getenv('DB_POOL_TIMEOUT', '10')),
+                },
+            } if DB_POOL_MAX_SIZE else {},
+        }
     }
-}
+elif DB_ENGINE == 'sqlite':
+    # WAL lets readers run alongside the single writer, synchronous=NORMAL is durable in WAL mode
+    # except for the last transactions on power loss. Write transactions start with BEGIN IMMEDIATE,
+    # so concurrent writers queue on the busy timeout instead of failing with "database is locked"
+    # when a read lock can't be upgraded. DB_SQLITE_TUNED=0 restores the SQLite defaults.
+    # journal_mode=WAL is stored in the database file itself, so WAL (and synchronous=NORMAL with it)
+    # is set per connection on the file actually opened (apps/core/signals.py), every file except
+    # the db.sqlite3 tracked in git, which any manage.py command would otherwise modify.
+    DB_SQLITE_TUNED = os.getenv('DB_SQLITE_TUNED', '1') != '0'
+    DB_SQLITE_WAL = DB_SQLITE_TUNED
+    DB_SQLITE_TRACKED = BASE_DIR / 'db.sqlite3'
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv('DB_NAME') or BASE_DIR / 'db.sqlite3',
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE if DB_SQLITE_TUNED else 0,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'init_command': (
+                    'PRAGMA temp_store=MEMORY;'
+                    'PRAGMA cache_size=-20000;'
+                ),
+                'transaction_mode': 'IMMEDIATE',
+                # Busy timeout in seconds
+                'timeout': float(os.getenv('DB_SQLITE_TIMEOUT', '20')),
+            } if DB_SQLITE_TUNED else {},
+            # Tests run on a file too: threads of an in-memory test database share one cache, where a
+            # table lock fails at once ("database table is locked") instead of waiting for the busy timeout
+            'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+        }
+    }
+else:
+    raise ImproperlyConfigured(f"Unsupported DB_ENGINE '{DB_ENGINE}', use 'sqlite' or 'postgresql'.")
+
+
+# Worker processes
+
+# SHARED_STATE=1 keeps no state in process memory that another worker would need: the tool and completion
+# caches, rate limits, admission slots and stream resume buffers use their Django* backends on the 'default'
+# cache, conversations are written before the turn returns. Required to run several workers
+# (`manage.py serve --workers N`), see the end of this file. Metrics (/metrics) stay per process.
+SHARED_STATE = os.getenv('SHARED_STATE', '').lower() in ('1', 'true', 'yes')
+
+# Cache
+# Configured from the environment:
+#   CACHE_BACKEND=locmem (per process, default without SHARED_STATE), sqlite (standalone file shared by
+#   the workers of one host, default with SHARED_STATE) or redis (workers on several hosts, needs redis-py)
+#   CACHE_LOCATION: the SQLite file (cache.sqlite3 next to manage.py) or the redis:// URL
+
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'sqlite' if SHARED_STATE else 'locmem')
+
+if CACHE_BACKEND == 'locmem':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+elif CACHE_BACKEND == 'sqlite':
+    CACHES = {
+        'default': {
+            'BACKEND': 'apps.core.services.sqlite_cache.SQLiteCache',
+            'LOCATION': os.getenv('CACHE_LOCATION') or BASE_DIR / 'cache.sqlite3',
+            'OPTIONS': {'MAX_ENTRIES': 100_000},
+        }
+    }
+elif CACHE_BACKEND == 'redis':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('CACHE_LOCATION') or 'redis://localhost:6379',
+        }
+    }
+else:
+    raise ImproperlyConfigured(f"Unsupported CACHE_BACKEND '{CACHE_BACKEND}', use 'locmem', 'sqlite' or 'redis'.")
 
 
 # Password validation
@@ -124,3 +226,210 @@ STATICFILES_DIRS = [BASE_DIR / "static"]
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Conversation history storage
+# Backends: DatabaseConversationStore (Conversation/Message log shared by all workers, write-behind),
+# MemoryConversationStore (LRU + TTL, per process), SQLiteConversationStore (standalone file)
+
+CONVERSATION_STORE = {
+    'BACKEND': 'apps.core.services.conversation_store.DatabaseConversationStore',
+    'OPTIONS': {
+        # Most recent messages loaded per turn, older turns are folded into a stored summary
+        'window_messages': 50,
+        'summary_chars': 4000,
+        # Seconds appends are held back to be written together, and the queue size that writes at once
+        'flush_interval': 0.25,
+        'batch_size': 500,
+    },
+}
+
+
+# Agent tool-calling loop
+
+# Maximum model round trips with tool calls per user turn before a final answer is forced
+AGENT_MAX_STEPS = 5
+
+# Worker threads shared by all requests for running parallel tool calls
+AGENT_TOOL_WORKERS = 8
+
+# Start likely read tool calls before the model asks for them: guessed from the user input (emails,
+# "list clients"), and streamed tool calls as soon as their arguments are complete (services/prefetch.py)
+AGENT_PREFETCH_ENABLED = True
+
+# Approximate token budget for the history resent on every model call (system message included)
+AGENT_HISTORY_TOKEN_BUDGET = 8000
+
+# Tool results from earlier turns are cut to this many characters
+AGENT_HISTORY_TOOL_RESULT_CHARS = 1500
+
+# How tool results are written into the conversation
+# Backends: TableResultEncoder (header once, then rows), JSONResultEncoder (indented JSON)
+AGENT_RESULT_ENCODER = {
+    'BACKEND': 'apps.core.services.encoders.TableResultEncoder',
+    'OPTIONS': {
+        'max_rows': 100,
+        'max_chars': 6000,
+        # Per-function character budgets, e.g. {'list_team_members': 8000}
+        'function_budgets': {},
+    },
+}
+
+# Cache for read-only tool results (get_*/list_*), invalidated by write tools and model signals
+# Backends: LocalToolCache (in-process LRU), DjangoToolCache (any CACHES alias, shared between workers)
+TOOL_CACHE = {
+    'BACKEND': 'apps.core.services.tool_cache.LocalToolCache',
+    'OPTIONS': {
+        'max_entries': 2048,
+        'ttl': 5 * 60,
+    },
+}
+
+# Query profile of every tool call (services/profiling.py): queries, SQL time and rows returned, counted on
+# /metrics and logged at DEBUG on apps.core.profiling. A call over its query budget is logged as a warning
+# with its SQL. Budgets by tool name here, else the query_budget the tool was registered with, else the
+# default (None: no budget). BEGIN/SAVEPOINT/... don't count.
+TOOL_QUERY_PROFILING = True
+TOOL_QUERY_BUDGET_DEFAULT = 2
+TOOL_QUERY_BUDGETS = {}
+
+# Streaming replies (/stream-chat/)
+
+# Tiny model deltas are merged into one token event until this many characters or seconds
+SSE_COALESCE_MAX_CHARS = 64
+SSE_COALESCE_MAX_DELAY = 0.05
+# Comment frame sent while waiting (e.g. on tool calls) so proxies keep the connection open
+SSE_KEEPALIVE_SECONDS = 15
+# A turn nobody is listening to anymore is stopped after this many seconds (time left to reconnect)
+SSE_ABANDON_GRACE = 30
+# Events of recent streams, replayed to reconnecting clients (Last-Event-ID)
+# Backends: LocalStreamBuffer (per process), DjangoStreamBuffer (any CACHES alias, resumes on any worker)
+SSE_STREAM_BUFFER = {
+    'BACKEND': 'apps.core.services.sse.LocalStreamBuffer',
+    'OPTIONS': {
+        'max_streams': 1000,
+        'ttl': 5 * 60,
+    },
+}
+
+# Admission control on /chat/ and /stream-chat/ (services/ratelimit.py), set either to None to disable
+# Backends: Local* (per process), Django* (any CACHES alias, limits shared between workers)
+# Per client (session, else IP) token bucket: `burst` turns at once, refilled at `rate` per second -> 429
+CHAT_RATE_LIMIT = {
+    'BACKEND': 'apps.core.services.ratelimit.LocalRateLimiter',
+    'OPTIONS': {
+        'rate': 0.5,
+        'burst': 10,
+    },
+}
+# Turns running at once, and how many more may wait (up to queue_timeout seconds) for a slot -> 503
+CHAT_ADMISSION = {
+    'BACKEND': 'apps.core.services.ratelimit.LocalAdmission',
+    'OPTIONS': {
+        'max_in_flight': 32,
+        'max_queue': 64,
+        'queue_timeout': 10.0,
+    },
+}
+# Retry-After (seconds) sent with 503 responses
+CHAT_BUSY_RETRY_AFTER = 5
+# Take the client IP from X-Forwarded-For, only behind a proxy that sets it
+CHAT_RATE_LIMIT_TRUST_X_FORWARDED_FOR = False
+
+# Job queue for deferred tools (send_email, ...): the model gets a job id right away,
+# the call runs on a worker thread with retries (exponential backoff with jitter)
+JOB_WORKERS = 2
+# Start the workers inside the web process on first use, False leaves jobs to `manage.py run_jobs`
+JOB_RUN_IN_PROCESS = True
+JOB_MAX_ATTEMPTS = 3
+JOB_RETRY_BASE_DELAY = 2.0
+JOB_RETRY_MAX_DELAY = 60.0
+# Seconds between queue polls when idle (jobs enqueued by other processes, retries coming due)
+JOB_POLL_INTERVAL = 1.0
+# The same tool call (same conversation, tool_call id and arguments) dispatched again within this many
+# seconds returns the existing job instead of queuing it twice. Per tool: JOB_IDEMPOTENCY_WINDOWS[name].
+JOB_IDEMPOTENCY_WINDOW = 60 * 60
+JOB_IDEMPOTENCY_WINDOWS = {}
+# A running job not finished after this many seconds is assumed lost (worker died) and run again
+JOB_LEASE_SECONDS = 300
+
+# Per-turn spans (model calls, tool dispatch with DB queries, result encoding, SSE flushing),
+# logged as JSON on the apps.core.tracing logger and aggregated on /metrics
+AGENT_TRACING_ENABLED = os.getenv('AGENT_TRACING', '').lower() in ('1', 'true', 'yes')
+
+# OpenAI upstream
+
+OPENAI_MODEL = os.getenv('OPENAI_MODEL', 'gpt-4o-mini')
+
+# Model tier per turn (services/routing.py): trivial turns (greetings, thanks) take the "fast" tier,
+# everything else "default". 'tools': False sends no tools at all. Remove "fast" to disable the fast path.
+AGENT_ROUTING_ENABLED = True
+AGENT_MODEL_TIERS = {
+    'default': {'model': OPENAI_MODEL, 'tools': True},
+    'fast': {'model': os.getenv('OPENAI_FAST_MODEL') or OPENAI_MODEL, 'tools': False},
+}
+# Only offer the tool groups a turn is about (client, team_member, communication, job),
+# guessed from its keywords and the tools used earlier in the conversation
+AGENT_TOOL_PRUNING = True
+
+# None uses the public API, point it at `manage.py fake_openai` to run without network
+OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL') or None
+
+# Seconds, applied to every call made through the shared client
+OPENAI_CONNECT_TIMEOUT = 5.0
+OPENAI_READ_TIMEOUT = 60.0
+
+# Retries on 429/5xx/connection errors, exponential backoff with full jitter
+OPENAI_MAX_RETRIES = 3
+OPENAI_RETRY_BASE_DELAY = 0.5
+OPENAI_RETRY_MAX_DELAY = 8.0
+
+# Keep-alive connection pool shared by all requests of a process
+OPENAI_MAX_CONNECTIONS = 100
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = 20
+OPENAI_KEEPALIVE_EXPIRY = 30.0
+
+# Upstream calls (streams included) allowed at once per process, and how long to wait for a free slot
+OPENAI_MAX_CONCURRENT_REQUESTS = 32
+OPENAI_CONCURRENCY_TIMEOUT = 30.0
+
+# Cache of model responses in front of OpenAIService, set to None to disable
+# Backends: LocalCompletionCache (in-process LRU), DjangoCompletionCache (any CACHES alias)
+# similarity_threshold (0-1) enables the fuzzy tier on the last user message, e.g. 0.8
+COMPLETION_CACHE = {
+    'BACKEND': 'apps.core.services.completion_cache.LocalCompletionCache',
+    'OPTIONS': {
+        'max_entries': 1024,
+        'ttl': 10 * 60,
+        'similarity_threshold': None,
+    },
+}
+
+
+# Shared backends for SHARED_STATE (see "Worker processes") with the options above. Rate limits apply per
+# client across all workers, so does max_in_flight: raised to cover several workers.
+if SHARED_STATE:
+    CONVERSATION_STORE['OPTIONS']['flush_interval'] = 0
+    TOOL_CACHE = {
+        'BACKEND': 'apps.core.services.tool_cache.DjangoToolCache',
+        'OPTIONS': {'ttl': TOOL_CACHE['OPTIONS']['ttl']},
+    }
+    COMPLETION_CACHE = COMPLETION_CACHE and {
+        'BACKEND': 'apps.core.services.completion_cache.DjangoCompletionCache',
+        'OPTIONS': {
+            'ttl': COMPLETION_CACHE['OPTIONS']['ttl'],
+            'similarity_threshold': COMPLETION_CACHE['OPTIONS']['similarity_threshold'],
+        },
+    }
+    SSE_STREAM_BUFFER = {
+        'BACKEND': 'apps.core.services.sse.DjangoStreamBuffer',
+        'OPTIONS': SSE_STREAM_BUFFER['OPTIONS'],
+    }
+    CHAT_RATE_LIMIT = CHAT_RATE_LIMIT and {
+        'BACKEND': 'apps.core.services.ratelimit.DjangoRateLimiter',
+        'OPTIONS': CHAT_RATE_LIMIT['OPTIONS'],
+    }
+    CHAT_ADMISSION = CHAT_ADMISSION and {
+        'BACKEND': 'apps.core.services.ratelimit.DjangoAdmission',
+        'OPTIONS': {**CHAT_ADMISSION['OPTIONS'], 'max_in_flight': 128},
+    }
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from apps.core.models import TeamMember,Client
+from apps.core.models import TeamMember,Client,Job
 
 @admin.register(TeamMember)
 class TeamMemberAdmin(admin.ModelAdmin):
@@ -8,4 +8,9 @@ class TeamMemberAdmin(admin.ModelAdmin):
 
 @admin.register(Client)
 class ClientAdmin(admin.ModelAdmin):
-    list_display = ["name", "description", "email"]
\ No newline at end of file
+    list_display = ["name", "description", "email"]
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ["id", "tool", "status", "attempts", "run_after", "updated_at"]
+    list_filter = ["status", "tool"]
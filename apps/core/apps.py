@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.core'
+
+    def ready(self):
+        # Importing the function modules registers their tools, then schemas are built once for the process
+        from apps.core.services.functions import team_member, client, communication, job  # noqa: F401
+        from apps.core.services.registry import registry
+        from apps.core import signals  # noqa: F401
+
+        registry.freeze()
@@ -0,0 +1,456 @@
+import asyncio
+import json
+import logging
+import os
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connections
+from django.test import AsyncClient, Client as TestClient
+from django.test.utils import override_settings, setup_databases, teardown_databases
+
+from apps.core.models import Client, TeamMember
+from apps.core.services import completion_cache, openai_services, ratelimit
+from apps.core.services.agent import Agent
+from apps.core.services.conversation_store import get_conversation_store
+from apps.core.services.fake_openai import SCENARIOS, FakeScript, start_fake_openai
+
+TARGETS = ["agent", "chat", "stream", "astream"]
+# Targets that can run against `manage.py serve` workers (--workers)
+HTTP_TARGETS = ["chat", "stream"]
+PROMPT = "Tell me about our clients."
+# Sent for the --trivial-share of turns, routed to the fast tier
+TRIVIAL_PROMPT = "Thanks!"
+
+
+def percentiles(values: list) -> dict:
+    if not values:
+        return {"p50": None, "p95": None, "p99": None}
+    if len(values) == 1:
+        return {"p50": values[0], "p95": values[0], "p99": values[0]}
+    cuts = statistics.quantiles(values, n=100, method="inclusive")
+    return {"p50": cuts[49], "p95": cuts[94], "p99": cuts[98]}
+
+
+class ErrorCounter(logging.Handler):
+    # Failed tool calls are logged and handed back to the model, they never show in the reply
+    def __init__(self):
+        super().__init__(level=logging.ERROR)
+        self.count = 0
+
+    def emit(self, record):
+        self.count += 1
+
+
+def database_description() -> str:
+    connection = connections["default"]
+    if connection.vendor != "sqlite":
+        return connection.vendor
+    with connection.cursor() as cursor:
+        journal_mode = cursor.execute("PRAGMA journal_mode").fetchone()[0]
+    transaction_mode = connection.transaction_mode or "DEFERRED"
+    return f"sqlite journal_mode={journal_mode} transaction_mode={transaction_mode}"
+
+
+def worker_counts(value: str) -> list:
+    try:
+        counts = [int(count) for count in value.split(",")]
+    except ValueError:
+        counts = []
+    if not counts or min(counts) < 1:
+        raise ValueError(value)
+    return counts
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def reset_process_state():
+    # The shared clients/caches were built from the old settings, rebuild them on next use
+    openai_services.get_openai_client.cache_clear()
+    openai_services._async_state.clear()
+    completion_cache.get_completion_cache.cache_clear()
+    ratelimit.get_rate_limiter.cache_clear()
+    ratelimit.get_admission.cache_clear()
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the chat pipeline offline against a local fake OpenAI server. "
+        "Runs on a throwaway test database and reports latency percentiles, time-to-first-token, "
+        "throughput and memory growth per turn."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--target", choices=TARGETS, default="chat")
+        parser.add_argument("--scenario", choices=SCENARIOS, default="tool")
+        parser.add_argument("--requests", type=int, default=200, help="Total turns.")
+        parser.add_argument("--concurrency", type=int, default=10, help="Concurrent conversations.")
+        parser.add_argument("--reply-tokens", type=int, default=40)
+        parser.add_argument("--first-token-ms", type=float, default=300)
+        parser.add_argument("--token-ms", type=float, default=10)
+        parser.add_argument("--tool-calls", type=int, default=5)
+        parser.add_argument("--seed-rows", type=int, default=200, help="Clients and team members to create.")
+        parser.add_argument("--completion-cache", action="store_true", help="Keep COMPLETION_CACHE enabled.")
+        parser.add_argument("--trivial-share", type=float, default=0.0,
+                            help="Share of turns (0-1) that are trivial chit-chat (\"Thanks!\").")
+        parser.add_argument("--rate-limit", action="store_true",
+                            help="Keep CHAT_RATE_LIMIT enabled (turns over it count as rejected).")
+        parser.add_argument("--workers", type=worker_counts, default=None,
+                            help="Run chat/stream over HTTP against `manage.py serve --workers N` (SHARED_STATE) "
+                                 "for each comma-separated N, e.g. 1,2,4, and report the scaling.")
+        parser.add_argument("--server", choices=("auto", "uvicorn", "gunicorn", "wsgi"), default="auto",
+                            help="`manage.py serve --server` for --workers.")
+        parser.add_argument("--trace-memory", action="store_true", help="Use tracemalloc (slower, exact).")
+        parser.add_argument("--json", action="store_true", help="Print the report as JSON.")
+
+    def handle(self, *args, **options):
+        if options["workers"] and options["target"] not in HTTP_TARGETS:
+            raise CommandError(f"--workers runs over HTTP, use --target {' or '.join(HTTP_TARGETS)}.")
+        script = FakeScript(
+            scenario=options["scenario"],
+            reply_tokens=options["reply_tokens"],
+            first_token_latency=options["first_token_ms"] / 1000,
+            token_latency=options["token_ms"] / 1000,
+            tool_calls=options["tool_calls"],
+            emails=[f"client{i}@example.com" for i in range(max(options["seed_rows"], 1))],
+        )
+        server = start_fake_openai(script)
+        os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+
+        overrides = {
+            "OPENAI_BASE_URL": server.base_url,
+            "ALLOWED_HOSTS": ["*"],
+        }
+        if not options["completion_cache"]:
+            # Every benchmark turn sends the same prompt, cached replies would hide the pipeline cost
+            overrides["COMPLETION_CACHE"] = None
+        if not options["rate_limit"]:
+            # Benchmark conversations send turns back to back, far above any per-client rate
+            overrides["CHAT_RATE_LIMIT"] = None
+
+        with tempfile.TemporaryDirectory() as tmp, override_settings(**overrides):
+            reset_process_state()
+            connection = connections["default"]
+            if connection.vendor == "sqlite":
+                # A file (not :memory:) so worker threads can write concurrently
+                connection.settings_dict["TEST"]["NAME"] = os.path.join(tmp, "bench.sqlite3")
+            old_config = setup_databases(verbosity=0, interactive=False)
+            try:
+                self.seed(options["seed_rows"])
+                if options["workers"]:
+                    reports = [
+                        self.run_workers(options, server, workers, overrides, tmp)
+                        for workers in options["workers"]
+                    ]
+                else:
+                    report = self.run_benchmark(options, server)
+            finally:
+                # Conversation appends still held back belong to the throwaway database
+                get_conversation_store().flush()
+                close_old_connections()
+                teardown_databases(old_config, verbosity=0)
+                server.shutdown()
+                reset_process_state()
+
+        if options["workers"]:
+            if options["json"]:
+                self.stdout.write(json.dumps(reports, indent=2))
+            else:
+                self.print_scaling(reports)
+        elif options["json"]:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self.print_report(report)
+
+    def seed(self, rows: int):
+        Client.objects.bulk_create(
+            Client(name=f"Client {i}", description=f"Account {i}", email=f"client{i}@example.com")
+            for i in range(rows)
+        )
+        TeamMember.objects.bulk_create(
+            TeamMember(
+                first_name=f"First{i}",
+                last_name=f"Last{i}",
+                email=f"member{i}@example.com",
+                country=["Brazil", "Chile", "Portugal"][i % 3],
+            )
+            for i in range(rows)
+        )
+
+    def run_workers(self, options: dict, server, workers: int, overrides: dict, tmp: str) -> dict:
+        # `manage.py serve` on the benchmark database, the overrides go through a settings module
+        with open(os.path.join(tmp, "bench_settings.py"), "w") as module:
+            module.write("from agentc.settings import *  # noqa\n")
+            module.writelines(f"{name} = {value!r}\n" for name, value in overrides.items())
+        port = free_port()
+        env = {
+            **os.environ,
+            "DJANGO_SETTINGS_MODULE": "bench_settings",
+            "PYTHONPATH": os.pathsep.join([tmp, str(settings.BASE_DIR), os.environ.get("PYTHONPATH", "")]),
+            "DB_NAME": str(connections["default"].settings_dict["NAME"]),
+            "SHARED_STATE": "1",
+            "CACHE_BACKEND": "sqlite",
+            "CACHE_LOCATION": os.path.join(tmp, f"cache-{port}.sqlite3"),
+        }
+        process = subprocess.Popen(
+            [sys.executable, str(settings.BASE_DIR / "manage.py"), "serve",
+             "--workers", str(workers), "--port", str(port), "--server", options["server"]],
+            env=env,
+            stdout=subprocess.DEVNULL,
+        )
+        try:
+            self.base_url = f"http://127.0.0.1:{port}"
+            self.wait_for_server(process)
+            server.requests = 0
+            report = self.run_benchmark(options, server)
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+        report["workers"] = workers
+        return report
+
+    def wait_for_server(self, process, timeout: float = 30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise CommandError(f"manage.py serve exited with {process.returncode}.")
+            try:
+                httpx.get(f"{self.base_url}/chat/", timeout=1)
+                return
+            except httpx.TransportError:
+                time.sleep(0.2)
+        raise CommandError(f"manage.py serve didn't answer within {timeout}s.")
+
+    def run_benchmark(self, options: dict, server) -> dict:
+        target = options["target"]
+        self.trivial_share = options["trivial_share"]
+        concurrency = max(1, options["concurrency"])
+        # Each conversation runs its share of turns sequentially, so history grows like in real use
+        requests = options["requests"]
+        turns = [requests // concurrency + (i < requests % concurrency) for i in range(concurrency)]
+
+        if options["trace_memory"]:
+            tracemalloc.start()
+        memory_start = self.memory_kb(options["trace_memory"])
+        database = database_description()
+        close_old_connections()
+        errors = ErrorCounter()
+        logging.getLogger().addHandler(errors)
+        started = time.perf_counter()
+
+        if target == "astream":
+            results = asyncio.run(self.run_async(turns))
+        else:
+            if options["workers"]:
+                run = {"chat": self.run_http_chat, "stream": self.run_http_stream}[target]
+            else:
+                run = {"agent": self.run_agent, "chat": self.run_chat, "stream": self.run_stream}[target]
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                results = [result for batch in executor.map(run, turns) for result in batch]
+
+        elapsed = time.perf_counter() - started
+        logging.getLogger().removeHandler(errors)
+        memory_end = self.memory_kb(options["trace_memory"])
+        if options["trace_memory"]:
+            tracemalloc.stop()
+
+        # Turns turned away by admission control (429/503) are reported apart from the served ones
+        rejected = sum(result.get("rejected", False) for result in results)
+        results = [result for result in results if not result.get("rejected")]
+        latencies = [result["latency"] for result in results if not result["error"]]
+        first_tokens = [result["ttft"] for result in results if result["ttft"] is not None]
+        return {
+            "target": target,
+            "scenario": options["scenario"],
+            "trivial_share": self.trivial_share,
+            "turns": len(results),
+            "concurrency": concurrency,
+            "errors": sum(result["error"] for result in results),
+            "rejected": rejected,
+            "logged_errors": errors.count,
+            "database": database,
+            "elapsed_s": elapsed,
+            "throughput_rps": len(results) / elapsed if elapsed else 0.0,
+            "latency_ms": {key: value * 1000 if value is not None else None
+                           for key, value in percentiles(latencies).items()},
+            "ttft_ms": {key: value * 1000 if value is not None else None
+                        for key, value in percentiles(first_tokens).items()},
+            "model_calls_per_turn": server.requests / len(results) if results else 0.0,
+            # The workers' memory isn't visible from here
+            "memory_growth_kb_per_turn": (
+                (memory_end - memory_start) / len(results) if results and not options["workers"] else None
+            ),
+            "memory_source": "tracemalloc" if options["trace_memory"] else "max_rss",
+        }
+
+    def prompt(self, turn: int) -> str:
+        # Spreads the trivial turns evenly over each conversation
+        share = self.trivial_share
+        return TRIVIAL_PROMPT if int((turn + 1) * share) > int(turn * share) else PROMPT
+
+    def memory_kb(self, traced: bool) -> float:
+        if traced:
+            return tracemalloc.get_traced_memory()[0] / 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    def run_agent(self, turns: int) -> list:
+        results, history = [], []
+        try:
+            for turn in range(turns):
+                agent = Agent(history=history)
+                started = time.perf_counter()
+                reply = agent.handle_message(self.prompt(turn))
+                results.append({
+                    "latency": time.perf_counter() - started,
+                    "ttft": None,
+                    "error": reply.startswith("[Error"),
+                })
+                history = agent.history
+        finally:
+            close_old_connections()
+        return results
+
+    def run_chat(self, turns: int) -> list:
+        results, client = [], TestClient()
+        try:
+            for turn in range(turns):
+                started = time.perf_counter()
+                response = client.post("/chat/", {"user_input": self.prompt(turn)}, content_type="application/json")
+                reply = response.json().get("reply", "") if response.status_code == 200 else ""
+                results.append({
+                    "latency": time.perf_counter() - started,
+                    "ttft": None,
+                    "error": response.status_code not in (200, 429, 503) or reply.startswith("[Error"),
+                    "rejected": response.status_code in (429, 503),
+                })
+        finally:
+            close_old_connections()
+        return results
+
+    def run_stream(self, turns: int) -> list:
+        results, client = [], TestClient()
+        try:
+            for turn in range(turns):
+                started = time.perf_counter()
+                response = client.get("/stream-chat/", {"user_input": self.prompt(turn)})
+                if not response.streaming:
+                    results.append(self.rejected(started, response))
+                    continue
+                results.append(self.read_stream(started, response.streaming_content))
+        finally:
+            close_old_connections()
+        return results
+
+    def run_http_chat(self, turns: int) -> list:
+        # The session cookie keeps one conversation per client, whichever worker serves each turn
+        results = []
+        with httpx.Client(base_url=self.base_url, timeout=60) as client:
+            for turn in range(turns):
+                started = time.perf_counter()
+                response = client.post("/chat/", json={"user_input": self.prompt(turn)})
+                reply = response.json().get("reply", "") if response.status_code == 200 else ""
+                results.append({
+                    "latency": time.perf_counter() - started,
+                    "ttft": None,
+                    "error": response.status_code not in (200, 429, 503) or reply.startswith("[Error"),
+                    "rejected": response.status_code in (429, 503),
+                })
+        return results
+
+    def run_http_stream(self, turns: int) -> list:
+        results = []
+        with httpx.Client(base_url=self.base_url, timeout=60) as client:
+            for turn in range(turns):
+                started = time.perf_counter()
+                with client.stream("GET", "/stream-chat/", params={"user_input": self.prompt(turn)}) as response:
+                    if not response.headers.get("content-type", "").startswith("text/event-stream"):
+                        response.read()
+                        results.append(self.rejected(started, response))
+                        continue
+                    results.append(self.read_stream(started, response.iter_lines()))
+        return results
+
+    def rejected(self, started: float, response) -> dict:
+        # 429/503 from admission control come back as plain JSON responses
+        return {
+            "latency": time.perf_counter() - started,
+            "ttft": None,
+            "error": response.status_code not in (429, 503),
+            "rejected": response.status_code in (429, 503),
+        }
+
+    def read_stream(self, started: float, frames) -> dict:
+        ttft, error = None, False
+        for frame in frames:
+            text = frame.decode() if isinstance(frame, bytes) else frame
+            if ttft is None and "event: token" in text:
+                ttft = time.perf_counter() - started
+            error = error or "event: error" in text
+        return {"latency": time.perf_counter() - started, "ttft": ttft, "error": error}
+
+    async def run_async(self, turns: list) -> list:
+        async def conversation(count: int) -> list:
+            results, client = [], AsyncClient()
+            for turn in range(count):
+                started = time.perf_counter()
+                response = await client.get("/stream-chat/", {"user_input": self.prompt(turn)})
+                if not response.streaming:
+                    results.append(self.rejected(started, response))
+                    continue
+                ttft, error = None, False
+                async for frame in response.streaming_content:
+                    text = frame.decode() if isinstance(frame, bytes) else frame
+                    if ttft is None and "event: token" in text:
+                        ttft = time.perf_counter() - started
+                    error = error or "event: error" in text
+                results.append({"latency": time.perf_counter() - started, "ttft": ttft, "error": error})
+            return results
+
+        batches = await asyncio.gather(*(conversation(count) for count in turns))
+        return [result for batch in batches for result in batch]
+
+    def print_report(self, report: dict):
+        def fmt(values):
+            return " ".join(
+                f"{key}={value:.1f}" if value is not None else f"{key}=n/a" for key, value in values.items()
+            )
+
+        self.stdout.write(f"target={report['target']} scenario={report['scenario']} "
+                          f"trivial_share={report['trivial_share']} "
+                          f"turns={report['turns']} concurrency={report['concurrency']} errors={report['errors']} "
+                          f"rejected={report['rejected']} logged_errors={report['logged_errors']}")
+        self.stdout.write(f"database:         {report['database']}")
+        self.stdout.write(f"latency ms:       {fmt(report['latency_ms'])}")
+        self.stdout.write(f"first token ms:   {fmt(report['ttft_ms'])}")
+        self.stdout.write(f"throughput:       {report['throughput_rps']:.1f} turns/s "
+                          f"({report['elapsed_s']:.2f}s total)")
+        self.stdout.write(f"model calls/turn: {report['model_calls_per_turn']:.2f}")
+        if report["memory_growth_kb_per_turn"] is not None:
+            self.stdout.write(f"memory growth:    {report['memory_growth_kb_per_turn']:.1f} KB/turn "
+                              f"({report['memory_source']})")
+
+    def print_scaling(self, reports: list):
+        for report in reports:
+            self.stdout.write(f"--- {report['workers']} worker(s)")
+            self.print_report(report)
+        # Efficiency: throughput per worker relative to the first run, 1.0 is linear scaling
+        base = reports[0]["throughput_rps"] / reports[0]["workers"]
+        self.stdout.write("--- scaling")
+        for report in reports:
+            efficiency = report["throughput_rps"] / report["workers"] / base if base else 0.0
+            self.stdout.write(f"workers={report['workers']:<3} throughput={report['throughput_rps']:.1f} turns/s "
+                              f"efficiency={efficiency:.2f}")
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from apps.core.services.fake_openai import SCENARIOS, FakeOpenAIServer, FakeScript
+
+
+class Command(BaseCommand):
+    help = "Run a local fake OpenAI chat completions server (use with OPENAI_BASE_URL)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8765)
+        parser.add_argument("--scenario", choices=SCENARIOS, default="text")
+        parser.add_argument("--reply-tokens", type=int, default=40)
+        parser.add_argument("--first-token-ms", type=float, default=300)
+        parser.add_argument("--token-ms", type=float, default=10)
+        parser.add_argument("--tool-calls", type=int, default=5)
+        parser.add_argument("--email", action="append", dest="emails", help="Email used in get_client calls.")
+
+    def handle(self, *args, **options):
+        script = FakeScript(
+            scenario=options["scenario"],
+            reply_tokens=options["reply_tokens"],
+            first_token_latency=options["first_token_ms"] / 1000,
+            token_latency=options["token_ms"] / 1000,
+            tool_calls=options["tool_calls"],
+            emails=options["emails"] or ["client0@example.com"],
+        )
+        server = FakeOpenAIServer((options["host"], options["port"]), script)
+        self.stdout.write(f"Fake OpenAI listening, set OPENAI_BASE_URL={server.base_url}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
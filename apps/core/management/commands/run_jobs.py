@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.core.services.jobs import JobQueue
+
+
+class Command(BaseCommand):
+    help = (
+        "Run job queue workers in this process, for deployments with JOB_RUN_IN_PROCESS = False "
+        "or to drain jobs left queued by a stopped web process."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=2)
+        parser.add_argument("--poll-interval", type=float, default=1.0)
+        parser.add_argument("--once", action="store_true", help="Run every due job, then exit.")
+
+    def handle(self, *args, **options):
+        queue = JobQueue(workers=options["workers"], poll_interval=options["poll_interval"])
+        if options["once"]:
+            count = 0
+            while queue.run_pending():
+                count += 1
+            self.stdout.write(f"Ran {count} jobs.")
+            return
+
+        queue.start()
+        self.stdout.write(f"Running {options['workers']} job workers, Ctrl+C to stop.")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            queue.stop(timeout=30)
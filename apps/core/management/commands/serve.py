@@ -0,0 +1,156 @@
+import argparse
+import importlib.util
+import os
+import signal
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler, get_internal_wsgi_application
+
+# A worker exiting this soon after it started is failing to start (port taken, bad settings), not crashing
+MIN_WORKER_UPTIME = 5.0
+
+
+# Production servers, in order of preference for --server auto
+SERVERS = ("uvicorn", "gunicorn")
+
+
+class ReusePortWSGIServer(ThreadedWSGIServer):
+    # Every worker binds the same port (SO_REUSEPORT), the kernel spreads new connections over them
+    allow_reuse_port = True
+    request_queue_size = 128
+
+
+class QuietWSGIRequestHandler(WSGIRequestHandler):
+    # Access log off, failed requests are still logged
+    def log_request(self, code="-", size="-"):
+        if str(code).isdigit() and int(code) >= 400:
+            super().log_request(code, size)
+
+
+def check_shared_state():
+    if not settings.SHARED_STATE:
+        raise CommandError(
+            "Several workers need SHARED_STATE=1, otherwise each keeps its own caches, rate limits "
+            "and stream buffers."
+        )
+    if settings.CACHES["default"]["BACKEND"] == "django.core.cache.backends.locmem.LocMemCache":
+        raise CommandError("Several workers need a cache they all reach, set CACHE_BACKEND=sqlite or redis.")
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve the app with several worker processes on one port: uvicorn workers (ASGI), or gunicorn "
+        "workers (WSGI) when only gunicorn is installed. --server wsgi runs Django's development server "
+        "in each worker instead, for local testing only. More than one worker requires SHARED_STATE=1."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8000)
+        parser.add_argument("--workers", type=int, default=1)
+        parser.add_argument("--server", choices=("auto", *SERVERS, "wsgi"), default="auto",
+                            help="wsgi: Django's development server, for local testing only.")
+        parser.add_argument("--access-log", action="store_true")
+        # Set on the processes started by the wsgi server
+        parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        if options["worker"]:
+            return self.run_worker(options)
+        if options["workers"] > 1:
+            check_shared_state()
+
+        server = options["server"]
+        if server == "auto":
+            server = next((name for name in SERVERS if importlib.util.find_spec(name)), None)
+            if server is None:
+                raise CommandError(
+                    "Serving needs uvicorn or gunicorn, pip install uvicorn. --server wsgi runs Django's "
+                    "development server instead, for local testing only."
+                )
+        self.stdout.write(
+            f"Serving on http://{options['host']}:{options['port']}/ with {options['workers']} {server} "
+            f"workers, Ctrl+C to stop."
+        )
+        if server == "uvicorn":
+            self.run_uvicorn(options)
+        elif server == "gunicorn":
+            self.run_gunicorn(options)
+        else:
+            self.stderr.write("The wsgi server is Django's development server, don't use it in production.")
+            self.run_workers(options)
+
+    def run_uvicorn(self, options: dict):
+        try:
+            import uvicorn
+        except ImportError:
+            raise CommandError("--server uvicorn needs uvicorn, pip install uvicorn.")
+        uvicorn.run(
+            "agentc.asgi:application",
+            host=options["host"],
+            port=options["port"],
+            workers=options["workers"],
+            access_log=options["access_log"],
+        )
+
+    def run_gunicorn(self, options: dict):
+        if not importlib.util.find_spec("gunicorn"):
+            raise CommandError("--server gunicorn needs gunicorn, pip install gunicorn.")
+        host = f"[{options['host']}]" if ":" in options["host"] else options["host"]
+        # Threaded workers: a streamed turn holds its thread until the reply is done. gunicorn replaces
+        # this process, so process managers signal it directly.
+        self.stdout.flush()
+        os.execv(sys.executable, [
+            sys.executable, "-m", "gunicorn", "agentc.wsgi:application",
+            "--bind", f"{host}:{options['port']}",
+            "--workers", str(options["workers"]), "--worker-class", "gthread", "--threads", "8",
+            *(["--access-logfile", "-"] if options["access_log"] else []),
+        ])
+
+    def run_worker(self, options: dict):
+        handler = WSGIRequestHandler if options["access_log"] else QuietWSGIRequestHandler
+        server = ReusePortWSGIServer((options["host"], options["port"]), handler, ipv6=":" in options["host"])
+        server.set_app(get_internal_wsgi_application())
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+
+    def run_workers(self, options: dict):
+        # Supervisor: one `serve --worker` process per worker, restarted when it dies
+        command = [
+            sys.executable, str(settings.BASE_DIR / "manage.py"), "serve", "--worker",
+            "--host", options["host"], "--port", str(options["port"]),
+            *(["--access-log"] if options["access_log"] else []),
+        ]
+        workers = [(subprocess.Popen(command), time.monotonic()) for _ in range(options["workers"])]
+        # SIGTERM (process managers) stops like Ctrl+C
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+        try:
+            while True:
+                time.sleep(0.5)
+                for i, (process, started) in enumerate(workers):
+                    if process.poll() is None:
+                        continue
+                    if time.monotonic() - started < MIN_WORKER_UPTIME:
+                        raise CommandError(f"Worker {process.pid} exited with {process.returncode} on start.")
+                    self.stderr.write(f"Worker {process.pid} exited with {process.returncode}, restarting it.")
+                    workers[i] = (subprocess.Popen(command), time.monotonic())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            for process, _ in workers:
+                if process.poll() is None:
+                    process.terminate()
+            for process, _ in workers:
+                try:
+                    process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.4 on 2026-10-17 13:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_conversation'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(fields=['name'], name='core_client_name_76d9ae_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='teammember',
+            index=models.Index(fields=['country'], name='core_teamme_country_723d3b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='teammember',
+            index=models.Index(fields=['joined_on'], name='core_teamme_joined__6bd0c2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='teammember',
+            index=models.Index(fields=['last_name', 'first_name'], name='core_teamme_last_na_2d5b0c_idx'),
+        ),
+    ]
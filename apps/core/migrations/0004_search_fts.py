@@ -0,0 +1,61 @@
+from django.db import migrations
+
+# SQLite FTS5 indexes over clients and team members (external content, the rows stay in the model tables).
+# Triggers keep them in sync with every write, whatever path it takes. Skipped on other databases,
+# search then falls back to icontains (see apps/core/services/search.py).
+
+FTS_TABLES = {
+    "core_client": ["name", "description", "email"],
+    "core_teammember": ["first_name", "last_name", "country", "email"],
+}
+
+
+def fts5_available(schema_editor) -> bool:
+    if schema_editor.connection.vendor != "sqlite":
+        return False
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("PRAGMA compile_options")
+        return any(row[0] == "ENABLE_FTS5" for row in cursor.fetchall())
+
+
+def create_fts(apps, schema_editor):
+    if not fts5_available(schema_editor):
+        return
+    for table, columns in FTS_TABLES.items():
+        fts = f"{table}_fts"
+        names = ", ".join(columns)
+        new_values = ", ".join(f"new.{column}" for column in columns)
+        old_values = ", ".join(f"old.{column}" for column in columns)
+        delete_old = f"INSERT INTO {fts}({fts}, rowid, {names}) VALUES ('delete', old.id, {old_values});"
+        insert_new = f"INSERT INTO {fts}(rowid, {names}) VALUES (new.id, {new_values});"
+
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE {fts} USING fts5({names}, content='{table}', content_rowid='id', "
+            f"tokenize='unicode61 remove_diacritics 2')"
+        )
+        schema_editor.execute(f"CREATE TRIGGER {fts}_ai AFTER INSERT ON {table} BEGIN {insert_new} END")
+        schema_editor.execute(f"CREATE TRIGGER {fts}_ad AFTER DELETE ON {table} BEGIN {delete_old} END")
+        schema_editor.execute(f"CREATE TRIGGER {fts}_au AFTER UPDATE ON {table} BEGIN {delete_old} {insert_new} END")
+        # Index the rows that already exist
+        schema_editor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for table in FTS_TABLES:
+        fts = f"{table}_fts"
+        for suffix in ("ai", "ad", "au"):
+            schema_editor.execute(f"DROP TRIGGER IF EXISTS {fts}_{suffix}")
+        schema_editor.execute(f"DROP TABLE IF EXISTS {fts}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_search_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts, drop_fts),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.2.4 on 2026-10-17 13:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def copy_messages(apps, schema_editor):
+    # Stored histories (Conversation.messages) become Message rows
+    Conversation = apps.get_model('core', 'Conversation')
+    Message = apps.get_model('core', 'Message')
+    for conversation in Conversation.objects.exclude(messages=[]).iterator():
+        Message.objects.bulk_create(
+            Message(conversation=conversation, sequence=sequence, role=message.get('role', ''), data=message)
+            for sequence, message in enumerate(conversation.messages, start=1)
+        )
+        conversation.last_sequence = len(conversation.messages)
+        conversation.save(update_fields=['last_sequence'])
+
+
+def restore_messages(apps, schema_editor):
+    Conversation = apps.get_model('core', 'Conversation')
+    Message = apps.get_model('core', 'Message')
+    for conversation in Conversation.objects.iterator():
+        rows = Message.objects.filter(conversation=conversation).order_by('sequence')
+        conversation.messages = [row.data for row in rows]
+        conversation.save(update_fields=['messages'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='last_sequence',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='summary',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='summary_sequence',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='Message',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sequence', models.PositiveIntegerField()),
+                ('role', models.CharField(max_length=16)),
+                ('data', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.conversation')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('conversation', 'sequence'), name='core_message_conversation_sequence')],
+            },
+        ),
+        migrations.RunPython(copy_messages, restore_messages),
+        migrations.RemoveField(
+            model_name='conversation',
+            name='messages',
+        ),
+    ]
@@ -7,7 +7,67 @@ class TeamMember (models.Model):
     country = models.CharField(max_length=50)
     joined_on = models.DateField(null=True, blank=True)
 
+    class Meta:
+        # Filters used by list_team_members/search_team_members, full-text search is in search.py
+        indexes = [
+            models.Index(fields=["country"]),
+            models.Index(fields=["joined_on"]),
+            models.Index(fields=["last_name", "first_name"]),
+        ]
+
 class Client (models.Model):
     name = models.CharField(max_length=50)
     description = models.CharField(max_length=50)
-    email = models.EmailField(max_length=254, unique=True)
\ No newline at end of file
+    email = models.EmailField(max_length=254, unique=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["name"]),
+        ]
+
+class Conversation (models.Model):
+    # Log of one conversation (DatabaseConversationStore): Message rows, plus a summary of the
+    # messages up to summary_sequence that no longer need to be loaded
+    key = models.CharField(max_length=64, unique=True)
+    summary = models.TextField(blank=True)
+    summary_sequence = models.PositiveIntegerField(default=0)
+    last_sequence = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+class Message (models.Model):
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE)
+    sequence = models.PositiveIntegerField()
+    role = models.CharField(max_length=16)
+    # The message as sent to the model (content, tool_calls, tool_call_id, ...)
+    data = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        # Also the index behind loading a conversation's most recent messages
+        constraints = [
+            models.UniqueConstraint(fields=["conversation", "sequence"], name="core_message_conversation_sequence"),
+        ]
+
+class Job (models.Model):
+    # Deferred tool call run by the job queue (apps/core/services/jobs.py)
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    STATUS_CHOICES = [(QUEUED, "Queued"), (RUNNING, "Running"), (SUCCEEDED, "Succeeded"), (FAILED, "Failed")]
+
+    tool = models.CharField(max_length=64)
+    arguments = models.JSONField(default=dict)
+    idempotency_key = models.CharField(max_length=64, unique=True)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    run_after = models.DateTimeField()
+    result = models.TextField(blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "run_after"]),
+        ]
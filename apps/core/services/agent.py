@@ -1,277 +1,392 @@
+import asyncio
 import json
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing
+from functools import lru_cache
+from asgiref.sync import sync_to_async
+from pydantic import ValidationError
+from django.conf import settings
+from django.db import close_old_connections
 from apps.core.services.openai_services import OpenAIService
-from apps.core.services.schemas import get_schemas
-from apps.core.services.functions.team_member import FUNCTION_MAP as TEAM_MEMBER_FUNCTIONS
-from apps.core.services.functions.client import FUNCTION_MAP as CLIENT_FUNCTIONS
-from apps.core.services.functions.communication import FUNCTION_MAP as COMMUNICATION_FUNCTIONS
-
-FUNCTION_MAP = {
-    **TEAM_MEMBER_FUNCTIONS,
-    **CLIENT_FUNCTIONS,
-    **COMMUNICATION_FUNCTIONS,
-}
-
-def summarize_result(result):
-    # Helper function to summarize function result in a nice way
-    if isinstance(result, list):
-        if not result:
-            return "No entries found."
-        return "\n\n".join(f"- {json.dumps(item, indent=2)}" for item in result)
-    if isinstance(result, dict):
-        if not result:
-            return "No entries found."
-        return json.dumps(result, indent=2)
-    return str(result) if result else "No entries found."
+from apps.core.services.streaming import StreamAccumulator
+from apps.core.services.history import HistoryManager
+from apps.core.services.encoders import get_result_encoder
+from apps.core.services.registry import registry
+from apps.core.services.tracing import NULL_TRACE, start_trace
+from apps.core.services.prefetch import NULL_PREFETCHER, start_prefetch
+from apps.core.services.routing import route_turn
+
+def summarize_result(result, function_name: str | None = None):
+    # Helper function to turn a function result into compact text for the model (see encoders.py)
+    return get_result_encoder().encode(result, function_name)
+
+
+@lru_cache(maxsize=None)
+def get_tool_executor() -> ThreadPoolExecutor:
+    # Shared, bounded pool for running several tool calls of one turn concurrently
+    return ThreadPoolExecutor(
+        max_workers=getattr(settings, "AGENT_TOOL_WORKERS", 8),
+        thread_name_prefix="agent-tool",
+    )
+
+
+def tool_calls_to_dicts(tool_calls) -> list:
+    # SDK tool call objects -> plain dicts that can be resent and stored in the conversation store
+    return [{
+        "id": tool_call.id,
+        "type": "function",
+        "function": {
+            "name": tool_call.function.name,
+            "arguments": tool_call.function.arguments,
+        },
+    } for tool_call in tool_calls]
+
+
+def tool_start_event(tool_calls: list) -> tuple:
+    return "tool_start", {"tools": [{"id": call["id"], "name": call["function"]["name"]} for call in tool_calls]}
+
+
+def tool_result_events(tool_calls: list, results: list) -> list:
+    # Only what the UI shows (which tool finished, did it fail), the results themselves stay server side
+    return [
+        ("tool_result", {"id": call["id"], "name": call["function"]["name"], "ok": not result.startswith("[")})
+        for call, result in zip(tool_calls, results)
+    ]
+
+
+@lru_cache(maxsize=None)
+def get_system_message() -> dict:
+    # Built once per process from the frozen tool registry, every Agent shares the same dict
+    available_tools = ", ".join(registry.names())
+
+    return {
+        "role": "system",
+        "content": (
+            f"You are a helpful, proactive AI assistant designed to support leadership and operations teams. "
+            f"You can access internal tools via function calls, such as: {available_tools}.\n\n"
+
+            "OUTPUT RULES (MANDATORY):\n"
+            "1) Always reply in plain, unformatted text only. Do NOT use Markdown, HTML, code blocks, tables, or emojis. "
+            "Do not include raw JSON or other machine-readable encodings unless explicitly requested.\n\n"
+
+            "2) Be concise and presentation-friendly. Use short paragraphs separated by single blank lines. "
+            "When listing multiple items, write them as simple numbered lines or short sentences — do NOT use bullet Markdown syntax.\n\n"
+
+            "3) For structured records (clients, team members, etc.), use this plain-text format exactly:\n\n"
+            "Name: Client Name\n"
+            "Description: Short description here.\n"
+            "Email: contact@client.com\n\n"
+            "Repeat the block above for each record, separated by a single blank line.\n\n"
+
+            "4) If a function call returns no results, reply exactly:\n"
+            "No results found.\n\n"
+            "Then offer a helpful next step or question.\n\n"
+
+            "5) ALWAYS produce a non-empty answer. If you need clarification, ask one simple clarifying question.\n\n"
+
+            "Tone: professional, supportive, and efficient."
+        )
+    }
 
 
 class Agent:
-    def __init__(self):
+    def __init__(self, history: list | None = None, max_steps: int | None = None, conversation_id: str | None = None):
         self.openai_service = OpenAIService()
-        self.function_map = FUNCTION_MAP
-        self.function_schemas = get_schemas()
-
-        available_tools = ", ".join(self.function_map.keys())
-
-        self.system_message = {
-            "role": "system",
-            "content": (
-                f"You are a helpful, proactive AI assistant designed to support leadership and operations teams. "
-                f"You can access internal tools via function calls, such as: {available_tools}.\n\n"
-
-                "OUTPUT RULES (MANDATORY):\n"
-                "1) Always reply in plain, unformatted text only. Do NOT use Markdown, HTML, code blocks, tables, or emojis. "
-                "Do not include raw JSON or other machine-readable encodings unless explicitly requested.\n\n"
-
-                "2) Be concise and presentation-friendly. Use short paragraphs separated by single blank lines. "
-                "When listing multiple items, write them as simple numbered lines or short sentences — do NOT use bullet Markdown syntax.\n\n"
-
-                "3) For structured records (clients, team members, etc.), use this plain-text format exactly:\n\n"
-                "Name: Client Name\n"
-                "Description: Short description here.\n"
-                "Email: contact@client.com\n\n"
-                "Repeat the block above for each record, separated by a single blank line.\n\n"
-
-                "4) If a function call returns no results, reply exactly:\n"
-                "No results found.\n\n"
-                "Then offer a helpful next step or question.\n\n"
-
-                "5) ALWAYS produce a non-empty answer. If you need clarification, ask one simple clarifying question.\n\n"
-
-                "Tone: professional, supportive, and efficient."
-            )
-        }
-
-        self.messages = [self.system_message]
+        self.registry = registry
+        # Part of the job idempotency key of deferred tool calls
+        self.conversation_id = conversation_id
+        # Both replaced per turn by route_turn(): model tier (None is the service's model) and offered tools
+        self.model = None
+        self.function_schemas = registry.schemas()
+        self.max_steps = max_steps or getattr(settings, "AGENT_MAX_STEPS", 5)
+        self.history_manager = HistoryManager()
+        # Replaced per turn by start_trace(), a no-op unless AGENT_TRACING_ENABLED
+        self.trace = NULL_TRACE
+        # Replaced per turn by start_prefetch(), read tool calls started ahead of the model
+        self.prefetcher = NULL_PREFETCHER
+
+        self.system_message = get_system_message()
+
+        # History is owned by the caller (see conversation_store), the system message is always pinned first
+        self.messages = [self.system_message, *(history or [])]
+        # Messages added since, what a log store appends once the turn is over
+        self.new_messages = []
+
+    @property
+    def history(self) -> list:
+        return self.messages[1:]
 
     def reset_messages(self):
         self.messages = [self.system_message]
 
+    def append_message(self, message: dict):
+        self.messages.append(message)
+        self.new_messages.append(message)
+
     def add_user_message(self, user_input: str):
-        self.messages.append({
+        self.append_message({
             "role": "user",
             "content": user_input or "[No user message provided.]"
         })
+        # Start every turn from a history that fits the token budget
+        self.messages = self.history_manager.compact(self.messages)
+
+    def route(self, user_input: str):
+        with self.trace.span("route") as span:
+            route = route_turn(user_input, self.messages)
+            span.set(tier=route.tier, model=route.model, tools=len(route.tools), groups=",".join(route.groups))
+        self.model, self.function_schemas = route.model, route.tools
 
-    def add_function_result_message(self, function_name: str, function_result: str):
-        self.messages.append({
-            "role": "function",
-            "name": function_name,
+    def add_assistant_tool_calls_message(self, content, tool_calls: list):
+        self.append_message({
+            "role": "assistant",
+            "content": content or None,
+            "tool_calls": tool_calls,
+        })
+
+    def add_tool_result_message(self, tool_call_id: str, function_result: str):
+        self.append_message({
+            "role": "tool",
+            "tool_call_id": tool_call_id,
             "content": function_result or "[No data returned by function.]"
         })
 
     def add_assistant_reply_message(self, assistant_reply: str):
-        self.messages.append({
+        self.append_message({
             "role": "assistant",
             "content": assistant_reply or "[No reply returned.]"
         })
 
+    def run_function(self, function_name: str, arguments_str: str, call_id: str | None = None) -> str:
+        # Errors are returned as the tool result so the model can recover on the next step
+        try:
+            with self.trace.span("parse_arguments", tool=function_name):
+                arguments = json.loads(arguments_str or "{}")
+        except Exception as e:
+            error_msg = f"[Failed to parse arguments JSON: {str(e)}]"
+            logging.error(error_msg)
+            return error_msg
+
+        if function_name not in self.registry:
+            error_msg = f"[Unknown function '{function_name}']"
+            logging.error(error_msg)
+            return error_msg
+
+        try:
+            with self.trace.tool_span(function_name):
+                result = self.registry.dispatch(function_name, arguments, self.conversation_id, call_id)
+        except ValidationError as e:
+            # Rejected before the tool runs, the model gets the validation errors to fix its call
+            error_msg = f"[Invalid arguments for '{function_name}': {e.errors(include_url=False)}]"
+            logging.error(error_msg)
+            return error_msg
+        except Exception as e:
+            error_msg = f"[Error executing function '{function_name}': {str(e)}]"
+            logging.error(error_msg)
+            return error_msg
+
+        with self.trace.span("encode", tool=function_name):
+            return summarize_result(result, function_name)
+
+    def _run_function_in_worker(self, function_name: str, arguments_str: str, call_id: str | None = None) -> str:
+        try:
+            return self.run_function(function_name, arguments_str, call_id)
+        finally:
+            # Pool threads outlive the request, don't leave their DB connections behind
+            close_old_connections()
+
+    def execute_tool_calls(self, tool_calls: list) -> list:
+        # Runs all tool calls of one model turn and appends their results in order
+        with self.trace.span("tools", calls=len(tool_calls)):
+            # Calls the prefetcher already started are only waited for
+            futures = [
+                self.prefetcher.take(tool_call["function"]["name"], tool_call["function"]["arguments"])
+                for tool_call in tool_calls
+            ]
+            if len(tool_calls) == 1 and futures[0] is None:
+                function = tool_calls[0]["function"]
+                results = [self.run_function(function["name"], function["arguments"], tool_calls[0]["id"])]
+            else:
+                executor = get_tool_executor()
+                futures = [
+                    future or executor.submit(
+                        self._run_function_in_worker,
+                        tool_call["function"]["name"],
+                        tool_call["function"]["arguments"],
+                        tool_call["id"],
+                    )
+                    for tool_call, future in zip(tool_calls, futures)
+                ]
+                results = [future.result() for future in futures]
+
+        # Reads started ahead of a write made in this batch may be stale now
+        for tool_call in tool_calls:
+            name = tool_call["function"]["name"]
+            if name in self.registry and self.registry.get(name).invalidates:
+                self.prefetcher.discard(self.registry.get(name).invalidates)
+        for tool_call, result in zip(tool_calls, results):
+            self.add_tool_result_message(tool_call["id"], result)
+        return results
+
     def handle_message(self, user_input: str, reset: bool = False) -> str:
         if reset:
             logging.info("Resetting conversation history.")
             self.reset_messages()
 
-        self.add_user_message(user_input)
-        logging.debug(f"Current messages: {self.messages}")
-
-        # Call model with messages and function definitions
-        response = self.openai_service.chat_with_tools(
-            messages=self.messages,
-            functions=self.function_schemas
-        )
-        message = response.choices[0].message
-
-        logging.debug(f"Model message: {message}")
-
-        # Check if model wants to call a function
-        if hasattr(message, "function_call") and message.function_call:
-            function_call = message.function_call
-            function_name = function_call.name
-            arguments_str = function_call.arguments or "{}"
-
-            try:
-                arguments = json.loads(arguments_str)
-            except Exception as e:
-                error_msg = f"[Failed to parse arguments JSON: {str(e)}]"
-                logging.error(error_msg)
-                self.add_function_result_message(function_name, error_msg)
-                return error_msg
-
-            try:
-                result = self.function_map[function_name](**arguments)
-            except Exception as e:
-                error_msg = f"[Error executing function '{function_name}': {str(e)}]"
-                logging.error(error_msg)
-                self.add_function_result_message(function_name, error_msg)
-                return error_msg
-
-            formatted_result = summarize_result(result)
-            self.add_function_result_message(function_name, formatted_result)
-
-            # Sending updated messages with function response back for final assistant reply
-            final_response = self.openai_service.chat_with_tools(
-                messages=self.messages,
-                functions=self.function_schemas
-            )
-            final_message = final_response.choices[0].message
-            final_content = final_message.content or "[No reply returned.]"
-            self.add_assistant_reply_message(final_content)
-            return final_content
-
-        # No function call, just assistant reply
-        assistant_reply = message.content or "[No reply returned.]"
-        self.add_assistant_reply_message(assistant_reply)
-        return assistant_reply
+        self.trace = start_trace("chat")
+        try:
+            with self.trace.span("compact_history"):
+                self.add_user_message(user_input)
+            logging.debug(f"Current messages: {self.messages}")
+            self.route(user_input)
+            self.prefetcher = start_prefetch(self, get_tool_executor())
+            self.prefetcher.start_from_input(user_input)
+
+            for step in range(self.max_steps + 1):
+                # Once the step budget is spent, the model has to answer with what it has
+                tool_choice = "none" if step == self.max_steps else None
+                with self.trace.model_span(self.messages, step) as span:
+                    response = self.openai_service.chat_with_tools(
+                        messages=self.messages,
+                        tools=self.function_schemas,
+                        tool_choice=tool_choice,
+                        model=self.model,
+                    )
+                    span.set_usage(response.usage)
+                message = response.choices[0].message
+                logging.debug(f"Model message: {message}")
+
+                if not message.tool_calls:
+                    assistant_reply = message.content or "[No reply returned.]"
+                    self.add_assistant_reply_message(assistant_reply)
+                    return assistant_reply
+
+                tool_calls = tool_calls_to_dicts(message.tool_calls)
+                self.add_assistant_tool_calls_message(message.content, tool_calls)
+                self.execute_tool_calls(tool_calls)
+
+            # Only reachable if the model ignored tool_choice="none"
+            assistant_reply = "[No reply returned.]"
+            self.add_assistant_reply_message(assistant_reply)
+            return assistant_reply
+        finally:
+            self.prefetcher.finish()
+            self.trace.finish()
 
     def stream_message(self, user_input: str, reset: bool = False):
+        # Yields (event, data) pairs: ("token", text), ("tool_start", ...), ("tool_result", ...), ("error", ...)
         if reset:
             self.reset_messages()
-        self.add_user_message(user_input)
-
-        assistant_accum = ""
-
+        self.trace = start_trace("stream")
+        with self.trace.span("compact_history"):
+            self.add_user_message(user_input)
+        self.route(user_input)
+        self.prefetcher = start_prefetch(self, get_tool_executor())
+        self.prefetcher.start_from_input(user_input)
+
+        accumulator = None
         try:
-            # LLM may generate text or decide to function_call
-            for chunk in self.openai_service.stream_chat(
-                    messages=self.messages,
-                    functions=self.function_schemas
-            ):
-                try:
-                    choice = chunk.choices[0]
-                except Exception:
-                    continue
-
-                # Check for content
-                delta = getattr(choice, "delta", None)
-                if delta is None and isinstance(choice, dict):
-                    delta = choice.get("delta")
-
-                content = None
-                if delta is not None:
-                    content = getattr(delta, "content", None)
-                    if content is None and isinstance(delta, dict):
-                        content = delta.get("content")
-
-                if content:
-                    assistant_accum += content
-                    yield content
-                    continue
-
-                # If no content, check finish_reason
-                finish_reason = getattr(choice, "finish_reason", None)
-                if finish_reason is None and isinstance(choice, dict):
-                    finish_reason = choice.get("finish_reason")
-
-                # If function_call, break to handle it
-                if finish_reason == "function_call":
-                    # Stop the first stream then fetch the function_call non-streaming
-                    break
-
-            if assistant_accum:
-                # Verify if a function_call was triggered by calling a non-streaming check
-                response_check = self.openai_service.chat_with_tools(
-                    messages=self.messages, functions=self.function_schemas
-                )
-                message_check = response_check.choices[0].message
-                if not (hasattr(message_check, "function_call") and message_check.function_call):
-                    # No function_call means it's safe to store assistant_accum as final assistant message.
-                    self.add_assistant_reply_message(assistant_accum)
+            for step in range(self.max_steps + 1):
+                tool_choice = "none" if step == self.max_steps else None
+                # The model may generate text or tool calls, the stream itself tells us which
+                accumulator = StreamAccumulator()
+                span = self.trace.stream_span(self.messages, step)
+                for chunk in self.openai_service.stream_chat(
+                        messages=self.messages,
+                        tools=self.function_schemas,
+                        tool_choice=tool_choice,
+                        model=self.model,
+                ):
+                    content = accumulator.add(chunk)
+                    self.prefetcher.start_from_stream(accumulator)
+                    if content:
+                        span.before_yield()
+                        yield "token", content
+                        span.after_yield()
+                span.finish(accumulator.usage)
+
+                tool_calls = accumulator.get_tool_calls()
+                if not tool_calls:
+                    if accumulator.content:
+                        self.add_assistant_reply_message(accumulator.content)
                     return  # Streaming complete
 
-            # function_call was triggered
-            response = self.openai_service.chat_with_tools(
-                messages=self.messages,
-                functions=self.function_schemas
-            )
-            message = response.choices[0].message
-
-            if not (hasattr(message, "function_call") and message.function_call):
-                # If no function_call, return what we have
-                if assistant_accum:
-                    self.add_assistant_reply_message(assistant_accum)
-                return
-
-            function_call = message.function_call
-            function_name = function_call.name
-            arguments_str = function_call.arguments or "{}"
-
-            # Parse arguments
-            try:
-                arguments = json.loads(arguments_str)
-            except Exception as e:
-                err = f"[Failed to parse function arguments: {str(e)}]"
-                # Yield an error so frontend sees it streamed
-                yield err
-                # Also append error function result in history
-                self.add_function_result_message(function_name, err)
-                return
-
-            # Execute the function
-            try:
-                result = self.function_map[function_name](**arguments)
-            except Exception as e:
-                err = f"[Error executing function '{function_name}': {str(e)}]"
-                yield err
-                self.add_function_result_message(function_name, err)
-                return
-
-            formatted_result = summarize_result(result)
-            self.add_function_result_message(function_name, formatted_result)
-
-            # Now that the function result is in messages, stream the final assistant reply
-            # Start a new streaming call so the final assistant message comes back token-by-token
-            final_accum = ""
-            for chunk in self.openai_service.stream_chat(
-                    messages=self.messages,
-                    functions=self.function_schemas
-            ):
-                try:
-                    choice = chunk.choices[0]
-                except Exception:
-                    continue
-
-                delta = getattr(choice, "delta", None)
-                if delta is None and isinstance(choice, dict):
-                    delta = choice.get("delta")
-
-                content = None
-                if delta is not None:
-                    content = getattr(delta, "content", None)
-                    if content is None and isinstance(delta, dict):
-                        content = delta.get("content")
-
-                if content:
-                    final_accum += content
-                    yield content
-                    continue
-
-            # After streaming final reply, append it to the message history
-            if final_accum:
-                self.add_assistant_reply_message(final_accum)
+                self.add_assistant_tool_calls_message(accumulator.content, tool_calls)
+                yield tool_start_event(tool_calls)
+                results = self.execute_tool_calls(tool_calls)
+                yield from tool_result_events(tool_calls, results)
 
+        except GeneratorExit:
+            # Closed early (stream abandoned), keep whatever was already streamed
+            if accumulator and accumulator.content and not accumulator.tool_calls:
+                self.add_assistant_reply_message(accumulator.content)
+            raise
         except Exception as e:
             # Stream an error message
             err_msg = f"[Streaming error: {str(e)}]"
             logging.exception(err_msg)
-            yield err_msg
-            return
\ No newline at end of file
+            yield "error", {"message": err_msg}
+            return
+        finally:
+            self.prefetcher.finish()
+            self.trace.finish()
+
+    async def astream_message(self, user_input: str, reset: bool = False):
+        # Async twin of stream_message for ASGI. No thread is held while waiting on the model,
+        # only the (blocking) tool calls run in worker threads.
+        if reset:
+            self.reset_messages()
+        self.trace = start_trace("astream")
+        with self.trace.span("compact_history"):
+            self.add_user_message(user_input)
+        self.route(user_input)
+        self.prefetcher = start_prefetch(self, get_tool_executor())
+        self.prefetcher.start_from_input(user_input)
+
+        accumulator = StreamAccumulator()
+        try:
+            for step in range(self.max_steps + 1):
+                tool_choice = "none" if step == self.max_steps else None
+                accumulator = StreamAccumulator()
+                span = self.trace.stream_span(self.messages, step)
+                async with aclosing(self.openai_service.astream_chat(
+                        messages=self.messages,
+                        tools=self.function_schemas,
+                        tool_choice=tool_choice,
+                        model=self.model,
+                )) as stream:
+                    async for chunk in stream:
+                        content = accumulator.add(chunk)
+                        self.prefetcher.start_from_stream(accumulator)
+                        if content:
+                            span.before_yield()
+                            yield "token", content
+                            span.after_yield()
+                span.finish(accumulator.usage)
+
+                tool_calls = accumulator.get_tool_calls()
+                if not tool_calls:
+                    if accumulator.content:
+                        self.add_assistant_reply_message(accumulator.content)
+                    return
+
+                self.add_assistant_tool_calls_message(accumulator.content, tool_calls)
+                yield tool_start_event(tool_calls)
+                results = await sync_to_async(self.execute_tool_calls)(tool_calls)
+                for event in tool_result_events(tool_calls, results):
+                    yield event
+
+        except (asyncio.CancelledError, GeneratorExit):
+            # Cancelled or closed early, keep whatever was already streamed and stop talking to the model
+            if accumulator.content and not accumulator.tool_calls:
+                self.add_assistant_reply_message(accumulator.content)
+            raise
+        except Exception as e:
+            err_msg = f"[Streaming error: {str(e)}]"
+            logging.exception(err_msg)
+            yield "error", {"message": err_msg}
+            return
+        finally:
+            self.prefetcher.finish()
+            self.trace.finish()
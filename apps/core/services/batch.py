@@ -0,0 +1,36 @@
+from collections import Counter
+
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+
+# Statuses of items that were written, everything else is reported first
+SUCCESS_STATUSES = ("created", "updated", "deleted")
+
+
+def check_emails(emails: list) -> list:
+    # One entry per email: None if the item can be written, else the status explaining why it is skipped
+    problems, seen = [], set()
+    for email in emails:
+        if email in seen:
+            problems.append("duplicate in batch")
+            continue
+        seen.add(email)
+        try:
+            validate_email(email)
+        except ValidationError:
+            problems.append("invalid email")
+            continue
+        problems.append(None)
+    return problems
+
+
+def batch_result(statuses: list) -> dict:
+    # statuses: (email, status) per input item. One row per item, failures first so they are never
+    # the rows cut by the result encoder, and a one-line summary of the counts.
+    counts = Counter(status for _, status in statuses)
+    failed = [(email, status) for email, status in statuses if status not in SUCCESS_STATUSES]
+    succeeded = [(email, status) for email, status in statuses if status in SUCCESS_STATUSES]
+    return {
+        "items": [{"email": email, "status": status} for email, status in failed + succeeded],
+        "summary": ", ".join(f"{count} {status}" for status, count in counts.items()),
+    }
@@ -0,0 +1,239 @@
+import hashlib
+import json
+import math
+import re
+import threading
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+from apps.core.services.lru import LRUCache
+from apps.core.services.registry import registry
+from apps.core.services.tool_cache import get_tool_cache
+
+EMBEDDING_DIMENSIONS = 256
+# Most recent prompts remembered per conversation context for the similarity tier
+SIMILARITY_CANDIDATES = 50
+# Words that may differ between two prompts treated as the same question
+STOPWORDS = {
+    "a", "all", "an", "any", "are", "can", "could", "do", "for", "give", "me", "my", "of", "our",
+    "please", "show", "tell", "the", "us", "what", "which", "who", "would", "you",
+}
+
+
+def collapse_whitespace(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def normalize_text(text: str) -> str:
+    # Similarity tier only, the exact tier keeps case ("email Bob" and "email bob" can mean different args)
+    return collapse_whitespace(text).casefold()
+
+
+def normalize_messages(messages: list) -> list:
+    # Exact tier: only whitespace in user text is normalized, assistant and tool content must match exactly
+    normalized = []
+    for message in messages:
+        if message["role"] == "user" and isinstance(message.get("content"), str):
+            message = {**message, "content": collapse_whitespace(message["content"])}
+        normalized.append(message)
+    return normalized
+
+
+def embed(text: str) -> list:
+    # Local, dependency-free embedding: hashed character trigrams, L2-normalized.
+    # Catches rewordings like "list all clients in Brazil" / "list all the clients in brazil?".
+    vector = [0.0] * EMBEDDING_DIMENSIONS
+    text = f"  {normalize_text(text)}  "
+    for i in range(len(text) - 2):
+        digest = hashlib.md5(text[i:i + 3].encode()).digest()
+        vector[int.from_bytes(digest[:4], "little") % EMBEDDING_DIMENSIONS] += 1.0
+    norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+    return [value / norm for value in vector]
+
+
+def content_words(text: str) -> list:
+    # Similar is not enough ("clients in Chile" vs "clients in Brazil"), the meaningful words must match
+    return sorted(set(re.findall(r"[\w@.+-]+", normalize_text(text).rstrip("?!. "))) - STOPWORDS)
+
+
+def cosine(a: list, b: list) -> float:
+    return sum(x * y for x, y in zip(a, b))
+
+
+def called_tools(value) -> set:
+    # Tool names in a stored completion (dumped ChatCompletion) or recorded stream (dumped chunks)
+    if isinstance(value, dict):
+        messages = [choice["message"] for choice in value.get("choices") or []]
+    else:
+        messages = [choice["delta"] for chunk in value for choice in chunk.get("choices") or []]
+    return {
+        call["function"]["name"]
+        for message in messages
+        for call in message.get("tool_calls") or []
+        if (call.get("function") or {}).get("name")
+    }
+
+
+def writes(value) -> bool:
+    # Calls a tool that changes data or sends something: only ever replayed for the exact same prompt
+    return any(
+        name not in registry or registry.get(name).invalidates or registry.get(name).deferred
+        for name in called_tools(value)
+    )
+
+
+class CompletionCache:
+    # Cache in front of the model calls in OpenAIService.
+    # Exact tier: hash of (model, normalized messages, tool schema version, tool_choice, data generations).
+    # Optional similarity tier: same conversation context, last user message close enough (cosine),
+    # never for completions that call write or deferred tools.
+    # Data generations come from the tool cache, so any Client/TeamMember change invalidates every entry.
+    def __init__(self, similarity_threshold: float | None = None):
+        self.similarity_threshold = similarity_threshold
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    def _get(self, key: str):
+        raise NotImplementedError
+
+    def _set(self, key: str, value):
+        raise NotImplementedError
+
+    def _hash(self, payload) -> str:
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+    def _context(self, model, tools, tool_choice) -> dict:
+        tool_cache = get_tool_cache()
+        return {
+            "model": model,
+            "schema_version": registry.schema_version(),
+            "tools": sorted(tool["function"]["name"] for tool in tools or []),
+            "tool_choice": tool_choice,
+            "data": {tag: tool_cache.get_generation(tag) for tag in registry.cache_tags()},
+        }
+
+    def make_keys(self, model, messages, tools, tool_choice, stream: bool):
+        # Returns (exact key, similarity context key or None)
+        context = {**self._context(model, tools, tool_choice), "stream": stream}
+        normalized = normalize_messages(messages)
+        exact_key = "completion:" + self._hash({**context, "messages": normalized})
+
+        similarity_key = None
+        if self.similarity_threshold and messages and messages[-1]["role"] == "user":
+            similarity_key = "similar:" + self._hash({**context, "messages": normalized[:-1]})
+        return exact_key, similarity_key
+
+    def lookup(self, model, messages, tools, tool_choice, stream: bool = False):
+        exact_key, similarity_key = self.make_keys(model, messages, tools, tool_choice, stream)
+        value = self._get(exact_key)
+        if value is not None:
+            self._count("hits")
+            return value
+
+        if similarity_key:
+            text = messages[-1].get("content") or ""
+            vector, words = embed(text), content_words(text)
+            best_score, best_key = 0.0, None
+            for candidate_vector, candidate_words, candidate_key in self._get(similarity_key) or []:
+                if candidate_words != words:
+                    continue
+                score = cosine(vector, candidate_vector)
+                if score > best_score:
+                    best_score, best_key = score, candidate_key
+            if best_key and best_score >= self.similarity_threshold:
+                value = self._get(best_key)
+                if value is not None:
+                    self._count("similar_hits")
+                    return value
+
+        self._count("misses")
+        return None
+
+    def store(self, model, messages, tools, tool_choice, value, stream: bool = False):
+        exact_key, similarity_key = self.make_keys(model, messages, tools, tool_choice, stream)
+        self._set(exact_key, value)
+
+        if similarity_key and not writes(value):
+            candidates = self._get(similarity_key) or []
+            text = messages[-1].get("content") or ""
+            candidates = [(embed(text), content_words(text), exact_key), *candidates]
+            self._set(similarity_key, candidates[:SIMILARITY_CANDIDATES])
+
+    def get_completion(self, model, messages, tools, tool_choice):
+        value = self.lookup(model, messages, tools, tool_choice)
+        return ChatCompletion.model_validate(value) if value is not None else None
+
+    def set_completion(self, model, messages, tools, tool_choice, response):
+        self.store(model, messages, tools, tool_choice, response.model_dump(mode="json"))
+
+    def get_stream(self, model, messages, tools, tool_choice):
+        # Recorded chunks, replayed through the normal streaming path (same SSE frames for the frontend)
+        value = self.lookup(model, messages, tools, tool_choice, stream=True)
+        return [ChatCompletionChunk.model_validate(chunk) for chunk in value] if value is not None else None
+
+    def set_stream(self, model, messages, tools, tool_choice, chunks):
+        self.store(
+            model, messages, tools, tool_choice,
+            [chunk.model_dump(mode="json") for chunk in chunks],
+            stream=True,
+        )
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.similar_hits + self.misses
+        return {
+            "hits": self.hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.similar_hits) / lookups if lookups else 0.0,
+        }
+
+    def _count(self, counter: str):
+        with self._stats_lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+
+class LocalCompletionCache(CompletionCache):
+    def __init__(self, max_entries: int = 1024, ttl: float | None = 600, similarity_threshold: float | None = None):
+        super().__init__(similarity_threshold=similarity_threshold)
+        self.cache = LRUCache(maxsize=max_entries, ttl=ttl)
+
+    def _get(self, key: str):
+        return self.cache.get(key)
+
+    def _set(self, key: str, value):
+        self.cache.set(key, value)
+
+
+class DjangoCompletionCache(CompletionCache):
+    # Backed by a Django cache alias, shared by every worker using the same cache
+    def __init__(
+        self,
+        alias: str = "default",
+        ttl: float | None = 600,
+        key_prefix: str = "agentc",
+        similarity_threshold: float | None = None,
+    ):
+        super().__init__(similarity_threshold=similarity_threshold)
+        self.alias = alias
+        self.ttl = ttl
+        self.key_prefix = key_prefix
+
+    def _get(self, key: str):
+        return caches[self.alias].get(f"{self.key_prefix}:{key}")
+
+    def _set(self, key: str, value):
+        caches[self.alias].set(f"{self.key_prefix}:{key}", value, timeout=self.ttl)
+
+
+@lru_cache(maxsize=None)
+def get_completion_cache() -> CompletionCache | None:
+    config = getattr(settings, "COMPLETION_CACHE", None)
+    if not config:
+        return None
+    return import_string(config["BACKEND"])(**config.get("OPTIONS", {}))
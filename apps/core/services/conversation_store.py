@@ -0,0 +1,307 @@
+import atexit
+import json
+import logging
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from apps.core.services.history import from_turn_start
+from apps.core.services.lru import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# Turns older than the loaded window reach the model as one system message starting with this
+SUMMARY_PREFIX = "Summary of the earlier conversation:"
+# Characters kept per folded message
+SUMMARY_MESSAGE_CHARS = 300
+
+
+def is_summary(message: dict) -> bool:
+    return message["role"] == "system" and (message.get("content") or "").startswith(SUMMARY_PREFIX)
+
+
+def summarize_messages(summary: str, messages: list, max_chars: int) -> str:
+    # Extractive, no model call: what the user asked and what the assistant answered, tool traffic
+    # left out. The oldest lines go first once the summary is over max_chars.
+    lines = summary.splitlines() if summary else []
+    for message in messages:
+        content = (message.get("content") or "").strip()
+        if message["role"] not in ("user", "assistant") or not content:
+            continue
+        content = " ".join(content.split())
+        if len(content) > SUMMARY_MESSAGE_CHARS:
+            content = content[:SUMMARY_MESSAGE_CHARS] + "..."
+        lines.append(f"{message['role'].capitalize()}: {content}")
+    while lines and sum(len(line) + 1 for line in lines) > max_chars:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+class ConversationStore:
+    # Base class for conversation history backends.
+    # History never includes the system message, the Agent pins that itself.
+    def load(self, conversation_id: str) -> list:
+        raise NotImplementedError
+
+    def save(self, conversation_id: str, messages: list):
+        raise NotImplementedError
+
+    def append(self, conversation_id: str, history: list, new_messages: list):
+        # Records a finished turn: `history` is the agent's whole (compacted) history, `new_messages`
+        # the messages the turn added. Snapshot stores keep the history, log stores append the new ones.
+        self.save(conversation_id, history)
+
+    def clear(self, conversation_id: str):
+        raise NotImplementedError
+
+    def flush(self):
+        # Writes what write-behind stores still hold in memory
+        pass
+
+
+class MemoryConversationStore(ConversationStore):
+    # In-process store, least recently used conversations are evicted first
+    def __init__(self, max_conversations: int = 1000, ttl: float | None = 3600):
+        self.cache = LRUCache(maxsize=max_conversations, ttl=ttl)
+
+    def load(self, conversation_id: str) -> list:
+        # Copy so concurrent turns never append to the same list object
+        return list(self.cache.get(conversation_id, []))
+
+    def save(self, conversation_id: str, messages: list):
+        self.cache.set(conversation_id, list(messages))
+
+    def clear(self, conversation_id: str):
+        self.cache.delete(conversation_id)
+
+
+class DatabaseConversationStore(ConversationStore):
+    # Conversation log in the Django database (Conversation and Message models), any worker can serve
+    # any turn. Appends are write-behind: queued in memory and written in batches by a background thread
+    # every flush_interval seconds (at once past batch_size queued messages), so another worker sees a
+    # turn at most flush_interval later, flush_interval=0 writes every turn before it returns (several
+    # workers behind a load balancer without session affinity). A load only reads the stored summary and the recent window,
+    # older messages are folded into the summary when written: neither memory nor load time grow with
+    # the number or the length of conversations.
+    def __init__(self, window_messages: int = 50, summary_chars: int = 4000, flush_interval: float = 0.25,
+                 batch_size: int = 500):
+        self.window_messages = window_messages
+        self.summary_chars = summary_chars
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        # conversation_id -> messages not written yet, and the batch being written right now
+        self.pending = {}
+        self.flushing = {}
+        self.flushes = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        atexit.register(self.flush)
+
+    def load(self, conversation_id: str) -> list:
+        while True:
+            with self._lock:
+                queued = [*self.flushing.get(conversation_id, []), *self.pending.get(conversation_id, [])]
+                flushes = self.flushes
+            messages = self._load_written(conversation_id)
+            with self._lock:
+                # Unless a batch was written meanwhile (it would be missing from both), retry then
+                if self.flushes == flushes:
+                    return messages + queued
+
+    def _load_written(self, conversation_id: str) -> list:
+        from apps.core.models import Conversation, Message
+
+        conversation = (
+            Conversation.objects
+            .filter(key=conversation_id)
+            .values("id", "summary", "summary_sequence")
+            .first()
+        )
+        if conversation is None:
+            return []
+        recent = (
+            Message.objects
+            .filter(conversation_id=conversation["id"], sequence__gt=conversation["summary_sequence"])
+            .order_by("-sequence")
+            .values_list("data", flat=True)[:self.window_messages]
+        )
+        messages = from_turn_start(list(reversed(recent)))
+        if conversation["summary"]:
+            messages.insert(0, {"role": "system", "content": f"{SUMMARY_PREFIX}\n{conversation['summary']}"})
+        return messages
+
+    def append(self, conversation_id: str, history: list, new_messages: list):
+        if not new_messages:
+            return
+        with self._lock:
+            # The summary message is rebuilt on load, never logged
+            self.pending.setdefault(conversation_id, []).extend(
+                message for message in new_messages if not is_summary(message)
+            )
+            queued = sum(len(messages) for messages in self.pending.values())
+            if self.flush_interval and self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="conversation-flush", daemon=True)
+                self._thread.start()
+        if not self.flush_interval:
+            self.flush()
+        elif queued >= self.batch_size:
+            self._wakeup.set()
+
+    def save(self, conversation_id: str, messages: list):
+        # Replaces the whole log
+        self.clear(conversation_id)
+        self.append(conversation_id, messages, messages)
+
+    def clear(self, conversation_id: str):
+        from apps.core.models import Conversation
+
+        # Waits for a running flush, which could otherwise write the conversation again
+        with self._flush_lock:
+            with self._lock:
+                self.pending.pop(conversation_id, None)
+            Conversation.objects.filter(key=conversation_id).delete()
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                batch, self.pending = self.pending, {}
+                self.flushing = batch
+            if not batch:
+                return
+            try:
+                self._write(batch)
+            except Exception:
+                logger.exception("Writing %s conversations failed, retrying on the next flush", len(batch))
+                with self._lock:
+                    for conversation_id, messages in batch.items():
+                        self.pending[conversation_id] = messages + self.pending.get(conversation_id, [])
+            finally:
+                with self._lock:
+                    self.flushing = {}
+                    self.flushes += 1
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            finally:
+                close_old_connections()
+
+    def _write(self, batch: dict):
+        from apps.core.models import Conversation, Message
+
+        now = timezone.now()
+        with transaction.atomic():
+            Conversation.objects.bulk_create(
+                [Conversation(key=conversation_id) for conversation_id in batch], ignore_conflicts=True,
+            )
+            # Locked (PostgreSQL) so concurrent writers from other workers number messages one after the other
+            conversations = Conversation.objects.select_for_update().filter(key__in=batch).in_bulk(field_name="key")
+            rows = []
+            for conversation_id, messages in batch.items():
+                conversation = conversations[conversation_id]
+                rows.extend(
+                    Message(conversation=conversation, sequence=conversation.last_sequence + offset,
+                            role=message["role"], data=message)
+                    for offset, message in enumerate(messages, start=1)
+                )
+                conversation.last_sequence += len(messages)
+                conversation.updated_at = now
+            Message.objects.bulk_create(rows, batch_size=self.batch_size)
+            for conversation in conversations.values():
+                self._fold(conversation)
+            Conversation.objects.bulk_update(
+                conversations.values(), ["last_sequence", "summary", "summary_sequence", "updated_at"],
+            )
+
+    def _fold(self, conversation):
+        # Moves the turns before the window into the summary
+        from apps.core.models import Message
+
+        if conversation.last_sequence - conversation.summary_sequence <= self.window_messages:
+            return
+        window_start = (
+            Message.objects
+            .filter(conversation=conversation, role="user",
+                    sequence__gt=conversation.last_sequence - self.window_messages)
+            .order_by("sequence")
+            .values_list("sequence", flat=True)
+            .first()
+        )
+        if window_start is None:
+            # A single turn longer than the window, nothing can be folded yet
+            return
+        folded = (
+            Message.objects
+            .filter(conversation=conversation, sequence__gt=conversation.summary_sequence,
+                    sequence__lt=window_start)
+            .order_by("sequence")
+            .values_list("data", flat=True)
+        )
+        conversation.summary = summarize_messages(conversation.summary, list(folded), self.summary_chars)
+        conversation.summary_sequence = window_start - 1
+
+
+class SQLiteConversationStore(ConversationStore):
+    # Standalone SQLite file, independent from the Django database
+    def __init__(self, path=None, ttl: float | None = None):
+        self.path = str(path or settings.BASE_DIR / "conversations.sqlite3")
+        self.ttl = ttl
+        self._local = threading.local()
+
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS conversations ("
+                "key TEXT PRIMARY KEY, messages TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        # sqlite3 connections can't be shared between threads, keep one per thread
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=10)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    def load(self, conversation_id: str) -> list:
+        row = self._connect().execute(
+            "SELECT messages, updated_at FROM conversations WHERE key = ?",
+            (conversation_id,),
+        ).fetchone()
+        if row is None:
+            return []
+        messages, updated_at = row
+        if self.ttl and updated_at + self.ttl <= time.time():
+            self.clear(conversation_id)
+            return []
+        return json.loads(messages)
+
+    def save(self, conversation_id: str, messages: list):
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT INTO conversations (key, messages, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET messages = excluded.messages, updated_at = excluded.updated_at",
+                (conversation_id, json.dumps(messages), time.time()),
+            )
+
+    def clear(self, conversation_id: str):
+        with self._connect() as connection:
+            connection.execute("DELETE FROM conversations WHERE key = ?", (conversation_id,))
+
+
+@lru_cache(maxsize=None)
+def get_conversation_store() -> ConversationStore:
+    config = getattr(settings, "CONVERSATION_STORE", {})
+    backend = config.get("BACKEND", "apps.core.services.conversation_store.MemoryConversationStore")
+    return import_string(backend)(**config.get("OPTIONS", {}))
@@ -0,0 +1,112 @@
+import json
+from functools import lru_cache
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from apps.core.services.pagination import ROW_CURSORS
+
+EMPTY_RESULT = "No entries found."
+
+
+class ResultEncoder:
+    # Turns a tool result into the text the model reads in the tool message
+    def encode(self, result, function_name: str | None = None) -> str:
+        raise NotImplementedError
+
+
+class JSONResultEncoder(ResultEncoder):
+    # Original format: one indented JSON document per item
+    def encode(self, result, function_name: str | None = None) -> str:
+        if isinstance(result, list):
+            if not result:
+                return EMPTY_RESULT
+            return "\n\n".join(f"- {json.dumps(item, indent=2)}" for item in result)
+        if isinstance(result, dict):
+            if not result:
+                return EMPTY_RESULT
+            return json.dumps({key: value for key, value in result.items() if key != ROW_CURSORS}, indent=2)
+        return str(result) if result else EMPTY_RESULT
+
+
+def format_cell(value) -> str:
+    if value is None:
+        return ""
+    return str(value).replace("\n", " ").replace("|", "/")
+
+
+class TableResultEncoder(ResultEncoder):
+    # Columnar form: header once, then one "|"-separated line per row.
+    # Rows stop at max_rows or when the function's character budget is spent,
+    # the rest is replaced by a "N more rows omitted" marker. Other results are cut at the
+    # budget with a "N more characters omitted" marker.
+    def __init__(self, max_rows: int = 100, max_chars: int = 6000, function_budgets: dict | None = None):
+        self.max_rows = max_rows
+        self.max_chars = max_chars
+        self.function_budgets = function_budgets or {}
+
+    def encode(self, result, function_name: str | None = None) -> str:
+        budget = self.function_budgets.get(function_name, self.max_chars)
+
+        if isinstance(result, dict) and isinstance(result.get("items"), list):
+            # Paginated result: table of items, then the remaining keys (next_cursor, ...)
+            extra = {key: value for key, value in result.items() if key not in ("items", ROW_CURSORS)}
+            cursors = result.get(ROW_CURSORS)
+            table, shown = self.table(result["items"], budget, continued=bool(cursors))
+            if cursors and 0 < shown < len(result["items"]):
+                # The rows cut here are the start of the next page, not skipped
+                extra["next_cursor"] = cursors[shown - 1]
+            lines = [table]
+            lines += [f"{key}: {format_cell(value)}" for key, value in extra.items() if value is not None]
+            return "\n".join(lines)
+        if isinstance(result, list):
+            return self.encode_rows(result, budget)
+        if isinstance(result, dict):
+            if not result:
+                return EMPTY_RESULT
+            return self.clip("\n".join(f"{key}: {format_cell(value)}" for key, value in result.items()), budget)
+        return self.clip(str(result), budget) if result else EMPTY_RESULT
+
+    def clip(self, text: str, budget: int) -> str:
+        if len(text) <= budget:
+            return text
+        return f"{text[:budget]}\n({len(text) - budget} more characters omitted)"
+
+    def encode_rows(self, rows: list, budget: int) -> str:
+        return self.table(rows, budget)[0]
+
+    def table(self, rows: list, budget: int, continued: bool = False) -> tuple:
+        # (text, rows shown), continued: the omitted rows are reachable through next_cursor
+        if not rows:
+            return EMPTY_RESULT, 0
+
+        if all(isinstance(row, dict) for row in rows):
+            columns = list(dict.fromkeys(key for row in rows for key in row))
+            lines = [" | ".join(columns)]
+            values = ([row.get(column) for column in columns] for row in rows)
+        else:
+            lines = []
+            values = ([row] for row in rows)
+
+        size = sum(len(line) + 1 for line in lines)
+        shown = 0
+        for row in values:
+            line = " | ".join(format_cell(value) for value in row)
+            if shown >= self.max_rows or size + len(line) + 1 > budget:
+                break
+            lines.append(line)
+            size += len(line) + 1
+            shown += 1
+
+        if shown < len(rows) and continued and shown:
+            lines.append(f"({len(rows) - shown} more rows on the next page, pass next_cursor as cursor)")
+        elif shown < len(rows):
+            lines.append(f"({len(rows) - shown} more rows omitted, ask for fewer rows or fields to see them)")
+        return "\n".join(lines), shown
+
+
+@lru_cache(maxsize=None)
+def get_result_encoder() -> ResultEncoder:
+    config = getattr(settings, "AGENT_RESULT_ENCODER", {})
+    backend = config.get("BACKEND", "apps.core.services.encoders.TableResultEncoder")
+    return import_string(backend)(**config.get("OPTIONS", {}))
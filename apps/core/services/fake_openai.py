@@ -0,0 +1,197 @@
+import json
+import random
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-in for the OpenAI chat completions API, used by the bench command and for offline runs.
+# Point the app at it with OPENAI_BASE_URL=http://127.0.0.1:<port>/v1
+
+SCENARIOS = ["text", "tool", "multi_tool", "list", "write"]
+
+
+@dataclass
+class FakeScript:
+    # text: plain reply. tool: one get_client call, then a reply.
+    # multi_tool: tool_calls parallel get_client calls, then a reply. list: list_clients, then a reply.
+    # write: tool_calls parallel writes (update_client on an existing email / add_client), then a reply.
+    scenario: str = "text"
+    reply_tokens: int = 40
+    first_token_latency: float = 0.3
+    token_latency: float = 0.01
+    tool_calls: int = 5
+    emails: list = field(default_factory=lambda: ["client0@example.com"])
+    # The first rate_limited requests get a 429 with this Retry-After (seconds), like an exhausted quota
+    rate_limited: int = 0
+    retry_after: float = 1.0
+
+    def next_message(self, messages: list, tools: list | None = None) -> dict:
+        words = [f"word{i}" for i in range(self.reply_tokens)]
+        reply = {"content": " ".join(words), "tool_calls": None}
+        if self.scenario == "text" or messages[-1]["role"] == "tool":
+            return reply
+
+        if self.scenario == "list":
+            calls = [("list_clients", {"limit": 50})]
+        elif self.scenario == "write":
+            calls = [
+                ("update_client", {"email": random.choice(self.emails), "description": uuid.uuid4().hex[:12]})
+                if i % 2 == 0 else
+                ("add_client", {"name": "Bench", "description": "bench", "email": f"{uuid.uuid4().hex}@example.com"})
+                for i in range(self.tool_calls)
+            ]
+        elif self.scenario == "multi_tool":
+            calls = [
+                ("get_client", {"email": self.emails[i % len(self.emails)]})
+                for i in range(self.tool_calls)
+            ]
+        else:
+            calls = [("get_client", {"email": self.emails[0]})]
+
+        # Like the real API, only tools that were offered get called
+        offered = {tool["function"]["name"] for tool in tools or []}
+        if any(name not in offered for name, _ in calls):
+            return reply
+
+        return {
+            "content": None,
+            "tool_calls": [{
+                "id": f"call_{uuid.uuid4().hex[:12]}",
+                "type": "function",
+                "function": {"name": name, "arguments": json.dumps(arguments)},
+            } for name, arguments in calls],
+        }
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        script = self.server.script
+        if self.server.count_request() <= script.rate_limited:
+            self.send_rate_limited(script)
+            return
+        message = script.next_message(body.get("messages") or [{"role": "user"}], body.get("tools"))
+
+        if body.get("stream"):
+            self.send_stream(script, body.get("model", "fake"), message)
+        else:
+            self.send_completion(script, body.get("model", "fake"), message)
+
+    def send_rate_limited(self, script):
+        payload = json.dumps({"error": {
+            "message": "Rate limit reached, please retry later.",
+            "type": "requests",
+            "code": "rate_limit_exceeded",
+        }}).encode()
+        self.send_response(429)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.send_header("Retry-After", str(script.retry_after))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def send_completion(self, script, model, message):
+        tokens = script.reply_tokens if message["content"] else 0
+        time.sleep(script.first_token_latency + tokens * script.token_latency)
+
+        payload = json.dumps({
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", **message},
+                "finish_reason": "tool_calls" if message["tool_calls"] else "stop",
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": tokens, "total_tokens": tokens},
+        }).encode()
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def send_stream(self, script, model, message):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+
+        def send_delta(delta, finish_reason=None):
+            chunk = json.dumps({
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            })
+            self.write_chunk(f"data: {chunk}\n\n".encode())
+
+        time.sleep(script.first_token_latency)
+        send_delta({"role": "assistant", "content": ""})
+
+        if message["tool_calls"]:
+            for index, tool_call in enumerate(message["tool_calls"]):
+                arguments = tool_call["function"]["arguments"]
+                half = len(arguments) // 2
+                send_delta({"tool_calls": [{
+                    "index": index,
+                    "id": tool_call["id"],
+                    "type": "function",
+                    "function": {"name": tool_call["function"]["name"], "arguments": arguments[:half]},
+                }]})
+                time.sleep(script.token_latency)
+                send_delta({"tool_calls": [{"index": index, "function": {"arguments": arguments[half:]}}]})
+            send_delta({}, "tool_calls")
+        else:
+            for word in message["content"].split(" "):
+                time.sleep(script.token_latency)
+                send_delta({"content": word + " "})
+            send_delta({}, "stop")
+
+        self.write_chunk(b"data: [DONE]\n\n")
+        self.write_chunk(b"")
+
+    def write_chunk(self, data: bytes):
+        # HTTP/1.1 chunked encoding, an empty chunk ends the body
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, script: FakeScript):
+        super().__init__(address, FakeOpenAIHandler)
+        self.script = script
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def count_request(self) -> int:
+        # Returns this request's number, starting at 1
+        with self._lock:
+            self.requests += 1
+            return self.requests
+
+
+def start_fake_openai(script: FakeScript, host: str = "127.0.0.1", port: int = 0) -> FakeOpenAIServer:
+    # Serves from a daemon thread, port 0 picks a free port (see server.base_url)
+    server = FakeOpenAIServer((host, port), script)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
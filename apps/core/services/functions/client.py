@@ -1,6 +1,37 @@
-from typing import Optional
+from typing import List, Optional
+from django.db import transaction
+from django.db.models import Count, Value
+from django.db.models.functions import StrIndex, Substr
 from apps.core.models import Client
+from apps.core.services.batch import batch_result, check_emails
+from apps.core.services.pagination import paginate
+from apps.core.services.registry import registry
+from apps.core.services.search import (
+    DEFAULT_SEARCH_LIMIT,
+    fts_search,
+    fts_table,
+    icontains_filter,
+    search_terms,
+)
+from apps.core.services.schemas import (
+    GetClientParams,
+    AddClientParams,
+    UpdateClientParams,
+    DeleteClientParams,
+    ListClientsParams,
+    AddClientsParams,
+    UpdateClientsParams,
+    DeleteClientsParams,
+    SearchClientsParams,
+    CountClientsParams,
+)
 
+@registry.tool(
+    "get_client",
+    GetClientParams,
+    "Get details of a client by email.",
+    cache_tags=("client",),
+)
 def get_client(email: str):
     try:
         client = Client.objects.get(email=email)
@@ -12,6 +43,7 @@ def get_client(email: str):
     except Client.DoesNotExist:
         return f"No client found with email '{email}'."
 
+@registry.tool("add_client", AddClientParams, "Add a new client.", invalidates=("client",))
 def add_client(name: str, description: str, email: str):
     if Client.objects.filter(email=email).exists():
         return f"Client with email '{email}' already exists."
@@ -19,26 +51,31 @@ def add_client(name: str, description: str, email: str):
     client = Client.objects.create(name=name, description=description, email=email)
     return f"Client '{client.name}' added successfully."
 
+@registry.tool(
+    "update_client",
+    UpdateClientParams,
+    "Update an existing client.",
+    invalidates=("client",),
+)
 def update_client(
     email: str,
     name: Optional[str] = None,
     description: Optional[str] = None,
 ):
-    try:
-        client = Client.objects.get(email=email)
-    except Client.DoesNotExist:
+    # One UPDATE of the given fields, its row count tells whether the client exists
+    changes = {key: value for key, value in (("name", name), ("description", description)) if value is not None}
+    clients = Client.objects.filter(email=email)
+    found = clients.update(**changes) if changes else clients.exists()
+    if not found:
         return f"No client found with email '{email}'."
-
-    if name is not None:
-        client.name = name
-    if description is not None:
-        client.description = description
-    if email is not None:
-        client.email = email
-
-    client.save()
     return f"Client with email '{email}' updated successfully."
 
+@registry.tool(
+    "delete_client",
+    DeleteClientParams,
+    "Delete a client by email.",
+    invalidates=("client",),
+)
 def delete_client(email: str):
     try:
         client = Client.objects.get(email=email)
@@ -47,21 +84,178 @@ def delete_client(email: str):
     except Client.DoesNotExist:
         return f"No client found with email '{email}'."
 
-def list_clients():
+# Batch variants: one transaction and a fixed number of queries per call, whatever the batch size
+
+@registry.tool(
+    "add_clients",
+    AddClientsParams,
+    "Add many new clients in one call. Existing emails are skipped. Returns a status per email.",
+    invalidates=("client",),
+)
+def add_clients(clients: List[dict]):
+    emails = [client["email"] for client in clients]
+    with transaction.atomic():
+        existing = set(Client.objects.filter(email__in=emails).values_list("email", flat=True))
+        statuses, new_clients = [], []
+        for client, problem in zip(clients, check_emails(emails)):
+            status = problem or ("already exists" if client["email"] in existing else "created")
+            statuses.append((client["email"], status))
+            if status == "created":
+                new_clients.append(Client(**client))
+        Client.objects.bulk_create(new_clients)
+    return batch_result(statuses)
+
+@registry.tool(
+    "upsert_clients",
+    AddClientsParams,
+    "Create or fully update many clients in one call, matched by email. Returns a status per email.",
+    invalidates=("client",),
+)
+def upsert_clients(clients: List[dict]):
+    emails = [client["email"] for client in clients]
+    with transaction.atomic():
+        existing = set(Client.objects.filter(email__in=emails).values_list("email", flat=True))
+        statuses, rows = [], []
+        for client, problem in zip(clients, check_emails(emails)):
+            status = problem or ("updated" if client["email"] in existing else "created")
+            statuses.append((client["email"], status))
+            if problem is None:
+                rows.append(Client(**client))
+        Client.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=["email"],
+            update_fields=["name", "description"],
+        )
+    return batch_result(statuses)
+
+@registry.tool(
+    "update_clients",
+    UpdateClientsParams,
+    "Update many existing clients in one call, only the given fields change. Returns a status per email.",
+    invalidates=("client",),
+)
+def update_clients(clients: List[dict]):
+    emails = [client["email"] for client in clients]
+    with transaction.atomic():
+        found = {client.email: client for client in Client.objects.select_for_update().filter(email__in=emails)}
+        statuses, changed, fields = [], [], set()
+        for item, problem in zip(clients, check_emails(emails)):
+            updates = {key: value for key, value in item.items() if key != "email" and value is not None}
+            if problem:
+                status = problem
+            elif item["email"] not in found:
+                status = "not found"
+            elif not updates:
+                status = "no changes"
+            else:
+                client = found[item["email"]]
+                for key, value in updates.items():
+                    setattr(client, key, value)
+                changed.append(client)
+                fields.update(updates)
+                status = "updated"
+            statuses.append((item["email"], status))
+        if changed:
+            Client.objects.bulk_update(changed, sorted(fields))
+    return batch_result(statuses)
+
+@registry.tool(
+    "delete_clients",
+    DeleteClientsParams,
+    "Delete many clients by email in one call. Returns a status per email.",
+    invalidates=("client",),
+    # Existing emails, then the delete reads the rows again to send post_delete
+    query_budget=3,
+)
+def delete_clients(emails: List[str]):
+    with transaction.atomic():
+        existing = set(Client.objects.filter(email__in=emails).values_list("email", flat=True))
+        Client.objects.filter(email__in=existing).delete()
+    statuses = [
+        (email, problem or ("deleted" if email in existing else "not found"))
+        for email, problem in zip(emails, check_emails(emails))
+    ]
+    return batch_result(statuses)
+
+CLIENT_FIELDS = ["name", "description", "email"]
+
+@registry.tool(
+    "list_clients",
+    ListClientsParams,
+    "Returns one page of clients, optionally filtered. Pass next_cursor back as cursor for the next page.",
+    cache_tags=("client",),
+)
+def list_clients(
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    name_prefix: Optional[str] = None,
+    fields: Optional[List[str]] = None,
+):
+    fields = fields or CLIENT_FIELDS
+    unknown = [field for field in fields if field not in CLIENT_FIELDS]
+    if unknown:
+        return f"Unknown client fields: {', '.join(unknown)}. Available: {', '.join(CLIENT_FIELDS)}."
+
     clients = Client.objects.all()
-    if not clients:
+    if name_prefix:
+        clients = clients.filter(name__istartswith=name_prefix)
+
+    try:
+        page = paginate(clients, fields, limit=limit, cursor=cursor)
+    except ValueError:
+        return f"Invalid cursor '{cursor}'."
+
+    if not page["items"]:
+        if cursor or name_prefix:
+            return "No clients match the given filters."
         return "There are currently no clients registered."
-    return [{
-        "name": c.name,
-        "description": c.description,
-        "email": c.email,
-    } for c in clients]
-
-# Map functions here
-FUNCTION_MAP = {
-    "get_client": get_client,
-    "add_client": add_client,
-    "update_client": update_client,
-    "delete_client": delete_client,
-    "list_clients": list_clients,
-}
\ No newline at end of file
+    return page
+
+@registry.tool(
+    "search_clients",
+    SearchClientsParams,
+    "Find clients by words in their name, description or email, best matches first.",
+    cache_tags=("client",),
+)
+def search_clients(query: str, limit: Optional[int] = None):
+    terms = search_terms(query)
+    if not terms:
+        return "The search query must contain at least one word."
+
+    limit = limit or DEFAULT_SEARCH_LIMIT
+    table = Client._meta.db_table
+    fts = fts_table(table)
+    if fts:
+        # Name matches weigh most, then description, then email
+        items = fts_search(table, fts, CLIENT_FIELDS, terms, limit, weights=(10.0, 2.0, 1.0))
+    else:
+        clients = Client.objects.filter(icontains_filter(["name", "description", "email"], terms))
+        items = list(clients.order_by("name").values(*CLIENT_FIELDS)[:limit])
+
+    if not items:
+        return f"No clients match '{query}'."
+    return items
+
+@registry.tool(
+    "count_clients",
+    CountClientsParams,
+    "Count clients, optionally filtered by name prefix or grouped by email domain. "
+    "Use this instead of listing clients to answer how many questions.",
+    cache_tags=("client",),
+)
+def count_clients(group_by: Optional[str] = None, name_prefix: Optional[str] = None):
+    clients = Client.objects.all()
+    if name_prefix:
+        clients = clients.filter(name__istartswith=name_prefix)
+
+    if not group_by:
+        return {"count": clients.count()}
+
+    # Only grouping is by email domain: everything after the "@"
+    domain = Substr("email", StrIndex("email", Value("@")) + 1)
+    rows = clients.annotate(bucket=domain).values("bucket").annotate(count=Count("pk")).order_by("-count", "bucket")
+    items = [{"email_domain": row["bucket"], "count": row["count"]} for row in rows]
+    if not items:
+        return "No clients match the given filters."
+    return {"items": items, "total": sum(item["count"] for item in items)}
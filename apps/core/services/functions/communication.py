@@ -1,3 +1,14 @@
+from apps.core.services.registry import registry
+from apps.core.services.schemas import (
+    SendEmailParams,
+)
+
+@registry.tool(
+    "send_email",
+    SendEmailParams,
+    "Simulate sending an email. Runs in the background, returns a job id.",
+    deferred=True,
+)
 def send_email(
         to_email: str,
         subject: str,
@@ -5,8 +16,3 @@ def send_email(
 ):
     # Simulating email sending, no actual email sent
     return f"Simulated sending email to {to_email} with subject '{subject}'. Body length: {len(body)} characters."
-
-
-FUNCTION_MAP = {
-    "send_email": send_email,
-}
\ No newline at end of file
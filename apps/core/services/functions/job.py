@@ -0,0 +1,27 @@
+from django.utils import timezone
+from apps.core.models import Job
+from apps.core.services.registry import registry
+from apps.core.services.schemas import (
+    GetJobStatusParams,
+)
+
+@registry.tool("get_job_status", GetJobStatusParams, "Get the status and result of a background job.")
+def get_job_status(job_id: int):
+    try:
+        job = Job.objects.get(pk=job_id)
+    except Job.DoesNotExist:
+        return f"No job found with id {job_id}."
+
+    status = {
+        "job_id": job.pk,
+        "tool": job.tool,
+        "status": job.status,
+        "attempts": job.attempts,
+    }
+    if job.status == Job.SUCCEEDED:
+        status["result"] = job.result
+    elif job.error:
+        status["last_error"] = job.error
+    if job.status == Job.QUEUED and job.run_after > timezone.now():
+        status["next_attempt_at"] = job.run_after.isoformat(timespec="seconds")
+    return status
@@ -1,7 +1,38 @@
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.db.models.functions import TruncMonth, TruncYear
 from apps.core.models import TeamMember
+from apps.core.services.batch import batch_result, check_emails
+from apps.core.services.pagination import paginate
+from apps.core.services.registry import registry
+from apps.core.services.search import (
+    DEFAULT_SEARCH_LIMIT,
+    fts_search,
+    fts_table,
+    icontains_filter,
+    search_terms,
+)
+from apps.core.services.schemas import (
+    GetTeamMemberParams,
+    AddTeamMemberParams,
+    UpdateTeamMemberParams,
+    DeleteTeamMemberParams,
+    ListTeamMembersParams,
+    AddTeamMembersParams,
+    UpdateTeamMembersParams,
+    DeleteTeamMembersParams,
+    SearchTeamMembersParams,
+    CountTeamMembersParams,
+)
 
+@registry.tool(
+    "get_team_member",
+    GetTeamMemberParams,
+    "Get details of a team member by email.",
+    cache_tags=("team_member",),
+)
 def get_team_member(email: str):
     try:
         member = TeamMember.objects.get(email=email)
@@ -15,6 +46,12 @@ def get_team_member(email: str):
     except TeamMember.DoesNotExist:
         return f"No team member found with email '{email}'."
 
+@registry.tool(
+    "add_team_member",
+    AddTeamMemberParams,
+    "Add a new team member.",
+    invalidates=("team_member",),
+)
 def add_team_member(
     first_name: str,
     last_name: str,
@@ -22,9 +59,6 @@ def add_team_member(
     country: str,
     joined_on: Optional[str] = None
 ):
-    if TeamMember.objects.filter(email=email).exists():
-        return f"Team member with email '{email}' already exists."
-
     joined_date = None
     if joined_on:
         try:
@@ -32,6 +66,9 @@ def add_team_member(
         except ValueError:
             return "Invalid date format for joined_on. Use YYYY-MM-DD."
 
+    if TeamMember.objects.filter(email=email).exists():
+        return f"Team member with email '{email}' already exists."
+
     member = TeamMember.objects.create(
         first_name=first_name,
         last_name=last_name,
@@ -41,6 +78,12 @@ def add_team_member(
     )
     return f"Team member '{member.first_name} {member.last_name}' added successfully."
 
+@registry.tool(
+    "update_team_member",
+    UpdateTeamMemberParams,
+    "Update an existing team member.",
+    invalidates=("team_member",),
+)
 def update_team_member(
     email: str,
     first_name: Optional[str] = None,
@@ -48,26 +91,30 @@ def update_team_member(
     country: Optional[str] = None,
     joined_on: Optional[str] = None
 ):
-    try:
-        member = TeamMember.objects.get(email=email)
-    except TeamMember.DoesNotExist:
-        return f"No team member found with email '{email}'."
-
-    if first_name is not None:
-        member.first_name = first_name
-    if last_name is not None:
-        member.last_name = last_name
-    if country is not None:
-        member.country = country
+    changes = {
+        key: value
+        for key, value in (("first_name", first_name), ("last_name", last_name), ("country", country))
+        if value is not None
+    }
     if joined_on is not None:
         try:
-            member.joined_on = datetime.strptime(joined_on, "%Y-%m-%d").date()
+            changes["joined_on"] = datetime.strptime(joined_on, "%Y-%m-%d").date()
         except ValueError:
             return "Invalid date format for joined_on. Use YYYY-MM-DD."
 
-    member.save()
+    # One UPDATE of the given fields, its row count tells whether the member exists
+    members = TeamMember.objects.filter(email=email)
+    found = members.update(**changes) if changes else members.exists()
+    if not found:
+        return f"No team member found with email '{email}'."
     return f"Team member with email '{email}' updated successfully."
 
+@registry.tool(
+    "delete_team_member",
+    DeleteTeamMemberParams,
+    "Delete a team member by email.",
+    invalidates=("team_member",),
+)
 def delete_team_member(email: str):
     try:
         member = TeamMember.objects.get(email=email)
@@ -76,23 +123,254 @@ def delete_team_member(email: str):
     except TeamMember.DoesNotExist:
         return f"No team member found with email '{email}'."
 
-def list_team_members():
+# Batch variants: one transaction and a fixed number of queries per call, whatever the batch size
+
+def parse_batch_item(item: dict, problem: Optional[str]):
+    # Returns (field values with joined_on as a date, status if the item must be skipped)
+    values = dict(item)
+    if problem:
+        return values, problem
+    if values.get("joined_on"):
+        try:
+            values["joined_on"] = datetime.strptime(values["joined_on"], "%Y-%m-%d").date()
+        except ValueError:
+            return values, "invalid joined_on, use YYYY-MM-DD"
+    return values, None
+
+@registry.tool(
+    "add_team_members",
+    AddTeamMembersParams,
+    "Add many new team members in one call. Existing emails are skipped. Returns a status per email.",
+    invalidates=("team_member",),
+)
+def add_team_members(team_members: List[dict]):
+    emails = [member["email"] for member in team_members]
+    with transaction.atomic():
+        existing = set(TeamMember.objects.filter(email__in=emails).values_list("email", flat=True))
+        statuses, new_members = [], []
+        for item, problem in zip(team_members, check_emails(emails)):
+            values, status = parse_batch_item(item, problem)
+            status = status or ("already exists" if item["email"] in existing else "created")
+            statuses.append((item["email"], status))
+            if status == "created":
+                new_members.append(TeamMember(**values))
+        TeamMember.objects.bulk_create(new_members)
+    return batch_result(statuses)
+
+@registry.tool(
+    "upsert_team_members",
+    AddTeamMembersParams,
+    "Create or fully update many team members in one call, matched by email. Returns a status per email.",
+    invalidates=("team_member",),
+)
+def upsert_team_members(team_members: List[dict]):
+    emails = [member["email"] for member in team_members]
+    with transaction.atomic():
+        existing = set(TeamMember.objects.filter(email__in=emails).values_list("email", flat=True))
+        statuses, rows = [], []
+        for item, problem in zip(team_members, check_emails(emails)):
+            values, status = parse_batch_item(item, problem)
+            if status is None:
+                rows.append(TeamMember(**values))
+                status = "updated" if item["email"] in existing else "created"
+            statuses.append((item["email"], status))
+        TeamMember.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=["email"],
+            update_fields=["first_name", "last_name", "country", "joined_on"],
+        )
+    return batch_result(statuses)
+
+@registry.tool(
+    "update_team_members",
+    UpdateTeamMembersParams,
+    "Update many existing team members in one call, only the given fields change. Returns a status per email.",
+    invalidates=("team_member",),
+)
+def update_team_members(team_members: List[dict]):
+    emails = [member["email"] for member in team_members]
+    with transaction.atomic():
+        found = {
+            member.email: member
+            for member in TeamMember.objects.select_for_update().filter(email__in=emails)
+        }
+        statuses, changed, fields = [], [], set()
+        for item, problem in zip(team_members, check_emails(emails)):
+            values, status = parse_batch_item(item, problem)
+            updates = {key: value for key, value in values.items() if key != "email" and value is not None}
+            if status is None and item["email"] not in found:
+                status = "not found"
+            elif status is None and not updates:
+                status = "no changes"
+            elif status is None:
+                member = found[item["email"]]
+                for key, value in updates.items():
+                    setattr(member, key, value)
+                changed.append(member)
+                fields.update(updates)
+                status = "updated"
+            statuses.append((item["email"], status))
+        if changed:
+            TeamMember.objects.bulk_update(changed, sorted(fields))
+    return batch_result(statuses)
+
+@registry.tool(
+    "delete_team_members",
+    DeleteTeamMembersParams,
+    "Delete many team members by email in one call. Returns a status per email.",
+    invalidates=("team_member",),
+    # Existing emails, then the delete reads the rows again to send post_delete
+    query_budget=3,
+)
+def delete_team_members(emails: List[str]):
+    with transaction.atomic():
+        existing = set(TeamMember.objects.filter(email__in=emails).values_list("email", flat=True))
+        TeamMember.objects.filter(email__in=existing).delete()
+    statuses = [
+        (email, problem or ("deleted" if email in existing else "not found"))
+        for email, problem in zip(emails, check_emails(emails))
+    ]
+    return batch_result(statuses)
+
+def filter_team_members(
+    country: Optional[str] = None,
+    name_prefix: Optional[str] = None,
+    joined_after: Optional[str] = None,
+    joined_before: Optional[str] = None,
+):
+    # Filters shared by list_team_members and count_team_members, raises ValueError on a bad date
     members = TeamMember.objects.all()
-    if not members:
+    if country:
+        members = members.filter(country__iexact=country)
+    if name_prefix:
+        members = members.filter(
+            Q(first_name__istartswith=name_prefix) | Q(last_name__istartswith=name_prefix)
+        )
+    if joined_after:
+        members = members.filter(joined_on__gte=datetime.strptime(joined_after, "%Y-%m-%d").date())
+    if joined_before:
+        members = members.filter(joined_on__lte=datetime.strptime(joined_before, "%Y-%m-%d").date())
+    return members
+
+TEAM_MEMBER_FIELDS = ["first_name", "last_name", "email", "country", "joined_on"]
+
+@registry.tool(
+    "list_team_members",
+    ListTeamMembersParams,
+    "Returns one page of team members, optionally filtered. Pass next_cursor back as cursor for the next page.",
+    cache_tags=("team_member",),
+)
+def list_team_members(
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    country: Optional[str] = None,
+    name_prefix: Optional[str] = None,
+    joined_after: Optional[str] = None,
+    joined_before: Optional[str] = None,
+    fields: Optional[List[str]] = None,
+):
+    fields = fields or TEAM_MEMBER_FIELDS
+    unknown = [field for field in fields if field not in TEAM_MEMBER_FIELDS]
+    if unknown:
+        return f"Unknown team member fields: {', '.join(unknown)}. Available: {', '.join(TEAM_MEMBER_FIELDS)}."
+
+    try:
+        members = filter_team_members(country, name_prefix, joined_after, joined_before)
+    except ValueError:
+        return "Invalid date format for joined_after/joined_before. Use YYYY-MM-DD."
+
+    try:
+        page = paginate(members, fields, limit=limit, cursor=cursor)
+    except ValueError:
+        return f"Invalid cursor '{cursor}'."
+
+    if not page["items"]:
+        if cursor or country or name_prefix or joined_after or joined_before:
+            return "No team members match the given filters."
         return "No team members registered yet."
-    return [{
-        "first_name": m.first_name,
-        "last_name": m.last_name,
-        "email": m.email,
-        "country": m.country,
-        "joined_on": m.joined_on.isoformat() if m.joined_on else None
-    } for m in members]
-
-# Map functions here
-FUNCTION_MAP = {
-    "get_team_member": get_team_member,
-    "add_team_member": add_team_member,
-    "update_team_member": update_team_member,
-    "delete_team_member": delete_team_member,
-    "list_team_members": list_team_members,
+
+    if "joined_on" in fields:
+        for item in page["items"]:
+            item["joined_on"] = item["joined_on"].isoformat() if item["joined_on"] else None
+    return page
+
+@registry.tool(
+    "search_team_members",
+    SearchTeamMembersParams,
+    "Find team members by words in their name, country or email, best matches first.",
+    cache_tags=("team_member",),
+)
+def search_team_members(query: str, country: Optional[str] = None, limit: Optional[int] = None):
+    terms = search_terms(query)
+    if not terms:
+        return "The search query must contain at least one word."
+
+    limit = limit or DEFAULT_SEARCH_LIMIT
+    table = TeamMember._meta.db_table
+    fts = fts_table(table)
+    if fts:
+        where, params = ("AND t.country = %s COLLATE NOCASE", (country,)) if country else ("", ())
+        items = fts_search(
+            table, fts, TEAM_MEMBER_FIELDS, terms, limit,
+            weights=(10.0, 10.0, 2.0, 1.0), where=where, params=params,
+        )
+    else:
+        members = TeamMember.objects.filter(
+            icontains_filter(["first_name", "last_name", "country", "email"], terms)
+        )
+        if country:
+            members = members.filter(country__iexact=country)
+        items = list(members.order_by("last_name", "first_name").values(*TEAM_MEMBER_FIELDS)[:limit])
+
+    if not items:
+        return f"No team members match '{query}'."
+    for item in items:
+        # A date from the ORM, already a YYYY-MM-DD string from the raw FTS query
+        item["joined_on"] = str(item["joined_on"]) if item["joined_on"] else None
+    return items
+
+# Aggregates are computed by the database, the model only reads the (small) grouped result
+TEAM_MEMBER_GROUPS = {
+    "country": (F("country"), ["-count", "bucket"]),
+    "year": (TruncYear("joined_on"), ["bucket"]),
+    "month": (TruncMonth("joined_on"), ["bucket"]),
 }
+
+def format_bucket(value, group_by: str):
+    if value is None:
+        return "unknown"
+    if group_by == "year":
+        return value.year
+    if group_by == "month":
+        return value.strftime("%Y-%m")
+    return value
+
+@registry.tool(
+    "count_team_members",
+    CountTeamMembersParams,
+    "Count team members, optionally filtered and grouped by country or by year/month joined. "
+    "Use this instead of listing team members to answer how many questions.",
+    cache_tags=("team_member",),
+)
+def count_team_members(
+    group_by: Optional[str] = None,
+    country: Optional[str] = None,
+    name_prefix: Optional[str] = None,
+    joined_after: Optional[str] = None,
+    joined_before: Optional[str] = None,
+):
+    try:
+        members = filter_team_members(country, name_prefix, joined_after, joined_before)
+    except ValueError:
+        return "Invalid date format for joined_after/joined_before. Use YYYY-MM-DD."
+
+    if not group_by:
+        return {"count": members.count()}
+
+    expression, ordering = TEAM_MEMBER_GROUPS[group_by]
+    rows = members.annotate(bucket=expression).values("bucket").annotate(count=Count("pk")).order_by(*ordering)
+    items = [{group_by: format_bucket(row["bucket"], group_by), "count": row["count"]} for row in rows]
+    if not items:
+        return "No team members match the given filters."
+    return {"items": items, "total": sum(item["count"] for item in items)}
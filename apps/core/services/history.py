@@ -0,0 +1,76 @@
+import json
+
+from django.conf import settings
+
+# Rough chars-per-token ratio for English/JSON text, good enough for budgeting
+CHARS_PER_TOKEN = 4
+# Per-message overhead the chat format adds (role, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def count_tokens(message: dict) -> int:
+    size = len(message.get("content") or "")
+    if message.get("tool_calls"):
+        size += len(json.dumps(message["tool_calls"]))
+    return size // CHARS_PER_TOKEN + MESSAGE_OVERHEAD_TOKENS
+
+
+def split_turns(messages: list) -> list:
+    # A turn starts at a user message and owns the assistant/tool messages that follow it,
+    # so dropping whole turns never leaves a tool result without its tool call.
+    turns = []
+    for message in messages:
+        if message["role"] == "user" or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+def from_turn_start(messages: list) -> list:
+    # A window cut mid-turn would start with tool results whose tool call was left out
+    for index, message in enumerate(messages):
+        if message["role"] == "user":
+            return messages[index:]
+    return []
+
+
+class HistoryManager:
+    # Keeps the conversation under a token budget: old tool results are truncated first,
+    # then the oldest turns are dropped. The system message stays pinned as a stable prefix.
+    def __init__(self, token_budget: int | None = None, max_tool_result_chars: int | None = None):
+        self.token_budget = token_budget or getattr(settings, "AGENT_HISTORY_TOKEN_BUDGET", 8000)
+        self.max_tool_result_chars = max_tool_result_chars or getattr(
+            settings, "AGENT_HISTORY_TOOL_RESULT_CHARS", 1500
+        )
+
+    def truncate_tool_result(self, message: dict) -> dict:
+        content = message.get("content") or ""
+        if message["role"] != "tool" or len(content) <= self.max_tool_result_chars:
+            return message
+        omitted = len(content) - self.max_tool_result_chars
+        return {
+            **message,
+            "content": f"{content[:self.max_tool_result_chars]}\n[... {omitted} characters truncated]",
+        }
+
+    def compact(self, messages: list) -> list:
+        system_message, rest = messages[0], messages[1:]
+        turns = split_turns(rest)
+        if not turns:
+            return messages
+
+        # Only earlier turns are shortened, the model still sees the current turn in full
+        turns = [
+            [self.truncate_tool_result(message) for message in turn]
+            for turn in turns[:-1]
+        ] + [turns[-1]]
+
+        turn_tokens = [sum(count_tokens(message) for message in turn) for turn in turns]
+        total = count_tokens(system_message) + sum(turn_tokens)
+
+        first_kept = 0
+        while total > self.token_budget and first_kept < len(turns) - 1:
+            total -= turn_tokens[first_kept]
+            first_kept += 1
+
+        return [system_message, *(message for turn in turns[first_kept:] for message in turn)]
@@ -0,0 +1,186 @@
+import hashlib
+import json
+import logging
+import random
+import threading
+import uuid
+from datetime import timedelta
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+
+from apps.core.models import Job
+from apps.core.services.encoders import get_result_encoder
+from apps.core.services.registry import registry
+from apps.core.services.tool_cache import get_tool_cache
+
+logger = logging.getLogger(__name__)
+
+
+def idempotency_key(tool: str, arguments: dict, conversation_id: str | None = None,
+                    call_id: str | None = None) -> str:
+    # One tool call (conversation, the model's tool_call id, tool and arguments) is queued once per
+    # idempotency window: the same call dispatched again (a replayed completion, a retried turn) doesn't
+    # send the email twice, the same request from another conversation or a new call is queued.
+    # Without a call id there is no way to tell a retry from a new request, every call gets its own key.
+    if call_id is None:
+        return uuid.uuid4().hex
+    payload = json.dumps(
+        {"conversation": conversation_id, "call": call_id, "tool": tool, "arguments": arguments},
+        sort_keys=True, default=str,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def idempotency_window(tool: str) -> float:
+    # JOB_IDEMPOTENCY_WINDOWS[tool], else JOB_IDEMPOTENCY_WINDOW
+    windows = getattr(settings, "JOB_IDEMPOTENCY_WINDOWS", {})
+    return windows.get(tool, getattr(settings, "JOB_IDEMPOTENCY_WINDOW", 3600))
+
+
+def retry_delay(attempt: int) -> float:
+    # Exponential backoff with full jitter, attempt starts at 1
+    base = getattr(settings, "JOB_RETRY_BASE_DELAY", 2.0)
+    cap = getattr(settings, "JOB_RETRY_MAX_DELAY", 60.0)
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+def enqueue(tool: str, arguments: dict, key: str | None = None) -> tuple:
+    # Returns (job, created). An existing job with the same key is returned as is.
+    key = key or idempotency_key(tool, arguments)
+    try:
+        job, created = Job.objects.get_or_create(
+            idempotency_key=key,
+            defaults={"tool": tool, "arguments": arguments, "run_after": timezone.now()},
+        )
+    except IntegrityError:
+        # Lost a race with another request queuing the same call
+        job, created = Job.objects.get(idempotency_key=key), False
+
+    window = timedelta(seconds=idempotency_window(tool))
+    if not created and job.status in (Job.SUCCEEDED, Job.FAILED) and job.created_at < timezone.now() - window:
+        # Finished long ago: retire its key so the same call can be made again
+        Job.objects.filter(pk=job.pk, idempotency_key=key).update(idempotency_key=f"{key[:40]}:{job.pk}")
+        return enqueue(tool, arguments, key)
+
+    if created and getattr(settings, "JOB_RUN_IN_PROCESS", True):
+        get_job_queue().start()
+        get_job_queue().notify()
+    return job, created
+
+
+def defer(tool: str, arguments: dict, conversation_id: str | None = None, call_id: str | None = None) -> str:
+    # What a deferred tool returns to the model instead of its result
+    job, created = enqueue(tool, arguments, idempotency_key(tool, arguments, conversation_id, call_id))
+    if created:
+        return f"Queued as job {job.pk}. Use get_job_status with job_id={job.pk} to check on it."
+    return f"This tool call was already queued as job {job.pk} (status: {job.status}), it was not queued again."
+
+
+def claim_next_job() -> Job | None:
+    # Due queued jobs, or running jobs whose lease expired. The conditional update makes the claim
+    # atomic on every backend, two workers can never take the same job.
+    now = timezone.now()
+    lease = timedelta(seconds=getattr(settings, "JOB_LEASE_SECONDS", 300))
+    due = Q(status=Job.QUEUED, run_after__lte=now) | Q(status=Job.RUNNING, updated_at__lt=now - lease)
+
+    for job in Job.objects.filter(due).order_by("run_after", "pk")[:5]:
+        claimed = Job.objects.filter(pk=job.pk, status=job.status, updated_at=job.updated_at).update(
+            status=Job.RUNNING, attempts=job.attempts + 1, updated_at=now,
+        )
+        if claimed:
+            job.status, job.attempts, job.updated_at = Job.RUNNING, job.attempts + 1, now
+            return job
+    return None
+
+
+def run_job(job: Job):
+    tool = registry.get(job.tool)
+    max_attempts = getattr(settings, "JOB_MAX_ATTEMPTS", 3)
+    try:
+        result = tool.run(**job.arguments)
+    except Exception as e:
+        logger.exception("Job %s (%s) failed on attempt %s", job.pk, job.tool, job.attempts)
+        job.error = str(e)
+        if job.attempts < max_attempts:
+            job.status = Job.QUEUED
+            job.run_after = timezone.now() + timedelta(seconds=retry_delay(job.attempts))
+        else:
+            job.status = Job.FAILED
+    else:
+        job.status = Job.SUCCEEDED
+        job.result = get_result_encoder().encode(result, job.tool)
+        job.error = ""
+    finally:
+        if tool.invalidates:
+            get_tool_cache().invalidate(*tool.invalidates)
+    job.save(update_fields=["status", "run_after", "result", "error", "updated_at"])
+
+
+class JobQueue:
+    # Worker threads pulling jobs from the Job table. Several processes may run workers on the same DB.
+    def __init__(self, workers: int = 2, poll_interval: float = 1.0):
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self._wakeup = threading.Condition()
+        self._stop = threading.Event()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            self._stop.clear()
+            for i in range(self.workers):
+                thread = threading.Thread(target=self.work, name=f"job-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self, timeout: float | None = None):
+        self._stop.set()
+        self.notify(all_workers=True)
+        with self._lock:
+            for thread in self._threads:
+                thread.join(timeout)
+            self._threads = []
+
+    def notify(self, all_workers: bool = False):
+        with self._wakeup:
+            if all_workers:
+                self._wakeup.notify_all()
+            else:
+                self._wakeup.notify()
+
+    def run_pending(self) -> bool:
+        # Runs at most one job, returns False when nothing was due
+        try:
+            job = claim_next_job()
+            if job is None:
+                return False
+            run_job(job)
+            return True
+        finally:
+            close_old_connections()
+
+    def work(self):
+        while not self._stop.is_set():
+            try:
+                if self.run_pending():
+                    continue
+            except Exception:
+                # DB unavailable or similar, keep the worker alive and retry after the poll interval
+                logger.exception("Job worker error")
+            with self._wakeup:
+                self._wakeup.wait(self.poll_interval)
+
+
+@lru_cache(maxsize=None)
+def get_job_queue() -> JobQueue:
+    return JobQueue(
+        workers=getattr(settings, "JOB_WORKERS", 2),
+        poll_interval=getattr(settings, "JOB_POLL_INTERVAL", 1.0),
+    )
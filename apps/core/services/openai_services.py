@@ -1,30 +1,261 @@
+import asyncio
+import logging
 import os
+import random
+import threading
+import time
+import weakref
+from contextlib import asynccontextmanager, contextmanager
+from functools import lru_cache
+
+import httpx
+import openai
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
+
+from apps.core.services.completion_cache import get_completion_cache
 
 load_dotenv()
 
-class OpenAIService:
-    def __init__(self):
-        self.openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-    def chat_with_tools (self, messages, functions):
-        response = self.openai_client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=messages,
-            functions=functions
+# 429, 5xx and network failures are worth retrying, anything else (400, 401, ...) is not
+RETRYABLE_ERRORS = (
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+class UpstreamBusyError(Exception):
+    # Raised when no upstream slot frees up in time (OPENAI_MAX_CONCURRENT_REQUESTS)
+    pass
+
+def tool_choice_kwargs(tool_choice):
+    # Only send tool_choice when set, so the API default ("auto") applies otherwise
+    return {"tool_choice": tool_choice} if tool_choice else {}
+
+def tools_kwargs(tools, tool_choice):
+    # Turns routed without tools send neither, the API rejects an empty tools list
+    if not tools:
+        return {}
+    return {"tools": tools, **tool_choice_kwargs(tool_choice)}
+
+def get_timeout():
+    return httpx.Timeout(
+        settings.OPENAI_READ_TIMEOUT,
+        connect=settings.OPENAI_CONNECT_TIMEOUT,
+    )
+
+def get_limits():
+    return httpx.Limits(
+        max_connections=settings.OPENAI_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.OPENAI_KEEPALIVE_EXPIRY,
+    )
+
+@lru_cache(maxsize=None)
+def get_openai_client() -> OpenAI:
+    # One client per process, so TLS connections are kept alive and reused across requests.
+    # Retries are ours (see with_retries), the SDK's own are disabled.
+    return OpenAI(
+        api_key=os.getenv("OPENAI_API_KEY"),
+        base_url=settings.OPENAI_BASE_URL,
+        max_retries=0,
+        timeout=get_timeout(),
+        http_client=httpx.Client(limits=get_limits(), timeout=get_timeout()),
+    )
+
+@lru_cache(maxsize=None)
+def get_upstream_semaphore() -> threading.BoundedSemaphore:
+    return threading.BoundedSemaphore(settings.OPENAI_MAX_CONCURRENT_REQUESTS)
+
+# Async clients and semaphores belong to one event loop, keep one set per loop
+_async_state = weakref.WeakKeyDictionary()
+
+def get_async_state():
+    loop = asyncio.get_running_loop()
+    state = _async_state.get(loop)
+    if state is None:
+        client = AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            base_url=settings.OPENAI_BASE_URL,
+            max_retries=0,
+            timeout=get_timeout(),
+            http_client=httpx.AsyncClient(limits=get_limits(), timeout=get_timeout()),
         )
+        state = _async_state[loop] = (client, asyncio.Semaphore(settings.OPENAI_MAX_CONCURRENT_REQUESTS))
+    return state
+
+@contextmanager
+def upstream_slot():
+    semaphore = get_upstream_semaphore()
+    if not semaphore.acquire(timeout=settings.OPENAI_CONCURRENCY_TIMEOUT):
+        raise UpstreamBusyError("Too many concurrent requests to the model, try again shortly.")
+    try:
+        yield
+    finally:
+        semaphore.release()
+
+@asynccontextmanager
+async def async_upstream_slot():
+    semaphore = get_async_state()[1]
+    try:
+        await asyncio.wait_for(semaphore.acquire(), timeout=settings.OPENAI_CONCURRENCY_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise UpstreamBusyError("Too many concurrent requests to the model, try again shortly.")
+    try:
+        yield
+    finally:
+        semaphore.release()
+
+def retry_delay(attempt, error):
+    # Honour Retry-After on 429s, otherwise exponential backoff with full jitter
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), settings.OPENAI_RETRY_MAX_DELAY)
+        except ValueError:
+            pass
+    cap = min(settings.OPENAI_RETRY_MAX_DELAY, settings.OPENAI_RETRY_BASE_DELAY * 2 ** attempt)
+    return random.uniform(0, cap)
+
+def with_retries(call):
+    for attempt in range(settings.OPENAI_MAX_RETRIES + 1):
+        try:
+            return call()
+        except RETRYABLE_ERRORS as e:
+            if attempt == settings.OPENAI_MAX_RETRIES:
+                raise
+            delay = retry_delay(attempt, e)
+            logging.warning(f"OpenAI request failed ({e.__class__.__name__}), retrying in {delay:.2f}s")
+            time.sleep(delay)
+
+async def awith_retries(call):
+    for attempt in range(settings.OPENAI_MAX_RETRIES + 1):
+        try:
+            return await call()
+        except RETRYABLE_ERRORS as e:
+            if attempt == settings.OPENAI_MAX_RETRIES:
+                raise
+            delay = retry_delay(attempt, e)
+            logging.warning(f"OpenAI request failed ({e.__class__.__name__}), retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
 
+class OpenAIService:
+    def __init__(self, model=None):
+        # Cheap to build: the HTTP client and its connection pool are shared by the whole process
+        self.openai_client = get_openai_client()
+        self.model = model or settings.OPENAI_MODEL
+        self.completion_cache = get_completion_cache()
+
+    @property
+    def async_openai_client(self):
+        return get_async_state()[0]
+
+    def chat_with_tools (self, messages, tools, tool_choice=None, model=None):
+        # model overrides the service's model for this call (routing tiers)
+        model = model or self.model
+        if self.completion_cache:
+            cached = self.completion_cache.get_completion(model, messages, tools, tool_choice)
+            if cached is not None:
+                return cached
+
+        with upstream_slot():
+            response = with_retries(lambda: self.openai_client.chat.completions.create(
+                model=model,
+                messages=messages,
+                **tools_kwargs(tools, tool_choice)
+            ))
+
+        if self.completion_cache:
+            self.completion_cache.set_completion(model, messages, tools, tool_choice, response)
         return response
 
-    def stream_chat (self, messages, functions):
-        # Alternative way to get responses using streaming
-        stream = self.openai_client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=messages,
-            functions=functions,
-            stream=True
-        )
+    def stream_chat (self, messages, tools, tool_choice=None, model=None):
+        # Alternative way to get responses using streaming.
+        # The upstream slot is held until the stream is fully read (or closed).
+        model = model or self.model
+        if self.completion_cache:
+            cached = self.completion_cache.get_stream(model, messages, tools, tool_choice)
+            if cached is not None:
+                yield from cached
+                return
+
+        chunks = []
+        with upstream_slot():
+            stream = with_retries(lambda: self.openai_client.chat.completions.create(
+                model=model,
+                messages=messages,
+                stream=True,
+                stream_options={"include_usage": True},
+                **tools_kwargs(tools, tool_choice)
+            ))
+
+            try:
+                for chunk in stream:
+                    chunks.append(chunk)
+                    yield chunk
+            finally:
+                stream.close()
+
+        # Only reached when the stream was read to the end, partial replies are never cached
+        if self.completion_cache:
+            self.completion_cache.set_stream(model, messages, tools, tool_choice, chunks)
+
+    async def achat_with_tools (self, messages, tools, tool_choice=None, model=None):
+        model = model or self.model
+        if self.completion_cache:
+            cached = await sync_to_async(self.completion_cache.get_completion)(
+                model, messages, tools, tool_choice
+            )
+            if cached is not None:
+                return cached
+
+        async with async_upstream_slot():
+            response = await awith_retries(lambda: self.async_openai_client.chat.completions.create(
+                model=model,
+                messages=messages,
+                **tools_kwargs(tools, tool_choice)
+            ))
+
+        if self.completion_cache:
+            await sync_to_async(self.completion_cache.set_completion)(
+                model, messages, tools, tool_choice, response
+            )
+        return response
+
+    async def astream_chat (self, messages, tools, tool_choice=None, model=None):
+        # Async variant of stream_chat, the upstream HTTP stream is only read as fast as we are consumed
+        model = model or self.model
+        if self.completion_cache:
+            cached = await sync_to_async(self.completion_cache.get_stream)(
+                model, messages, tools, tool_choice
+            )
+            if cached is not None:
+                for chunk in cached:
+                    yield chunk
+                return
+
+        chunks = []
+        async with async_upstream_slot():
+            stream = await awith_retries(lambda: self.async_openai_client.chat.completions.create(
+                model=model,
+                messages=messages,
+                stream=True,
+                stream_options={"include_usage": True},
+                **tools_kwargs(tools, tool_choice)
+            ))
+
+            try:
+                async for chunk in stream:
+                    chunks.append(chunk)
+                    yield chunk
+            finally:
+                # Release the connection when the consumer stops early (e.g. client disconnected)
+                await stream.close()
 
-        for chunk in stream:
-            yield chunk
\ No newline at end of file
+        if self.completion_cache:
+            await sync_to_async(self.completion_cache.set_stream)(
+                model, messages, tools, tool_choice, chunks
+            )
@@ -0,0 +1,25 @@
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+# Key of the per-row cursors in a page, for the encoders only (never shown to the model)
+ROW_CURSORS = "row_cursors"
+
+
+def paginate(queryset, fields: list, limit: int | None = None, cursor: str | None = None) -> dict:
+    # Keyset pagination on the primary key: the cursor is the last pk of the previous page,
+    # so every page is an indexed range scan no matter how deep it is.
+    # Returns {"items", "next_cursor", ROW_CURSORS}, next_cursor is None on the last page.
+    # row_cursors[i] continues right after items[i], so an encoder that only shows part of the page
+    # can hand out the cursor of the last row it showed instead of skipping the rest.
+    limit = max(1, min(limit or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE))
+    if cursor:
+        queryset = queryset.filter(pk__gt=int(cursor))
+
+    # One extra row tells us whether there is a next page without a COUNT query
+    rows = list(queryset.order_by("pk").values("pk", *fields)[:limit + 1].iterator())
+
+    next_cursor = str(rows[limit - 1]["pk"]) if len(rows) > limit else None
+    return {
+        "items": [{field: row[field] for field in fields} for row in rows[:limit]],
+        "next_cursor": next_cursor,
+        ROW_CURSORS: [str(row["pk"]) for row in rows[:limit]],
+    }
@@ -0,0 +1,146 @@
+import json
+import re
+
+from django.conf import settings
+from pydantic import ValidationError
+
+from apps.core.services.registry import registry
+from apps.core.services.tracing import metrics
+
+# Read-only tool calls started before the model asks for them, so their DB time overlaps the model call:
+#   - guessed from the user input with cheap patterns, as soon as the turn starts
+#   - taken from a streamed tool call the moment its arguments parse as complete JSON
+# execute_tool_calls then only waits for the call it would otherwise have started itself.
+# Calls nobody asked for still leave their result in the tool cache.
+
+EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+TEAM_RE = re.compile(r"\b(team|member|members|employee|employees|colleague|colleagues|staff)\b", re.IGNORECASE)
+CLIENT_RE = re.compile(r"\b(client|clients|customer|customers|account|accounts)\b", re.IGNORECASE)
+LIST_RE = re.compile(r"\b(list|show|all|every|who are)\b", re.IGNORECASE)
+# Emails looked up per turn at most
+MAX_GUESSED_EMAILS = 3
+
+
+def guess_tool_calls(user_input: str) -> list:
+    # (name, arguments) pairs the model is likely to ask for
+    calls = []
+    team, client = TEAM_RE.search(user_input), CLIENT_RE.search(user_input)
+    for email in EMAIL_RE.findall(user_input)[:MAX_GUESSED_EMAILS]:
+        # Without a hint both lookups are tried, each is a single indexed query
+        if client or not team:
+            calls.append(("get_client", {"email": email}))
+        if team or not client:
+            calls.append(("get_team_member", {"email": email}))
+    if LIST_RE.search(user_input):
+        if client:
+            calls.append(("list_clients", {}))
+        if team:
+            calls.append(("list_team_members", {}))
+    return calls
+
+
+def call_key(name: str, arguments: dict) -> str | None:
+    # Same normalization as the tool cache: omitted and explicit default arguments are the same call
+    try:
+        params = registry.get(name).params_model.model_validate(arguments)
+    except ValidationError:
+        return None
+    return f"{name}:{json.dumps(params.model_dump(), sort_keys=True, default=str)}"
+
+
+def prefetchable(name: str) -> bool:
+    # Only tools without side effects may run before the model asked for them
+    if name not in registry:
+        return False
+    tool = registry.get(name)
+    return bool(tool.cache_tags) and not tool.invalidates and not tool.deferred
+
+
+class Prefetcher:
+    # One per turn, started calls are keyed on the normalized call
+    def __init__(self, agent, executor):
+        self.agent = agent
+        self.executor = executor
+        self.futures = {}
+        self.streamed = set()
+        self.started = 0
+        self.used = 0
+
+    def start(self, name: str, arguments: dict):
+        if not isinstance(arguments, dict) or not prefetchable(name):
+            return
+        key = call_key(name, arguments)
+        if key is None or key in self.futures:
+            return
+        self.futures[key] = self.executor.submit(self.agent._run_function_in_worker, name, json.dumps(arguments))
+        self.started += 1
+
+    def start_from_input(self, user_input: str):
+        for name, arguments in guess_tool_calls(user_input or ""):
+            self.start(name, arguments)
+
+    def start_from_stream(self, accumulator):
+        # Called after every chunk. Streamed arguments are one JSON object, once it parses it is complete.
+        for tool_call in accumulator.tool_calls.values():
+            function = tool_call["function"]
+            if tool_call["id"] in self.streamed or not function["arguments"].rstrip().endswith("}"):
+                continue
+            try:
+                arguments = json.loads(function["arguments"])
+            except ValueError:
+                continue
+            self.streamed.add(tool_call["id"])
+            self.start(function["name"], arguments)
+
+    def take(self, name: str, arguments_str: str):
+        # The started call matching what the model asked for, None to run it as usual
+        if not self.futures or name not in registry:
+            return None
+        try:
+            arguments = json.loads(arguments_str or "{}")
+        except ValueError:
+            return None
+        key = call_key(name, arguments) if isinstance(arguments, dict) else None
+        future = self.futures.pop(key, None) if key else None
+        if future is not None:
+            self.used += 1
+        return future
+
+    def discard(self, tags):
+        # A write tool changed this data, results started before it may be stale
+        for key in list(self.futures):
+            if set(registry.get(key.split(":", 1)[0]).cache_tags) & set(tags):
+                self.futures.pop(key)
+
+    def finish(self):
+        if self.started:
+            help = "Tool calls started ahead of the model"
+            metrics.inc("agentc_prefetch_calls_total", self.used, help=help, outcome="used")
+            metrics.inc("agentc_prefetch_calls_total", self.started - self.used, help=help, outcome="unused")
+        self.futures = {}
+
+
+class NullPrefetcher:
+    def start_from_input(self, user_input: str):
+        pass
+
+    def start_from_stream(self, accumulator):
+        pass
+
+    def take(self, name: str, arguments_str: str):
+        return None
+
+    def discard(self, tags):
+        pass
+
+    def finish(self):
+        pass
+
+
+NULL_PREFETCHER = NullPrefetcher()
+
+
+def start_prefetch(agent, executor):
+    if not getattr(settings, "AGENT_PREFETCH_ENABLED", True):
+        return NULL_PREFETCHER
+    return Prefetcher(agent, executor)
@@ -0,0 +1,113 @@
+import json
+import logging
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.db import connections
+
+from apps.core.services.tracing import metrics
+
+logger = logging.getLogger("apps.core.profiling")
+
+# Query profile of every tool function call (Tool.run): queries, time spent in SQL and rows returned.
+# Each call is counted on /metrics and logged at DEBUG, a call over its query budget is logged as a
+# warning with its SQL. Budget of a tool: TOOL_QUERY_BUDGETS[name], else the query_budget it was
+# registered with, else TOOL_QUERY_BUDGET_DEFAULT (None for no budget). apps/core/testing.py asserts
+# the budgets in tests.
+
+# Transaction control depends on the caller (BEGIN in autocommit, SAVEPOINT inside a transaction),
+# only the statements of the tool itself are counted
+TRANSACTION_STATEMENTS = ("BEGIN", "SAVEPOINT", "RELEASE", "ROLLBACK", "COMMIT")
+
+
+@dataclass
+class QueryProfile:
+    tool: str
+    budget: int | None = None
+    queries: int = 0
+    sql_seconds: float = 0.0
+    # Rows handed back by the tool (list items, a page's items, 1 for a record), not rows scanned
+    rows: int = 0
+    statements: list = field(default_factory=list)
+
+    @property
+    def over_budget(self) -> bool:
+        return self.budget is not None and self.queries > self.budget
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            if not sql.lstrip().upper().startswith(TRANSACTION_STATEMENTS):
+                self.queries += 1
+                self.sql_seconds += time.perf_counter() - started
+                self.statements.append(sql)
+
+    def as_dict(self) -> dict:
+        return {
+            "tool": self.tool,
+            "queries": self.queries,
+            "budget": self.budget,
+            "sql_ms": round(self.sql_seconds * 1000, 3),
+            "rows": self.rows,
+        }
+
+
+def get_budget(tool) -> int | None:
+    budgets = getattr(settings, "TOOL_QUERY_BUDGETS", {})
+    if tool.name in budgets:
+        return budgets[tool.name]
+    if tool.query_budget is not None:
+        return tool.query_budget
+    return getattr(settings, "TOOL_QUERY_BUDGET_DEFAULT", None)
+
+
+def result_rows(result) -> int:
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(result, dict):
+        items = result.get("items")
+        return len(items) if isinstance(items, list) else 1
+    # A message ("No client found ...")
+    return 0
+
+
+@contextmanager
+def profile_queries(tool, using: str = "default"):
+    # Only sees queries made by the current thread (Django connections are per thread)
+    profile = QueryProfile(tool.name, get_budget(tool))
+    with connections[using].execute_wrapper(profile):
+        yield profile
+
+
+def record(profile: QueryProfile):
+    metrics.inc("agentc_db_queries_total", profile.queries, help="DB queries by tools.", tool=profile.tool)
+    metrics.inc("agentc_db_seconds_total", profile.sql_seconds, help="DB time by tools.", tool=profile.tool)
+    metrics.inc("agentc_tool_rows_total", profile.rows, help="Rows returned by tools.", tool=profile.tool)
+    if profile.over_budget:
+        metrics.inc(
+            "agentc_tool_over_query_budget_total", help="Tool calls over their query budget.", tool=profile.tool
+        )
+        logger.warning(
+            "Tool %s made %s queries, over its budget of %s (%.1f ms SQL):\n%s",
+            profile.tool, profile.queries, profile.budget, profile.sql_seconds * 1000,
+            "\n".join(profile.statements),
+        )
+    elif logger.isEnabledFor(logging.DEBUG):
+        logger.debug(json.dumps(profile.as_dict()))
+
+
+def run_profiled(tool, arguments: dict):
+    if not getattr(settings, "TOOL_QUERY_PROFILING", True):
+        return tool.function(**arguments)
+    with profile_queries(tool) as profile:
+        try:
+            result = tool.function(**arguments)
+            profile.rows = result_rows(result)
+        finally:
+            record(profile)
+    return result
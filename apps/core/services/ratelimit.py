@@ -0,0 +1,423 @@
+import asyncio
+import math
+import random
+import threading
+import time
+from functools import lru_cache, wraps
+from inspect import iscoroutinefunction
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.http import JsonResponse
+from django.utils.module_loading import import_string
+
+from apps.core.services.lru import LRUCache
+from apps.core.services.tracing import metrics
+
+# Admission control in front of the chat endpoints, every request there ends up calling OpenAI.
+#   1. Per-client token bucket (session, or IP without a session): over it -> 429 with Retry-After
+#   2. Global in-flight cap with a short bounded wait queue: queue full or wait timed out -> 503
+# A response holds its in-flight slot until it is done (a plain stream: until it is closed). A view whose
+# work outlives the response (the chat stream's background producer) takes the slot over with take_slot
+# and releases it when that work ends, so the cap bounds the calls to OpenAI, not open connections.
+
+
+class RateLimiter:
+    # Token bucket per key: `burst` requests at once, refilled at `rate` per second
+    def __init__(self, rate: float = 1.0, burst: int = 10):
+        self.rate = rate
+        self.burst = burst
+
+    def hit(self, key: str) -> float:
+        # Takes a token. Returns 0 when allowed, else the seconds until one is available.
+        raise NotImplementedError
+
+
+class LocalRateLimiter(RateLimiter):
+    # Buckets in process memory, every worker enforces the limit on its own
+    def __init__(self, rate: float = 1.0, burst: int = 10, max_keys: int = 10000):
+        super().__init__(rate, burst)
+        # A bucket untouched for this long is full again, no need to remember it
+        self.buckets = LRUCache(maxsize=max_keys, ttl=burst / rate)
+        self._lock = threading.Lock()
+
+    def hit(self, key: str) -> float:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self.buckets.get(key) or (self.burst, now)
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens < 1:
+                self.buckets.set(key, (tokens, now))
+                return (1 - tokens) / self.rate
+            self.buckets.set(key, (tokens - 1, now))
+            return 0.0
+
+
+class DjangoRateLimiter(RateLimiter):
+    # Shared by every worker using the same CACHES alias. Cache backends have no compare-and-set, so the
+    # bucket is approximated with counters over windows of burst/rate seconds (atomic add + incr):
+    # the same average rate, at most `burst` requests per window.
+    def __init__(self, rate: float = 1.0, burst: int = 10, alias: str = "default", key_prefix: str = "agentc"):
+        super().__init__(rate, burst)
+        self.alias = alias
+        self.key_prefix = key_prefix
+        self.window = burst / rate
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def hit(self, key: str) -> float:
+        now = time.time()
+        window = int(now // self.window)
+        cache_key = f"{self.key_prefix}:ratelimit:{key}:{window}"
+        self.cache.add(cache_key, 0, timeout=math.ceil(self.window) + 1)
+        try:
+            count = self.cache.incr(cache_key)
+        except ValueError:
+            # Expired between add and incr
+            self.cache.set(cache_key, 1, timeout=math.ceil(self.window) + 1)
+            count = 1
+        if count > self.burst:
+            return (window + 1) * self.window - now
+        return 0.0
+
+
+class Admission:
+    # At most max_in_flight requests at once, up to max_queue more wait (queue_timeout seconds) for a slot
+    def __init__(self, max_in_flight: int = 32, max_queue: int = 64, queue_timeout: float = 10.0):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+
+    def acquire(self):
+        # Returns a slot token, None when the request should be turned away
+        raise NotImplementedError
+
+    async def aacquire(self):
+        raise NotImplementedError
+
+    def release(self, slot):
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        return {}
+
+
+class LocalAdmission(Admission):
+    # Per process. Waiters are sync threads (WSGI, sync views) or asyncio tasks (ASGI), woken on release.
+    def __init__(self, max_in_flight: int = 32, max_queue: int = 64, queue_timeout: float = 10.0):
+        super().__init__(max_in_flight, max_queue, queue_timeout)
+        self.in_flight = 0
+        self.waiting = 0
+        self._cond = threading.Condition()
+        self._async_waiters = set()
+
+    def _try_acquire(self) -> bool:
+        if self.in_flight < self.max_in_flight:
+            self.in_flight += 1
+            return True
+        return False
+
+    def acquire(self):
+        with self._cond:
+            if self._try_acquire():
+                return True
+            if self.waiting >= self.max_queue:
+                return None
+            self.waiting += 1
+            try:
+                acquired = self._cond.wait_for(self._try_acquire, self.queue_timeout)
+            finally:
+                self.waiting -= 1
+            return True if acquired else None
+
+    async def aacquire(self):
+        deadline = time.monotonic() + self.queue_timeout
+        loop = asyncio.get_running_loop()
+        with self._cond:
+            if self._try_acquire():
+                return True
+            if self.waiting >= self.max_queue:
+                return None
+            self.waiting += 1
+        try:
+            while True:
+                waiter = asyncio.Event()
+                entry = (loop, waiter)
+                with self._cond:
+                    if self._try_acquire():
+                        return True
+                    self._async_waiters.add(entry)
+                remaining = deadline - time.monotonic()
+                try:
+                    if remaining <= 0:
+                        return None
+                    await asyncio.wait_for(waiter.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+                finally:
+                    with self._cond:
+                        self._async_waiters.discard(entry)
+        finally:
+            with self._cond:
+                self.waiting -= 1
+
+    def release(self, slot):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify()
+            for loop, waiter in self._async_waiters:
+                loop.call_soon_threadsafe(waiter.set)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {"in_flight": self.in_flight, "waiting": self.waiting}
+
+
+class DjangoAdmission(Admission):
+    # Cap shared by every worker using the same CACHES alias. Each request holds one of max_in_flight slot
+    # keys (cache.add is atomic), waiters poll for a free one. Slots expire after `lease` seconds, so a
+    # worker that died holding some doesn't shrink the cap for good.
+    def __init__(self, max_in_flight: int = 32, max_queue: int = 64, queue_timeout: float = 10.0,
+                 alias: str = "default", key_prefix: str = "agentc", lease: float = 600,
+                 poll_interval: float = 0.05):
+        super().__init__(max_in_flight, max_queue, queue_timeout)
+        self.alias = alias
+        self.key_prefix = key_prefix
+        self.lease = lease
+        self.poll_interval = poll_interval
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def _slot_key(self, slot: int) -> str:
+        return f"{self.key_prefix}:admission:slot:{slot}"
+
+    def _try_acquire(self):
+        # Random start, so concurrent requests don't all race for slot 0
+        start = random.randrange(self.max_in_flight)
+        for i in range(self.max_in_flight):
+            slot = (start + i) % self.max_in_flight
+            if self.cache.add(self._slot_key(slot), 1, timeout=self.lease):
+                return slot
+        return None
+
+    def _enter_queue(self) -> bool:
+        key = f"{self.key_prefix}:admission:waiting"
+        self.cache.add(key, 0, timeout=None)
+        try:
+            waiting = self.cache.incr(key)
+        except ValueError:
+            self.cache.set(key, 1, timeout=None)
+            waiting = 1
+        if waiting > self.max_queue:
+            self._leave_queue()
+            return False
+        return True
+
+    def _leave_queue(self):
+        try:
+            self.cache.decr(f"{self.key_prefix}:admission:waiting")
+        except ValueError:
+            pass
+
+    def acquire(self):
+        slot = self._try_acquire()
+        if slot is not None or not self._enter_queue():
+            return slot
+        try:
+            deadline = time.monotonic() + self.queue_timeout
+            while slot is None and time.monotonic() < deadline:
+                time.sleep(self.poll_interval)
+                slot = self._try_acquire()
+            return slot
+        finally:
+            self._leave_queue()
+
+    async def aacquire(self):
+        # Cache calls go to worker threads, the event loop only sleeps between polls
+        try_acquire = sync_to_async(self._try_acquire, thread_sensitive=False)
+        slot = await try_acquire()
+        if slot is not None or not await sync_to_async(self._enter_queue, thread_sensitive=False)():
+            return slot
+        try:
+            deadline = time.monotonic() + self.queue_timeout
+            while slot is None and time.monotonic() < deadline:
+                await asyncio.sleep(self.poll_interval)
+                slot = await try_acquire()
+            return slot
+        finally:
+            await sync_to_async(self._leave_queue, thread_sensitive=False)()
+
+    def release(self, slot):
+        self.cache.delete(self._slot_key(slot))
+
+    def stats(self) -> dict:
+        # Across all workers
+        keys = [self._slot_key(slot) for slot in range(self.max_in_flight)]
+        return {
+            "in_flight": len(self.cache.get_many(keys)),
+            "waiting": self.cache.get(f"{self.key_prefix}:admission:waiting", 0),
+        }
+
+
+def build(config: dict, default: str):
+    return import_string(config.get("BACKEND", default))(**config.get("OPTIONS", {}))
+
+
+@lru_cache(maxsize=None)
+def get_rate_limiter() -> RateLimiter | None:
+    config = getattr(settings, "CHAT_RATE_LIMIT", None)
+    return build(config, "apps.core.services.ratelimit.LocalRateLimiter") if config else None
+
+
+@lru_cache(maxsize=None)
+def get_admission() -> Admission | None:
+    config = getattr(settings, "CHAT_ADMISSION", None)
+    return build(config, "apps.core.services.ratelimit.LocalAdmission") if config else None
+
+
+def client_key(request) -> str:
+    # The session when the browser has one, the IP otherwise (first request, clients without cookies).
+    # Only a session that exists counts, a made-up cookie would otherwise get a fresh bucket every time.
+    session = getattr(request, "session", None)
+    if session is not None and session.session_key and session.exists(session.session_key):
+        return f"session:{session.session_key}"
+    address = request.META.get("REMOTE_ADDR", "")
+    if getattr(settings, "CHAT_RATE_LIMIT_TRUST_X_FORWARDED_FOR", False):
+        address = request.META.get("HTTP_X_FORWARDED_FOR", address).split(",")[0].strip()
+    return f"ip:{address}"
+
+
+def too_many_requests(retry_after: float) -> JsonResponse:
+    response = JsonResponse({"reply": "[Too many requests, please wait a moment and try again.]"}, status=429)
+    response["Retry-After"] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def server_busy() -> JsonResponse:
+    response = JsonResponse({"reply": "[The assistant is busy right now, please try again shortly.]"}, status=503)
+    response["Retry-After"] = str(getattr(settings, "CHAT_BUSY_RETRY_AFTER", 5))
+    return response
+
+
+def check_rate(request):
+    limiter = get_rate_limiter()
+    if limiter is None:
+        return None
+    retry_after = limiter.hit(client_key(request))
+    if retry_after:
+        metrics.inc("agentc_requests_rejected_total", help="Chat requests turned away", reason="rate_limit")
+        return too_many_requests(retry_after)
+    return None
+
+
+def rejected_busy():
+    metrics.inc("agentc_requests_rejected_total", help="Chat requests turned away", reason="busy")
+    return server_busy()
+
+
+class HeldSlot:
+    # An acquired admission slot, released once however many paths try to
+    def __init__(self, admission: Admission, slot):
+        self.admission = admission
+        self.slot = slot
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self.admission.release(self.slot)
+
+
+def take_slot(request) -> HeldSlot | None:
+    # The caller now owns the request's slot and must release() it, None when the request holds none
+    # (exempt, admission off). The view's response then no longer holds it.
+    held = getattr(request, "admission_slot", None)
+    request.admission_slot = None
+    return held
+
+
+def hold_slot(response, admission, slot):
+    # Releases the slot once the response is done: right away, or when a stream is closed
+    # (finished, or the client went away)
+    if not response.streaming:
+        admission.release(slot)
+        return response
+
+    content = response.streaming_content
+    if response.is_async:
+        async def released():
+            try:
+                async for chunk in content:
+                    yield chunk
+            finally:
+                admission.release(slot)
+    else:
+        def released():
+            try:
+                yield from content
+            finally:
+                admission.release(slot)
+
+    response.streaming_content = released()
+    return response
+
+
+def rate_limited(exempt=None):
+    # View decorator, sync or async views. exempt(request) -> True skips both checks
+    # (requests that never reach the model: page loads, stream reconnects).
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                if exempt and exempt(request):
+                    return await view(request, *args, **kwargs)
+                rejected = await sync_to_async(check_rate)(request)
+                if rejected:
+                    return rejected
+                admission = get_admission()
+                if admission is None:
+                    return await view(request, *args, **kwargs)
+                slot = await admission.aacquire()
+                if slot is None:
+                    return rejected_busy()
+                held = request.admission_slot = HeldSlot(admission, slot)
+                try:
+                    response = await view(request, *args, **kwargs)
+                except BaseException:
+                    held.release()
+                    raise
+                if request.admission_slot is None:
+                    # Taken over by the view
+                    return response
+                return hold_slot(response, admission, slot)
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if exempt and exempt(request):
+                return view(request, *args, **kwargs)
+            rejected = check_rate(request)
+            if rejected:
+                return rejected
+            admission = get_admission()
+            if admission is None:
+                return view(request, *args, **kwargs)
+            slot = admission.acquire()
+            if slot is None:
+                return rejected_busy()
+            held = request.admission_slot = HeldSlot(admission, slot)
+            try:
+                response = view(request, *args, **kwargs)
+            except BaseException:
+                held.release()
+                raise
+            if request.admission_slot is None:
+                return response
+            return hold_slot(response, admission, slot)
+        return wrapper
+    return decorator
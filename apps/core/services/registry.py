@@ -0,0 +1,147 @@
+import hashlib
+import json
+from dataclasses import dataclass
+from typing import Callable
+
+from pydantic import BaseModel
+
+from apps.core.services.profiling import run_profiled
+from apps.core.services.tool_cache import get_tool_cache
+
+
+@dataclass(frozen=True)
+class Tool:
+    name: str
+    function: Callable
+    params_model: type[BaseModel]
+    description: str
+    # Read-only tools list the data they read, their results are cached until one of these is invalidated
+    cache_tags: tuple = ()
+    # Tools with side effects list the data they change
+    invalidates: tuple = ()
+    # Slow or side-effecting tools run on the job queue, the model gets a job id right away
+    deferred: bool = False
+    # What the tool is about (client, team_member, ...), the router only offers the groups a turn needs
+    group: str = ""
+    # Queries one call may make, checked by services/profiling.py (None: TOOL_QUERY_BUDGET_DEFAULT)
+    query_budget: int | None = None
+
+    def run(self, **arguments):
+        # Every call of the function (dispatch, job workers) goes through here, profiled
+        return run_profiled(self, arguments)
+
+    def schema(self) -> dict:
+        return {
+            "type": "function",
+            "function": {
+                "name": self.name,
+                "description": self.description,
+                "parameters": self.params_model.model_json_schema(),
+            },
+        }
+
+
+class ToolRegistry:
+    # Every tool is declared once, next to its implementation, with the pydantic model of its arguments.
+    # The registry is frozen at startup (CoreConfig.ready), schemas are built exactly once per process.
+    def __init__(self):
+        self._tools = {}
+        self._schemas = None
+        self._schema_version = None
+        self._group_schemas = {}
+
+    def tool(
+        self,
+        name: str,
+        params_model: type[BaseModel],
+        description: str,
+        cache_tags: tuple = (),
+        invalidates: tuple = (),
+        deferred: bool = False,
+        group: str | None = None,
+        query_budget: int | None = None,
+    ):
+        def decorator(function):
+            if self._schemas is not None:
+                raise RuntimeError(f"Cannot register tool '{name}', the tool registry is already frozen.")
+            if name in self._tools:
+                raise ValueError(f"Tool '{name}' is already registered.")
+            # Defaults to the module the tool is declared in (functions/client.py -> "client")
+            tool_group = group or function.__module__.rsplit(".", 1)[-1]
+            self._tools[name] = Tool(
+                name, function, params_model, description, cache_tags, invalidates, deferred, tool_group,
+                query_budget,
+            )
+            return function
+        return decorator
+
+    def freeze(self):
+        if self._schemas is None:
+            self._schemas = tuple(tool.schema() for tool in self._tools.values())
+            self._schema_version = hashlib.sha1(
+                json.dumps(self._schemas, sort_keys=True).encode()
+            ).hexdigest()[:12]
+
+    def schema_version(self) -> str:
+        # Changes whenever a tool, its description or its parameters change
+        self.freeze()
+        return self._schema_version
+
+    def cache_tags(self) -> list:
+        # Every kind of data the read tools depend on
+        return sorted({tag for tool in self._tools.values() for tag in tool.cache_tags})
+
+    def schemas(self) -> list:
+        # Shared by every Agent, callers must not mutate the dicts
+        self.freeze()
+        return list(self._schemas)
+
+    def groups(self) -> list:
+        return sorted({tool.group for tool in self._tools.values()})
+
+    def group_schemas(self, groups) -> list:
+        # Schemas of the tools in these groups, in registration order, built once per set of groups
+        self.freeze()
+        groups = frozenset(groups)
+        if groups not in self._group_schemas:
+            self._group_schemas[groups] = tuple(
+                schema for tool, schema in zip(self._tools.values(), self._schemas) if tool.group in groups
+            )
+        return list(self._group_schemas[groups])
+
+    def names(self) -> list:
+        return list(self._tools)
+
+    def get(self, name: str) -> Tool:
+        return self._tools[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._tools
+
+    def dispatch(self, name: str, arguments: dict, conversation_id: str | None = None, call_id: str | None = None):
+        # Raises KeyError for unknown tools and pydantic.ValidationError for bad arguments,
+        # both before the tool (and its DB queries) runs. conversation_id and call_id (the model's
+        # tool_call id) tell a deferred call made again from a new one.
+        tool = self._tools[name]
+        params = tool.params_model.model_validate(arguments)
+        arguments = params.model_dump(exclude_unset=True)
+
+        if tool.deferred:
+            # Imported here, the job queue itself needs the registry to run the tool later
+            from apps.core.services.jobs import defer
+            return defer(name, arguments, conversation_id, call_id)
+
+        if tool.cache_tags:
+            # Keyed on the full validated params, so omitted and explicit default arguments share an entry
+            return get_tool_cache().get_or_call(
+                name, params.model_dump(), tool.cache_tags, lambda: tool.run(**arguments)
+            )
+
+        try:
+            return tool.run(**arguments)
+        finally:
+            if tool.invalidates:
+                get_tool_cache().invalidate(*tool.invalidates)
+
+
+registry = ToolRegistry()
@@ -0,0 +1,100 @@
+import re
+from dataclasses import dataclass
+
+from django.conf import settings
+
+from apps.core.services.registry import registry
+from apps.core.services.tracing import metrics
+
+# Per-turn choice of model tier and tools, by local rules (no extra model call):
+#   - trivial turns (greetings, thanks, goodbyes) go to the "fast" tier, usually without any tools
+#   - other turns go to the "default" tier with only the tool groups they are about: keywords in the
+#     user input plus the groups already used in the conversation, every tool when nothing matches
+
+TRIVIAL_RE = re.compile(
+    r"(hi|hello|hey|good (morning|afternoon|evening)|thanks?( you)?( so much| a lot| again)?|thx|ty|cheers"
+    r"|much appreciated|great|awesome|perfect|nice|cool|bye|goodbye|see you|have a (good|nice) (day|one))"
+    r"( there| team)?"
+)
+# Trivial turns are short, anything longer goes through the default tier whatever it looks like
+TRIVIAL_MAX_CHARS = 60
+
+EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+GROUP_KEYWORDS = {
+    "client": re.compile(r"\b(clients?|customers?|accounts?|compan(y|ies))\b", re.IGNORECASE),
+    "team_member": re.compile(
+        r"\b(team|members?|employees?|staff|colleagues?|people|hired|joined|countr(y|ies))\b", re.IGNORECASE
+    ),
+    "communication": re.compile(r"\b(e-?mails?|send|mail|notify|write to)\b", re.IGNORECASE),
+    "job": re.compile(r"\b(jobs?|status|queued|delivered)\b", re.IGNORECASE),
+}
+# Groups whose tools lead to another group: a queued email returns a job id to check on
+GROUP_COMPANIONS = {"communication": ("job",)}
+
+
+@dataclass(frozen=True)
+class Route:
+    tier: str
+    model: str
+    # Tool schemas offered to the model, empty for a turn answered without tools
+    tools: list
+    groups: tuple = ()
+
+
+def get_tier(name: str) -> dict:
+    tier = getattr(settings, "AGENT_MODEL_TIERS", {}).get(name) or {}
+    return {"model": tier.get("model") or settings.OPENAI_MODEL, "tools": tier.get("tools", True)}
+
+
+def is_trivial(user_input: str) -> bool:
+    # Every part between punctuation is a greeting/thanks/goodbye: "Thanks, bye!" but not "thanks, and Bob?"
+    text = (user_input or "").strip().lower()
+    if not text or len(text) > TRIVIAL_MAX_CHARS:
+        return False
+    parts = [" ".join(part.split()) for part in re.split(r"[^\w\s']+", text)]
+    parts = [part for part in parts if part]
+    return bool(parts) and all(TRIVIAL_RE.fullmatch(part) for part in parts)
+
+
+def history_groups(history: list) -> set:
+    groups = set()
+    for message in history:
+        for tool_call in message.get("tool_calls") or []:
+            name = tool_call["function"]["name"]
+            if name in registry:
+                groups.add(registry.get(name).group)
+    return groups
+
+
+def relevant_groups(user_input: str, history: list) -> set | None:
+    # None when the turn gives nothing to go on, all tools are offered then
+    groups = {group for group, keywords in GROUP_KEYWORDS.items() if keywords.search(user_input or "")}
+    if EMAIL_RE.search(user_input or ""):
+        groups |= {"client", "team_member"}
+    groups |= history_groups(history)
+    for group in list(groups):
+        groups.update(GROUP_COMPANIONS.get(group, ()))
+    return groups or None
+
+
+def route_turn(user_input: str, history: list) -> Route:
+    if not getattr(settings, "AGENT_ROUTING_ENABLED", True):
+        return Route("default", get_tier("default")["model"], registry.schemas())
+
+    # Without a fast tier configured, trivial turns are routed like any other
+    fast = "fast" in getattr(settings, "AGENT_MODEL_TIERS", {})
+    name = "fast" if fast and is_trivial(user_input) else "default"
+    tier = get_tier(name)
+    groups = None
+    if name == "default" and getattr(settings, "AGENT_TOOL_PRUNING", True):
+        groups = relevant_groups(user_input, history)
+
+    if not tier["tools"]:
+        tools = []
+    elif groups is None:
+        tools = registry.schemas()
+    else:
+        tools = registry.group_schemas(groups)
+
+    metrics.inc("agentc_routes_total", help="Turns by model tier.", tier=name)
+    return Route(name, tier["model"], tools, tuple(sorted(groups or ())))
@@ -1,11 +1,49 @@
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field
+from typing import List, Literal, Optional
+
+# Largest list accepted by the batch tools, bigger imports take several calls
+BATCH_MAX_ITEMS = 500
 
 class ListClientsParams(BaseModel):
-    pass
+    limit: Optional[int] = Field(None, ge=1, le=200, description="Page size, defaults to 50.")
+    cursor: Optional[str] = Field(None, description="next_cursor from the previous page.")
+    name_prefix: Optional[str] = Field(None, description="Only clients whose name starts with this.")
+    fields: Optional[List[Literal["name", "description", "email"]]] = Field(
+        None, description="Only return these fields, defaults to all."
+    )
 
 class ListTeamMembersParams(BaseModel):
-    pass
+    limit: Optional[int] = Field(None, ge=1, le=200, description="Page size, defaults to 50.")
+    cursor: Optional[str] = Field(None, description="next_cursor from the previous page.")
+    country: Optional[str] = None
+    name_prefix: Optional[str] = Field(None, description="Matches the start of first or last name.")
+    joined_after: Optional[str] = Field(None, description="YYYY-MM-DD, inclusive.")
+    joined_before: Optional[str] = Field(None, description="YYYY-MM-DD, inclusive.")
+    fields: Optional[List[Literal["first_name", "last_name", "email", "country", "joined_on"]]] = Field(
+        None, description="Only return these fields, defaults to all."
+    )
+
+class CountClientsParams(BaseModel):
+    group_by: Optional[Literal["email_domain"]] = Field(None, description="Omit for a single total.")
+    name_prefix: Optional[str] = Field(None, description="Only clients whose name starts with this.")
+
+class CountTeamMembersParams(BaseModel):
+    group_by: Optional[Literal["country", "year", "month"]] = Field(
+        None, description="Count per country, or per year/month joined. Omit for a single total."
+    )
+    country: Optional[str] = None
+    name_prefix: Optional[str] = Field(None, description="Matches the start of first or last name.")
+    joined_after: Optional[str] = Field(None, description="YYYY-MM-DD, inclusive.")
+    joined_before: Optional[str] = Field(None, description="YYYY-MM-DD, inclusive.")
+
+class SearchClientsParams(BaseModel):
+    query: str = Field(..., min_length=1, description="Words to look for in name, description or email.")
+    limit: Optional[int] = Field(None, ge=1, le=50, description="Defaults to 10.")
+
+class SearchTeamMembersParams(BaseModel):
+    query: str = Field(..., min_length=1, description="Words to look for in first/last name, country or email.")
+    country: Optional[str] = None
+    limit: Optional[int] = Field(None, ge=1, le=50, description="Defaults to 10.")
 
 class GetTeamMemberParams(BaseModel):
     email: str
@@ -43,77 +81,28 @@ class UpdateClientParams(BaseModel):
 class DeleteClientParams(BaseModel):
     email: str
 
+class AddClientsParams(BaseModel):
+    clients: List[AddClientParams] = Field(..., min_length=1, max_length=BATCH_MAX_ITEMS)
+
+class UpdateClientsParams(BaseModel):
+    clients: List[UpdateClientParams] = Field(..., min_length=1, max_length=BATCH_MAX_ITEMS)
+
+class DeleteClientsParams(BaseModel):
+    emails: List[str] = Field(..., min_length=1, max_length=BATCH_MAX_ITEMS)
+
+class AddTeamMembersParams(BaseModel):
+    team_members: List[AddTeamMemberParams] = Field(..., min_length=1, max_length=BATCH_MAX_ITEMS)
+
+class UpdateTeamMembersParams(BaseModel):
+    team_members: List[UpdateTeamMemberParams] = Field(..., min_length=1, max_length=BATCH_MAX_ITEMS)
+
+class DeleteTeamMembersParams(BaseModel):
+    emails: List[str] = Field(..., min_length=1, max_length=BATCH_MAX_ITEMS)
+
 class SendEmailParams(BaseModel):
     to_email: str
     subject: str
     body: str
 
-def get_schemas():
-    return [
-        {
-            "type": "function",
-            "name": "list_clients",
-            "description": "Returns a list of all clients.",
-            "parameters": ListClientsParams.model_json_schema()
-        },
-        {
-            "type": "function",
-            "name": "list_team_members",
-            "description": "Returns a list of all team members.",
-            "parameters": ListTeamMembersParams.model_json_schema()
-        },
-        {
-            "type": "function",
-            "name": "get_team_member",
-            "description": "Get details of a team member by email.",
-            "parameters": GetTeamMemberParams.model_json_schema()
-        },
-        {
-            "type": "function",
-            "name": "add_team_member",
-            "description": "Add a new team member.",
-            "parameters": AddTeamMemberParams.model_json_schema()
-        },
-        {
-            "type": "function",
-            "name": "update_team_member",
-            "description": "Update an existing team member.",
-            "parameters": UpdateTeamMemberParams.model_json_schema()
-        },
-        {
-            "type": "function",
-            "name": "delete_team_member",
-            "description": "Delete a team member by email.",
-            "parameters": DeleteTeamMemberParams.model_json_schema()
-        },
-        {
-            "type": "function",
-            "name": "get_client",
-            "description": "Get details of a client by email.",
-            "parameters": GetClientParams.model_json_schema()
-        },
-        {
-            "type": "function",
-            "name": "add_client",
-            "description": "Add a new client.",
-            "parameters": AddClientParams.model_json_schema()
-        },
-        {
-            "type": "function",
-            "name": "update_client",
-            "description": "Update an existing client.",
-            "parameters": UpdateClientParams.model_json_schema()
-        },
-        {
-            "type": "function",
-            "name": "delete_client",
-            "description": "Delete a client by email.",
-            "parameters": DeleteClientParams.model_json_schema()
-        },
-        {
-            "type": "function",
-            "name": "send_email",
-            "description": "Simulate sending an email.",
-            "parameters": SendEmailParams.model_json_schema()
-        },
-    ]
\ No newline at end of file
+class GetJobStatusParams(BaseModel):
+    job_id: int
@@ -0,0 +1,57 @@
+import re
+from functools import lru_cache
+
+from django.db import connection
+from django.db.models import Q
+
+# Full-text search over clients and team members.
+# On SQLite, FTS5 tables created in migration 0004 (kept in sync by triggers on every insert, update and
+# delete, bulk writes included) give bm25-ranked results. Other databases fall back to icontains.
+
+DEFAULT_SEARCH_LIMIT = 10
+
+
+@lru_cache(maxsize=None)
+def _fts_tables(vendor: str, name: str) -> frozenset:
+    # Keyed on the database name, so test databases are looked up separately
+    if vendor != "sqlite":
+        return frozenset()
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE '%_fts'")
+        return frozenset(row[0] for row in cursor.fetchall())
+
+
+def fts_table(table: str) -> str | None:
+    fts = f"{table}_fts"
+    return fts if fts in _fts_tables(connection.vendor, str(connection.settings_dict["NAME"])) else None
+
+
+def search_terms(query: str) -> list:
+    return re.findall(r"\w+", query.casefold())[:10]
+
+
+def fts_match(terms: list) -> str:
+    # Any term, each as a prefix ("acm" finds "Acme"), documents matching more terms rank higher
+    return " OR ".join(f'"{term}"*' for term in terms)
+
+
+def fts_search(table: str, fts: str, columns: list, terms: list, limit: int, weights: tuple,
+               where: str = "", params: tuple = ()) -> list:
+    # Ranked rows straight from the FTS index joined back to the model table, in a single query
+    select = ", ".join(f"t.{column}" for column in columns)
+    sql = (
+        f"SELECT {select} FROM {fts} JOIN {table} t ON t.id = {fts}.rowid "
+        f"WHERE {fts} MATCH %s {where} "
+        f"ORDER BY bm25({fts}, {', '.join(str(weight) for weight in weights)}) LIMIT %s"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [fts_match(terms), *params, limit])
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def icontains_filter(fields: list, terms: list) -> Q:
+    condition = Q()
+    for term in terms:
+        for field in fields:
+            condition |= Q(**{f"{field}__icontains": term})
+    return condition
@@ -0,0 +1,158 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+# Django cache backend on a standalone SQLite file, shared by every process on the host:
+#   CACHES = {'default': {'BACKEND': 'apps.core.services.sqlite_cache.SQLiteCache', 'LOCATION': '/path/cache.sqlite3'}}
+# Unlike the file and database backends, add() and incr() are single statements, so they stay atomic
+# across workers (rate limits, admission slots, tool cache generations rely on that).
+# Integers are stored as SQLite integers (incr in SQL), everything else pickled.
+
+# Django builds a backend instance per thread (per context under ASGI), connections outlive them:
+# one per thread and file, the table is created once per file and process
+_connections = threading.local()
+_created = set()
+_created_lock = threading.Lock()
+# Writes by this process, a sweep every cull_every (not exact across threads, it doesn't need to be)
+_writes = 0
+
+
+def _forget_connections():
+    # A connection inherited through fork() must not be used by the child
+    global _connections
+    _connections = threading.local()
+
+
+os.register_at_fork(after_in_child=_forget_connections)
+
+
+class SQLiteCache(BaseCache):
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+    # Writes between two sweeps of expired rows
+    cull_every = 500
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self.path = str(location)
+
+    def _connect(self):
+        # Autocommit, every statement is its own transaction
+        connections = getattr(_connections, "by_path", None)
+        if connections is None:
+            connections = _connections.by_path = {}
+        connection = connections.get(self.path)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            with _created_lock:
+                if self.path not in _created:
+                    connection.execute(
+                        "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB, expires REAL)"
+                    )
+                    _created.add(self.path)
+            connections[self.path] = connection
+        return connection
+
+    def _encode(self, value):
+        if type(value) is int and -(2 ** 63) <= value < 2 ** 63:
+            return value
+        return pickle.dumps(value, self.pickle_protocol)
+
+    @staticmethod
+    def _decode(value):
+        return value if isinstance(value, int) else pickle.loads(value)
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        row = self._connect().execute(
+            "SELECT value FROM cache WHERE key = ? AND (expires IS NULL OR expires > ?)",
+            (key, time.time()),
+        ).fetchone()
+        return default if row is None else self._decode(row[0])
+
+    def get_many(self, keys, version=None):
+        keys = {self.make_and_validate_key(key, version=version): key for key in keys}
+        if not keys:
+            return {}
+        rows = self._connect().execute(
+            f"SELECT key, value FROM cache WHERE key IN ({', '.join('?' * len(keys))}) "
+            "AND (expires IS NULL OR expires > ?)",
+            (*keys, time.time()),
+        ).fetchall()
+        return {keys[key]: self._decode(value) for key, value in rows}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self._connect().execute(
+            "INSERT INTO cache (key, value, expires) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires = excluded.expires",
+            (key, self._encode(value), self.get_backend_timeout(timeout)),
+        )
+        self._wrote()
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        # Only replaces an expired row, True when this call stored the value
+        key = self.make_and_validate_key(key, version=version)
+        cursor = self._connect().execute(
+            "INSERT INTO cache (key, value, expires) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires = excluded.expires "
+            "WHERE cache.expires IS NOT NULL AND cache.expires <= ?",
+            (key, self._encode(value), self.get_backend_timeout(timeout), time.time()),
+        )
+        self._wrote()
+        return cursor.rowcount == 1
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        cursor = self._connect().execute(
+            "UPDATE cache SET expires = ? WHERE key = ? AND (expires IS NULL OR expires > ?)",
+            (self.get_backend_timeout(timeout), key, time.time()),
+        )
+        return cursor.rowcount == 1
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        row = self._connect().execute(
+            "UPDATE cache SET value = value + ? "
+            "WHERE key = ? AND (expires IS NULL OR expires > ?) AND typeof(value) = 'integer' "
+            "RETURNING value",
+            (delta, key, time.time()),
+        ).fetchone()
+        if row is None:
+            raise ValueError("Key '%s' not found" % key)
+        return row[0]
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        cursor = self._connect().execute("DELETE FROM cache WHERE key = ?", (key,))
+        return cursor.rowcount == 1
+
+    def clear(self):
+        self._connect().execute("DELETE FROM cache")
+
+    def close(self, **kwargs):
+        # Called at the end of every request, the per-thread connection is kept
+        pass
+
+    def _wrote(self):
+        global _writes
+        _writes += 1
+        if _writes % self.cull_every == 0:
+            self._cull()
+
+    def _cull(self):
+        # Expired rows first, then the cull_frequency share closest to expiring once over max_entries
+        connection = self._connect()
+        connection.execute("DELETE FROM cache WHERE expires IS NOT NULL AND expires <= ?", (time.time(),))
+        count = connection.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        if count > self._max_entries and self._cull_frequency:
+            connection.execute(
+                "DELETE FROM cache WHERE key IN ("
+                "SELECT key FROM cache WHERE expires IS NOT NULL ORDER BY expires LIMIT ?)",
+                (count // self._cull_frequency,),
+            )
@@ -0,0 +1,369 @@
+import asyncio
+import json
+import logging
+import queue
+import threading
+import time
+from functools import lru_cache
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+from apps.core.services.lru import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# Server-sent events protocol of /stream-chat/:
+#   id: <n>            increasing per stream, sent back by the browser as Last-Event-ID on reconnect
+#   event: <type>      token | tool_start | tool_result | done | error
+#   data: <json>       one line, so newlines in the content can't break the framing
+# Events are kept in a short-lived per-stream buffer. A reconnect replays what was missed from there
+# and then follows the live stream, the model is never called again for the same turn.
+
+EVENT_TYPES = ("token", "tool_start", "tool_result", "done", "error")
+
+
+def format_event(event_id: int, event: str, data) -> str:
+    return f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+def format_keepalive() -> str:
+    # SSE comment, ignored by EventSource, keeps proxies from closing an idle connection (tool calls)
+    return ": keepalive\n\n"
+
+
+class TokenCoalescer:
+    # Merges tiny model deltas into fewer token events. The first delta goes out at once (time to
+    # first token), the rest are held until max_chars are buffered or max_delay has passed. Text held
+    # while no delta comes (a model pause, a tool call) is flushed at due_at() by StreamRecord.wait.
+    def __init__(self, max_chars: int = 64, max_delay: float = 0.05):
+        self.max_chars = max_chars
+        self.max_delay = max_delay
+        self.buffer = ""
+        self.started = None
+        self.sent_first = False
+
+    def add(self, text: str) -> str | None:
+        if not self.buffer:
+            self.started = time.monotonic()
+        self.buffer += text
+        if (
+            not self.sent_first
+            or len(self.buffer) >= self.max_chars
+            or time.monotonic() - self.started >= self.max_delay
+        ):
+            self.sent_first = True
+            return self.flush()
+        return None
+
+    def flush(self) -> str | None:
+        text, self.buffer = self.buffer, ""
+        return text or None
+
+    def due_at(self) -> float | None:
+        # time.monotonic() by which the held text must go out, None when nothing is held
+        return self.started + self.max_delay if self.buffer else None
+
+
+class StreamRecord:
+    # Events of one streamed turn. Written by the producer, read by any number of followers,
+    # sync (threads) or async (event loops).
+    def __init__(self):
+        self.events = []
+        self.done = False
+        self.followers = 0
+        self.detached_at = time.monotonic()
+        # Strong reference to the producer task/thread while it runs
+        self.producer = None
+        # Set by the producer, token text of publish() goes through it
+        self.coalescer = None
+        # Reentrant: publish() appends while holding it
+        self._cond = threading.Condition(threading.RLock())
+        self._async_waiters = set()
+
+    def append(self, event: str, data) -> int:
+        with self._cond:
+            self.events.append((len(self.events) + 1, event, data))
+            self._notify()
+            return len(self.events)
+
+    def publish(self, event: str, data):
+        # Producer side. Anything but a token first flushes the held text, so events stay in order.
+        with self._cond:
+            if event != "token":
+                self._flush_tokens()
+                self.append(event, data)
+            elif self.coalescer is None:
+                self.append("token", {"text": data})
+            else:
+                held = self.coalescer.buffer
+                text = self.coalescer.add(data)
+                if text:
+                    self.append("token", {"text": text})
+                elif not held:
+                    # Followers now have a deadline to wait for
+                    self._notify()
+
+    def _flush_tokens(self):
+        text = self.coalescer.flush() if self.coalescer is not None else None
+        if text:
+            self.append("token", {"text": text})
+
+    def _flush_due(self, now: float) -> float | None:
+        # Flushes held text past its deadline, else returns the seconds left until it is due
+        due = self.coalescer.due_at() if self.coalescer is not None else None
+        if due is None:
+            return None
+        if due <= now:
+            self._flush_tokens()
+            return None
+        return due - now
+
+    def finish(self):
+        with self._cond:
+            self.done = True
+            self._notify()
+
+    def _notify(self):
+        self._cond.notify_all()
+        for loop, waiter in self._async_waiters:
+            loop.call_soon_threadsafe(waiter.set)
+
+    def attach(self):
+        with self._cond:
+            self.followers += 1
+
+    def detach(self):
+        with self._cond:
+            self.followers -= 1
+            self.detached_at = time.monotonic()
+
+    def abandoned(self, grace: float) -> bool:
+        # Nobody has been listening for `grace` seconds, the producer may stop
+        with self._cond:
+            return self.followers <= 0 and time.monotonic() - self.detached_at > grace
+
+    def wait(self, after_id: int, timeout: float) -> tuple:
+        # (events with id > after_id, done), blocks up to timeout while there is nothing new.
+        # Wakes up for the coalescer's deadline too, the producer may be stuck on a slow model or tool.
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                due_in = self._flush_due(now)
+                remaining = deadline - now
+                if self.done or len(self.events) > after_id or remaining <= 0:
+                    return self.events[after_id:], self.done
+                self._cond.wait(min(remaining, due_in) if due_in is not None else remaining)
+
+    async def await_events(self, after_id: int, timeout: float) -> tuple:
+        deadline = time.monotonic() + timeout
+        loop = asyncio.get_running_loop()
+        while True:
+            waiter = asyncio.Event()
+            entry = (loop, waiter)
+            with self._cond:
+                now = time.monotonic()
+                due_in = self._flush_due(now)
+                remaining = deadline - now
+                if self.done or len(self.events) > after_id or remaining <= 0:
+                    return self.events[after_id:], self.done
+                self._async_waiters.add(entry)
+            try:
+                await asyncio.wait_for(waiter.wait(), min(remaining, due_in) if due_in is not None else remaining)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                with self._cond:
+                    self._async_waiters.discard(entry)
+
+
+class StreamBuffer:
+    # Where StreamRecords live between the producer and (re)connecting followers
+    def create(self, key: str) -> StreamRecord:
+        raise NotImplementedError
+
+    def get(self, key: str) -> StreamRecord | None:
+        raise NotImplementedError
+
+
+class LocalStreamBuffer(StreamBuffer):
+    # In-process, resume only works against the worker that ran the turn
+    def __init__(self, max_streams: int = 1000, ttl: float = 300):
+        self.records = LRUCache(maxsize=max_streams, ttl=ttl)
+
+    def create(self, key: str) -> StreamRecord:
+        record = StreamRecord()
+        self.records.set(key, record)
+        return record
+
+    def get(self, key: str) -> StreamRecord | None:
+        return self.records.get(key)
+
+
+class SharedStreamRecord(StreamRecord):
+    # Producer side of a DjangoStreamBuffer stream: local followers are woken as usual, every event
+    # is also copied to the cache (off the producer's thread) for followers in other processes
+    def __init__(self, buffer, key: str):
+        super().__init__()
+        self.buffer = buffer
+        self.key = key
+        self.created_at = time.time()
+        self._remote_checked = 0.0
+        self._remote_abandoned = False
+        buffer.mirror(key, [("count", 0)])
+
+    def append(self, event: str, data) -> int:
+        event_id = super().append(event, data)
+        # The event before the count, a reader never sees an id it can't fetch
+        self.buffer.mirror(self.key, [(f"event:{event_id}", (event, data)), ("count", event_id)])
+        return event_id
+
+    def finish(self):
+        super().finish()
+        self.buffer.mirror(self.key, [("done", 1)])
+
+    def abandoned(self, grace: float) -> bool:
+        if not super().abandoned(grace):
+            return False
+        # Nobody here, a follower may still be attached on another worker (checked once a second)
+        now = time.monotonic()
+        if now - self._remote_checked >= 1.0:
+            self._remote_checked = now
+            followers_key = self.buffer.make_key(self.key, "followers")
+            detached_key = self.buffer.make_key(self.key, "detached")
+            state = self.buffer.cache.get_many([followers_key, detached_key])
+            self._remote_abandoned = (
+                state.get(followers_key, 0) <= 0
+                and time.time() - state.get(detached_key, self.created_at) > grace
+            )
+        return self._remote_abandoned
+
+
+class RemoteStreamRecord:
+    # Follower side in a process other than the producer's, polls the cache for new events
+    def __init__(self, buffer, key: str):
+        self.buffer = buffer
+        self.key = key
+
+    def attach(self):
+        key = self.buffer.make_key(self.key, "followers")
+        self.buffer.cache.add(key, 0, timeout=self.buffer.ttl)
+        try:
+            self.buffer.cache.incr(key)
+        except ValueError:
+            self.buffer.cache.set(key, 1, timeout=self.buffer.ttl)
+
+    def detach(self):
+        cache = self.buffer.cache
+        try:
+            cache.decr(self.buffer.make_key(self.key, "followers"))
+        except ValueError:
+            pass
+        cache.set(self.buffer.make_key(self.key, "detached"), time.time(), timeout=self.buffer.ttl)
+
+    def read(self, after_id: int) -> tuple:
+        cache, make_key = self.buffer.cache, self.buffer.make_key
+        state = cache.get_many([make_key(self.key, "count"), make_key(self.key, "done")])
+        count = state.get(make_key(self.key, "count"), 0)
+        done = bool(state.get(make_key(self.key, "done")))
+        keys = [make_key(self.key, f"event:{event_id}") for event_id in range(after_id + 1, count + 1)]
+        found = cache.get_many(keys) if keys else {}
+        events = []
+        for event_id, key in enumerate(keys, start=after_id + 1):
+            if key not in found:
+                # Expired, or the count was read before the event: stop, the rest comes next time
+                return events, False
+            events.append((event_id, *found[key]))
+        return events, done
+
+    def wait(self, after_id: int, timeout: float) -> tuple:
+        deadline = time.monotonic() + timeout
+        while True:
+            events, done = self.read(after_id)
+            remaining = deadline - time.monotonic()
+            if events or done or remaining <= 0:
+                return events, done
+            time.sleep(min(self.buffer.poll_interval, remaining))
+
+    async def await_events(self, after_id: int, timeout: float) -> tuple:
+        deadline = time.monotonic() + timeout
+        read = sync_to_async(self.read, thread_sensitive=False)
+        while True:
+            events, done = await read(after_id)
+            remaining = deadline - time.monotonic()
+            if events or done or remaining <= 0:
+                return events, done
+            await asyncio.sleep(min(self.buffer.poll_interval, remaining))
+
+
+class DjangoStreamBuffer(StreamBuffer):
+    # Streams run by this process are kept locally as well. A reconnect landing on another worker
+    # finds the stream in the cache (any CACHES alias shared by the workers) and follows it from there.
+    def __init__(
+        self,
+        alias: str = "default",
+        max_streams: int = 1000,
+        ttl: float = 300,
+        key_prefix: str = "agentc",
+        poll_interval: float = 0.05,
+    ):
+        self.alias = alias
+        self.ttl = ttl
+        self.key_prefix = key_prefix
+        self.poll_interval = poll_interval
+        self.local = LocalStreamBuffer(max_streams=max_streams, ttl=ttl)
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def make_key(self, key: str, part: str) -> str:
+        return f"{self.key_prefix}:stream:{key}:{part}"
+
+    def create(self, key: str) -> StreamRecord:
+        record = SharedStreamRecord(self, key)
+        self.local.records.set(key, record)
+        return record
+
+    def get(self, key: str):
+        record = self.local.get(key)
+        if record is None and self.cache.get(self.make_key(key, "count")) is not None:
+            record = RemoteStreamRecord(self, key)
+        return record
+
+    def mirror(self, key: str, values: list):
+        # Written in order by a single thread, producers never wait on the cache
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._write, name="stream-mirror", daemon=True)
+                self._thread.start()
+        self._queue.put((key, values))
+
+    def _write(self):
+        while True:
+            key, values = self._queue.get()
+            try:
+                for part, value in values:
+                    self.cache.set(self.make_key(key, part), value, timeout=self.ttl)
+            except Exception:
+                logger.exception("Copying events of stream %s to the cache failed", key)
+
+
+@lru_cache(maxsize=None)
+def get_stream_buffer() -> StreamBuffer:
+    config = getattr(settings, "SSE_STREAM_BUFFER", {})
+    backend = config.get("BACKEND", "apps.core.services.sse.LocalStreamBuffer")
+    return import_string(backend)(**config.get("OPTIONS", {}))
+
+
+def get_coalescer() -> TokenCoalescer:
+    return TokenCoalescer(
+        max_chars=getattr(settings, "SSE_COALESCE_MAX_CHARS", 64),
+        max_delay=getattr(settings, "SSE_COALESCE_MAX_DELAY", 0.05),
+    )
@@ -0,0 +1,62 @@
+def _get(obj, name, default=None):
+    # Streamed chunks are SDK objects, but replays/tests may hand us plain dicts
+    if isinstance(obj, dict):
+        return obj.get(name, default)
+    return getattr(obj, name, default)
+
+
+def _first_choice(chunk):
+    try:
+        return _get(chunk, "choices")[0]
+    except Exception:
+        return None
+
+
+class StreamAccumulator:
+    # Rebuilds the assistant message (text and tool_calls) from streamed deltas,
+    # so a single streamed completion tells us everything a non-streaming call would.
+    def __init__(self):
+        self.content = ""
+        self.tool_calls = {}
+        self.finish_reason = None
+        self.usage = None
+
+    def add(self, chunk):
+        # Feed one chunk, returns its text delta (if any) so callers can forward it right away
+        usage = _get(chunk, "usage")
+        if usage is not None:
+            # Sent on the last chunk (with no choices) when stream_options.include_usage is set
+            self.usage = usage
+
+        choice = _first_choice(chunk)
+        if choice is None:
+            return None
+
+        finish_reason = _get(choice, "finish_reason")
+        if finish_reason:
+            self.finish_reason = finish_reason
+
+        delta = _get(choice, "delta")
+        if delta is None:
+            return None
+
+        for tool_call in _get(delta, "tool_calls") or []:
+            index = _get(tool_call, "index", 0)
+            entry = self.tool_calls.setdefault(index, {
+                "id": "",
+                "type": "function",
+                "function": {"name": "", "arguments": ""},
+            })
+            entry["id"] = _get(tool_call, "id") or entry["id"]
+            function = _get(tool_call, "function")
+            if function is not None:
+                entry["function"]["name"] += _get(function, "name") or ""
+                entry["function"]["arguments"] += _get(function, "arguments") or ""
+
+        content = _get(delta, "content")
+        if content:
+            self.content += content
+        return content
+
+    def get_tool_calls(self) -> list:
+        return [self.tool_calls[index] for index in sorted(self.tool_calls)]
@@ -0,0 +1,135 @@
+import hashlib
+import json
+import threading
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+from apps.core.services.lru import LRUCache
+
+_MISSING = object()
+
+
+class ToolCache:
+    # Cache for read-only tool results.
+    # Every entry key embeds the current generation of the tags the tool reads (e.g. "client"),
+    # so invalidating a tag is a single counter bump and stale entries simply age out.
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._stats_lock = threading.Lock()
+
+    def get_generation(self, tag: str) -> int:
+        raise NotImplementedError
+
+    def bump_generation(self, tag: str):
+        raise NotImplementedError
+
+    def get(self, key: str):
+        raise NotImplementedError
+
+    def set(self, key: str, value):
+        raise NotImplementedError
+
+    def make_key(self, name: str, arguments: dict, tags) -> str:
+        normalized = json.dumps(arguments, sort_keys=True, default=str)
+        digest = hashlib.sha1(normalized.encode()).hexdigest()
+        generations = ".".join(str(self.get_generation(tag)) for tag in tags)
+        return f"tool:{name}:{generations}:{digest}"
+
+    def get_or_call(self, name: str, arguments: dict, tags, call):
+        key = self.make_key(name, arguments, tags)
+        result = self.get(key)
+        if result is not _MISSING:
+            self._count("hits")
+            return result
+
+        self._count("misses")
+        result = call()
+        self.set(key, result)
+        return result
+
+    def invalidate(self, *tags):
+        for tag in tags:
+            self.bump_generation(tag)
+        self._count("invalidations")
+
+    def stats(self) -> dict:
+        # Per-process counters
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def _count(self, counter: str):
+        with self._stats_lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+
+class LocalToolCache(ToolCache):
+    # In-process LRU, only correct when a single process serves all requests
+    def __init__(self, max_entries: int = 2048, ttl: float | None = 300):
+        super().__init__()
+        self.cache = LRUCache(maxsize=max_entries, ttl=ttl)
+        self.generations = {}
+        self._generations_lock = threading.Lock()
+
+    def get_generation(self, tag: str) -> int:
+        return self.generations.get(tag, 0)
+
+    def bump_generation(self, tag: str):
+        with self._generations_lock:
+            self.generations[tag] = self.generations.get(tag, 0) + 1
+
+    def get(self, key: str):
+        return self.cache.get(key, _MISSING)
+
+    def set(self, key: str, value):
+        self.cache.set(key, value)
+
+
+class DjangoToolCache(ToolCache):
+    # Backed by a Django cache alias (CACHES setting), shared by every worker using the same cache
+    def __init__(self, alias: str = "default", ttl: float | None = 300, key_prefix: str = "agentc"):
+        super().__init__()
+        self.alias = alias
+        self.ttl = ttl
+        self.key_prefix = key_prefix
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def _generation_key(self, tag: str) -> str:
+        return f"{self.key_prefix}:generation:{tag}"
+
+    def get_generation(self, tag: str) -> int:
+        return self.cache.get(self._generation_key(tag), 0)
+
+    def bump_generation(self, tag: str):
+        key = self._generation_key(tag)
+        # Generations never expire, otherwise an old generation number could come back
+        self.cache.add(key, 0, timeout=None)
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            self.cache.set(key, 1, timeout=None)
+
+    def get(self, key: str):
+        return self.cache.get(f"{self.key_prefix}:{key}", _MISSING)
+
+    def set(self, key: str, value):
+        self.cache.set(f"{self.key_prefix}:{key}", value, timeout=self.ttl)
+
+
+@lru_cache(maxsize=None)
+def get_tool_cache() -> ToolCache:
+    config = getattr(settings, "TOOL_CACHE", {})
+    backend = config.get("BACKEND", "apps.core.services.tool_cache.LocalToolCache")
+    return import_string(backend)(**config.get("OPTIONS", {}))
@@ -0,0 +1,281 @@
+import json
+import logging
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger("apps.core.tracing")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Metrics:
+    # Minimal in-process Prometheus registry (counters and histograms), rendered by the /metrics view
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.help = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1, help: str = "", **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.help.setdefault(name, ("counter", help))
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, help: str = "", **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.help.setdefault(name, ("histogram", help))
+            buckets, total, count = self.histograms.get(key) or ([0] * (len(DEFAULT_BUCKETS) + 1), 0.0, 0)
+            buckets[bisect_left(DEFAULT_BUCKETS, value)] += 1
+            self.histograms[key] = (buckets, total + value, count + 1)
+
+    def render(self, gauges: dict | None = None) -> str:
+        def labels_text(labels, extra=()):
+            pairs = [*labels, *extra]
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
+
+        lines = []
+        with self._lock:
+            for name, (kind, help) in sorted(self.help.items()):
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                if kind == "counter":
+                    for (key_name, labels), value in sorted(self.counters.items()):
+                        if key_name == name:
+                            lines.append(f"{name}{labels_text(labels)} {value}")
+                    continue
+                for (key_name, labels), (buckets, total, count) in sorted(self.histograms.items()):
+                    if key_name != name:
+                        continue
+                    cumulative = 0
+                    for bound, bucket in zip((*DEFAULT_BUCKETS, "+Inf"), buckets):
+                        cumulative += bucket
+                        lines.append(f"{name}_bucket{labels_text(labels, [('le', bound)])} {cumulative}")
+                    lines.append(f"{name}_sum{labels_text(labels)} {total}")
+                    lines.append(f"{name}_count{labels_text(labels)} {count}")
+
+        for name, value in (gauges or {}).items():
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+class QueryCounter:
+    # connection.execute_wrapper that counts queries and time spent in the database
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - started
+
+
+@contextmanager
+def count_queries(using: str = "default"):
+    # Only sees queries made by the current thread (Django connections are per thread)
+    counter = QueryCounter()
+    with connections[using].execute_wrapper(counter):
+        yield counter
+
+
+class Span:
+    def __init__(self, name: str, attrs: dict):
+        self.name = name
+        self.attrs = attrs
+        self.duration = 0.0
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def set_usage(self, usage):
+        # Token counts reported by the API (absent from some replays and fake servers)
+        if usage is not None:
+            self.set(
+                prompt_tokens=getattr(usage, "prompt_tokens", None),
+                completion_tokens=getattr(usage, "completion_tokens", None),
+            )
+
+
+class StreamSpan:
+    # A streamed model call. Time spent suspended at our own yields (the consumer writing SSE frames)
+    # is reported as a separate sse_flush span, not as model time.
+    def __init__(self, trace, attrs: dict):
+        self.trace = trace
+        self.span = Span("model", attrs)
+        self.started = time.perf_counter()
+        self.flushed = 0.0
+        self.frames = 0
+        self._yielded_at = 0.0
+
+    def before_yield(self):
+        self._yielded_at = time.perf_counter()
+        if self.trace.ttft is None:
+            self.trace.ttft = self._yielded_at - self.trace.started
+            self.span.set(ttft=self.trace.ttft)
+
+    def after_yield(self):
+        self.flushed += time.perf_counter() - self._yielded_at
+        self.frames += 1
+
+    def finish(self, usage=None):
+        self.span.set_usage(usage)
+        self.trace.add_span("model", time.perf_counter() - self.started - self.flushed, **self.span.attrs)
+        if self.frames:
+            self.trace.add_span("sse_flush", self.flushed, frames=self.frames)
+
+
+class Trace:
+    # One user turn. Spans may be added from tool worker threads, hence the lock.
+    enabled = True
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.id = uuid.uuid4().hex[:16]
+        self.started = time.perf_counter()
+        self.spans = []
+        # Turn start to the first streamed token, what the user actually waits for
+        self.ttft = None
+        self._lock = threading.Lock()
+
+    def _prompt_attrs(self, messages: list, step: int) -> dict:
+        return {
+            "step": step,
+            "messages": len(messages),
+            "prompt_bytes": len(json.dumps(messages, default=str).encode()),
+        }
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        span = Span(name, attrs)
+        started = time.perf_counter()
+        try:
+            yield span
+        finally:
+            span.duration = time.perf_counter() - started
+            with self._lock:
+                self.spans.append(span)
+
+    @contextmanager
+    def model_span(self, messages: list, step: int):
+        with self.span("model", **self._prompt_attrs(messages, step)) as span:
+            yield span
+
+    def stream_span(self, messages: list, step: int) -> StreamSpan:
+        return StreamSpan(self, self._prompt_attrs(messages, step))
+
+    @contextmanager
+    def tool_span(self, name: str):
+        # DB metrics per tool are counted on every call by services/profiling.py, here only for the log
+        with self.span("tool", tool=name) as span, count_queries() as queries:
+            yield span
+        span.set(db_queries=queries.count, db_ms=round(queries.seconds * 1000, 3))
+
+    def add_span(self, name: str, duration: float, **attrs):
+        span = Span(name, attrs)
+        span.duration = duration
+        with self._lock:
+            self.spans.append(span)
+
+    def finish(self):
+        duration = time.perf_counter() - self.started
+        metrics.inc("agentc_turns_total", help="Agent turns.", kind=self.kind)
+        metrics.observe("agentc_turn_seconds", duration, help="Agent turn duration.", kind=self.kind)
+        if self.ttft is not None:
+            metrics.observe("agentc_time_to_first_token_seconds", self.ttft, help="Turn start to first token.")
+
+        for span in self.spans:
+            labels = {"span": span.name}
+            if "tool" in span.attrs:
+                labels["tool"] = span.attrs["tool"]
+            metrics.observe("agentc_span_seconds", span.duration, help="Agent turn stage duration.", **labels)
+
+            attrs = span.attrs
+            if "prompt_bytes" in attrs:
+                metrics.inc("agentc_prompt_bytes_total", attrs["prompt_bytes"], help="Bytes of messages sent.")
+            for token_kind in ("prompt_tokens", "completion_tokens"):
+                if attrs.get(token_kind):
+                    metrics.inc(f"agentc_{token_kind}_total", attrs[token_kind], help="Tokens reported by the API.")
+
+        logger.info(json.dumps({
+            "trace_id": self.id,
+            "kind": self.kind,
+            "duration_ms": round(duration * 1000, 3),
+            "ttft_ms": round(self.ttft * 1000, 3) if self.ttft is not None else None,
+            "spans": [
+                {"name": span.name, "duration_ms": round(span.duration * 1000, 3), **span.attrs}
+                for span in self.spans
+            ],
+        }, default=str))
+
+
+class NullSpan:
+    def set(self, **attrs):
+        pass
+
+    def set_usage(self, usage):
+        pass
+
+
+class NullStreamSpan:
+    def before_yield(self):
+        pass
+
+    def after_yield(self):
+        pass
+
+    def finish(self, usage=None):
+        pass
+
+
+class NullTrace:
+    # Used when tracing is disabled, every call is a no-op
+    enabled = False
+    _span = NullSpan()
+    _stream_span = NullStreamSpan()
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        yield self._span
+
+    @contextmanager
+    def model_span(self, messages: list, step: int):
+        yield self._span
+
+    def stream_span(self, messages: list, step: int) -> NullStreamSpan:
+        return self._stream_span
+
+    @contextmanager
+    def tool_span(self, name: str):
+        yield self._span
+
+    def add_span(self, name: str, duration: float, **attrs):
+        pass
+
+    def finish(self):
+        pass
+
+
+NULL_TRACE = NullTrace()
+
+
+def start_trace(kind: str):
+    if getattr(settings, "AGENT_TRACING_ENABLED", False):
+        return Trace(kind)
+    return NULL_TRACE
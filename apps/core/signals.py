@@ -0,0 +1,35 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from apps.core.models import Client, TeamMember
+from apps.core.services.tool_cache import get_tool_cache
+
+
+# Writes that don't go through the tools (admin, shell, data migrations) must invalidate cached reads too
+
+@receiver([post_save, post_delete], sender=Client)
+def invalidate_client_cache(sender, **kwargs):
+    get_tool_cache().invalidate("client")
+
+
+@receiver([post_save, post_delete], sender=TeamMember)
+def invalidate_team_member_cache(sender, **kwargs):
+    get_tool_cache().invalidate("team_member")
+
+
+@receiver(connection_created)
+def enable_sqlite_wal(sender, connection, **kwargs):
+    # WAL on the file this connection opened (a test or bench database is another file than NAME in
+    # settings), never on the tracked db.sqlite3 (settings.DB_SQLITE_TRACKED)
+    if connection.vendor != "sqlite" or not getattr(settings, "DB_SQLITE_WAL", False):
+        return
+    if connection.is_in_memory_db():
+        return
+    if Path(connection.settings_dict["NAME"]).resolve() == settings.DB_SQLITE_TRACKED:
+        return
+    connection.connection.execute("PRAGMA journal_mode=WAL")
+    connection.connection.execute("PRAGMA synchronous=NORMAL")
@@ -0,0 +1,61 @@
+from apps.core.services.profiling import QueryProfile, profile_queries, result_rows
+from apps.core.services.registry import registry
+
+# Query budget assertions for tests, e.g. with django.test.TestCase:
+#
+#     class ClientToolTests(QueryBudgetMixin, TestCase):
+#         def test_add_client(self):
+#             self.assertQueryBudget("add_client", {"name": "Acme", "description": "", "email": "a@acme.com"})
+#
+# The tool function runs directly with validated arguments (no tool cache, no job queue), so the budget
+# (services/profiling.py) is checked against the queries of the tool itself. A failure lists the SQL.
+
+
+def profile_tool(name: str, arguments: dict) -> tuple:
+    # (result, QueryProfile) of one call
+    tool = registry.get(name)
+    arguments = tool.params_model.model_validate(arguments).model_dump(exclude_unset=True)
+    with profile_queries(tool) as profile:
+        result = tool.function(**arguments)
+    profile.rows = result_rows(result)
+    return result, profile
+
+
+def assert_query_budget(name: str, arguments: dict, budget: int | None = None) -> QueryProfile:
+    # budget overrides the configured one
+    _, profile = profile_tool(name, arguments)
+    if budget is not None:
+        profile.budget = budget
+    if profile.over_budget:
+        raise AssertionError(
+            f"{name}({arguments}) made {profile.queries} queries, over its budget of {profile.budget}:\n"
+            + "\n".join(profile.statements)
+        )
+    return profile
+
+
+def assert_query_budgets(samples: dict) -> dict:
+    # samples: tool name -> list of arguments to call it with, in order (an add before its update...).
+    # Every registered tool needs at least one call, so a new tool can't skip its budget.
+    missing = [name for name in registry.names() if not samples.get(name)]
+    if missing:
+        raise AssertionError(f"No sample calls for tools: {', '.join(missing)}")
+    profiles, failures = {}, []
+    for name, calls in samples.items():
+        for arguments in calls:
+            try:
+                profiles.setdefault(name, []).append(assert_query_budget(name, arguments))
+            except AssertionError as e:
+                failures.append(str(e))
+    if failures:
+        raise AssertionError("\n\n".join(failures))
+    return profiles
+
+
+class QueryBudgetMixin:
+    # For unittest/django.test test cases
+    def assertQueryBudget(self, name: str, arguments: dict, budget: int | None = None) -> QueryProfile:
+        return assert_query_budget(name, arguments, budget)
+
+    def assertQueryBudgets(self, samples: dict) -> dict:
+        return assert_query_budgets(samples)
@@ -1,3 +1,544 @@
-from django.test import TestCase
+import asyncio
+import dataclasses
+import json
+import os
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import openai
+from django.test import Client as TestClient
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from apps.core.models import Client, Job, Message, TeamMember
+from apps.core.services.completion_cache import LocalCompletionCache
+from apps.core.services.conversation_store import SUMMARY_PREFIX, DatabaseConversationStore, get_conversation_store
+from apps.core.services import openai_services, ratelimit
+from apps.core.services.jobs import JobQueue, claim_next_job, enqueue, run_job
+from apps.core.services.encoders import JSONResultEncoder, TableResultEncoder
+from apps.core.services.fake_openai import FakeScript, start_fake_openai
+from apps.core.services.history import HistoryManager, count_tokens
+from apps.core.services.registry import registry
+from apps.core.services.sse import StreamRecord, TokenCoalescer, get_stream_buffer
+from apps.core.testing import QueryBudgetMixin
+
+# One or more calls per registered tool, run in order (an add before the get, update and delete of the
+# same record). Calls that miss (unknown email, invalid date) are included, they have budgets too.
+CLIENTS = [{"name": "Acme", "description": "Anvils", "email": f"c{i}@acme.com"} for i in range(7)]
+TEAM_MEMBERS = [
+    {"first_name": "Ana", "last_name": "Diaz", "email": f"t{i}@team.com", "country": "Chile"} for i in range(7)
+]
+MEMBER = {"first_name": "Ana", "last_name": "Diaz", "email": "ana@team.com", "country": "Chile"}
+
+TOOL_SAMPLES = {
+    "add_client": [
+        {"name": "Acme", "description": "Anvils", "email": "a@acme.com"},
+        {"name": "Acme", "description": "Anvils", "email": "a@acme.com"},
+    ],
+    "get_client": [{"email": "a@acme.com"}],
+    "update_client": [
+        {"email": "a@acme.com", "name": "Acme Corp"},
+        {"email": "missing@acme.com", "name": "Acme Corp"},
+        {"email": "a@acme.com"},
+    ],
+    "list_clients": [{}],
+    "search_clients": [{"query": "Acme"}],
+    "count_clients": [{}, {"group_by": "email_domain"}],
+    "delete_client": [{"email": "a@acme.com"}],
+    "add_team_member": [{**MEMBER, "joined_on": "2024-01-02"}, {**MEMBER, "joined_on": "not a date"}],
+    "get_team_member": [{"email": "ana@team.com"}],
+    "update_team_member": [
+        {"email": "ana@team.com", "country": "Peru", "joined_on": "2023-05-05"},
+        {"email": "missing@team.com", "country": "Peru"},
+    ],
+    "list_team_members": [{}],
+    "search_team_members": [{"query": "Ana"}],
+    "count_team_members": [{"group_by": "country"}],
+    "delete_team_member": [{"email": "ana@team.com"}],
+    "add_clients": [{"clients": CLIENTS[:5]}],
+    "upsert_clients": [{"clients": CLIENTS}],
+    "update_clients": [{"clients": [{"email": client["email"], "name": "Acme Corp"} for client in CLIENTS]}],
+    "delete_clients": [{"emails": [client["email"] for client in CLIENTS]}],
+    "add_team_members": [{"team_members": TEAM_MEMBERS[:5]}],
+    "upsert_team_members": [{"team_members": TEAM_MEMBERS}],
+    "update_team_members": [
+        {"team_members": [{"email": member["email"], "country": "Peru"} for member in TEAM_MEMBERS]}
+    ],
+    "delete_team_members": [{"emails": [member["email"] for member in TEAM_MEMBERS]}],
+    "get_job_status": [{"job_id": 1}],
+    "send_email": [{"to_email": "a@acme.com", "subject": "Hello", "body": "Hi"}],
+}
+
+
+class ToolQueryBudgetTests(QueryBudgetMixin, TestCase):
+    def test_every_tool_within_budget(self):
+        self.assertQueryBudgets(TOOL_SAMPLES)
+
+    def test_over_budget_lists_sql(self):
+        with self.assertRaisesMessage(AssertionError, "over its budget of 0"):
+            self.assertQueryBudget("list_clients", {}, budget=0)
+
+
+def tool_call_completion(name: str, arguments: str) -> dict:
+    return {"choices": [{"index": 0, "message": {"role": "assistant", "tool_calls": [
+        {"id": "call_1", "type": "function", "function": {"name": name, "arguments": arguments}},
+    ]}}]}
+
+
+class CompletionCacheTests(TestCase):
+    def setUp(self):
+        self.cache = LocalCompletionCache(similarity_threshold=0.8)
+        self.tools = registry.schemas()
+
+    def messages(self, text: str) -> list:
+        return [{"role": "system", "content": "system"}, {"role": "user", "content": text}]
+
+    def test_exact_tier_ignores_whitespace_not_case(self):
+        completion = tool_call_completion("send_email", '{"to_email": "Bob@acme.com"}')
+        self.cache.store("model", self.messages("Email Bob@acme.com: Hi"), self.tools, "auto", completion)
+        self.assertEqual(
+            self.cache.lookup("model", self.messages(" Email  Bob@acme.com: Hi"), self.tools, "auto"), completion
+        )
+        self.assertIsNone(self.cache.lookup("model", self.messages("email bob@acme.com: hi"), self.tools, "auto"))
+
+    def test_similarity_tier_only_replays_reads(self):
+        read = tool_call_completion("list_clients", "{}")
+        self.cache.store("model", self.messages("List clients"), self.tools, "auto", read)
+        self.assertEqual(self.cache.lookup("model", self.messages("list the clients"), self.tools, "auto"), read)
+
+        delete = tool_call_completion("delete_client", '{"email": "a@acme.com"}')
+        self.cache.store("model", self.messages("Delete a@acme.com"), self.tools, "auto", delete)
+        self.assertIsNone(self.cache.lookup("model", self.messages("delete the a@acme.com"), self.tools, "auto"))
+
+
+def encoded_pages(tool: str, arguments: dict, encoder) -> list:
+    # Follows next_cursor through every page as the model reads them, returns the rows it saw
+    seen = []
+    while True:
+        text = encoder.encode(registry.get(tool).function(**arguments), tool)
+        lines = text.splitlines()
+        cursor = next((line.split(": ", 1)[1] for line in lines if line.startswith("next_cursor: ")), None)
+        seen += [line for line in lines[1:] if " | " in line]
+        if cursor is None:
+            return seen
+        arguments = {**arguments, "cursor": cursor}
+
+
+class PaginationEncodingTests(TestCase):
+    def test_rows_cut_by_the_encoder_are_on_the_next_page(self):
+        TeamMember.objects.bulk_create(
+            TeamMember(first_name="Ana", last_name=f"Diaz{i}", email=f"t{i}@team.com", country="Chile")
+            for i in range(450)
+        )
+        for encoder in (TableResultEncoder(), TableResultEncoder(max_rows=30, max_chars=1500)):
+            rows = encoded_pages("list_team_members", {"limit": 200}, encoder)
+            self.assertEqual([row.split(" | ")[2] for row in rows], [f"t{i}@team.com" for i in range(450)])
+
+    def test_cut_page_points_to_last_shown_row(self):
+        Client.objects.bulk_create(
+            Client(name=f"Client {i}", description="x" * 100, email=f"c{i}@acme.com") for i in range(60)
+        )
+        page = registry.get("list_clients").function()
+        text = TableResultEncoder().encode(page, "list_clients")
+        shown = [line for line in text.splitlines()[1:] if " | " in line]
+        self.assertLess(len(shown), 50)
+        self.assertIn(f"({50 - len(shown)} more rows on the next page", text)
+        self.assertTrue(text.endswith(f"next_cursor: {page['row_cursors'][len(shown) - 1]}"))
+
+    def test_row_cursors_are_not_shown(self):
+        Client.objects.create(name="Acme", description="Anvils", email="a@acme.com")
+        page = registry.get("list_clients").function()
+        self.assertNotIn("row_cursors", TableResultEncoder().encode(page, "list_clients"))
+        self.assertNotIn("row_cursors", JSONResultEncoder().encode(page, "list_clients"))
+
+
+class ResultClippingTests(SimpleTestCase):
+    def test_cut_results_say_how_much_was_left_out(self):
+        encoder = TableResultEncoder(max_chars=100)
+        text = encoder.encode({"name": "Acme", "description": "x" * 200}, "get_client")
+        self.assertEqual(text, "name: Acme\ndescription: " + "x" * 76 + "\n(124 more characters omitted)")
+        self.assertEqual(encoder.encode("y" * 150, "send_email"), "y" * 100 + "\n(50 more characters omitted)")
+        self.assertEqual(encoder.encode({"name": "Acme"}, "get_client"), "name: Acme")
+
+
+@override_settings(JOB_RUN_IN_PROCESS=False)
+class JobIdempotencyTests(TestCase):
+    EMAIL = {"to_email": "a@acme.com", "subject": "Hello", "body": "Hi"}
+
+    def test_same_tool_call_is_queued_once(self):
+        first = registry.dispatch("send_email", self.EMAIL, "conversation-1", "call_1")
+        again = registry.dispatch("send_email", self.EMAIL, "conversation-1", "call_1")
+        self.assertTrue(first.startswith("Queued as job"))
+        self.assertIn("already queued", again)
+        self.assertEqual(Job.objects.count(), 1)
+
+    def test_same_request_from_another_call_or_conversation_is_queued(self):
+        registry.dispatch("send_email", self.EMAIL, "conversation-1", "call_1")
+        registry.dispatch("send_email", self.EMAIL, "conversation-1", "call_2")
+        registry.dispatch("send_email", self.EMAIL, "conversation-2", "call_1")
+        registry.dispatch("send_email", self.EMAIL)
+        self.assertEqual(Job.objects.count(), 4)
+
+    @override_settings(JOB_IDEMPOTENCY_WINDOWS={"send_email": 0})
+    def test_window_per_tool(self):
+        registry.dispatch("send_email", self.EMAIL, "conversation-1", "call_1")
+        Job.objects.update(status=Job.SUCCEEDED)
+        self.assertTrue(registry.dispatch("send_email", self.EMAIL, "conversation-1", "call_1").startswith("Queued"))
+        self.assertEqual(Job.objects.count(), 2)
+
+
+def tool_turn(i: int, result: str) -> list:
+    call = {"id": f"call_{i}", "type": "function", "function": {"name": "list_clients", "arguments": "{}"}}
+    return [
+        {"role": "user", "content": f"question {i}"},
+        {"role": "assistant", "content": None, "tool_calls": [call]},
+        {"role": "tool", "tool_call_id": f"call_{i}", "content": result},
+        {"role": "assistant", "content": f"answer {i}"},
+    ]
+
+
+class HistoryCompactionTests(SimpleTestCase):
+    SYSTEM = {"role": "system", "content": "You are an assistant."}
+
+    def test_history_is_kept_under_the_token_budget(self):
+        manager = HistoryManager(token_budget=300, max_tool_result_chars=100)
+        earlier = [message for i in range(9) for message in tool_turn(i, "x" * 2000)]
+        messages = [self.SYSTEM, *earlier, *tool_turn(9, "ok")]
+        compacted = manager.compact(messages)
+
+        self.assertLessEqual(sum(count_tokens(message) for message in compacted), 300)
+        self.assertEqual(compacted[0], self.SYSTEM)
+        # Whole turns are dropped from the front, every tool result keeps its tool call
+        self.assertEqual(compacted[1]["role"], "user")
+        self.assertEqual(compacted[-4:], tool_turn(9, "ok"))
+        kept = [message for message in compacted[1:-4] if message["role"] == "tool"]
+        self.assertTrue(kept)
+        self.assertTrue(all(message["content"].endswith("[... 1900 characters truncated]") for message in kept))
+
+    def test_current_turn_is_never_dropped(self):
+        manager = HistoryManager(token_budget=50)
+        messages = [self.SYSTEM, *tool_turn(0, "old"), *tool_turn(1, "x" * 4000)]
+        self.assertEqual(manager.compact(messages), [self.SYSTEM, *tool_turn(1, "x" * 4000)])
+
+
+class TokenCoalescerDeadlineTests(SimpleTestCase):
+    def held_record(self) -> StreamRecord:
+        # The first delta goes out at once, the second is held and no other delta follows
+        record = StreamRecord()
+        record.coalescer = TokenCoalescer(max_chars=64, max_delay=0.05)
+        record.publish("token", "Hello")
+        record.publish("token", " world")
+        return record
+
+    def test_wait_flushes_held_text_on_its_deadline(self):
+        record = self.held_record()
+        self.assertEqual(record.wait(0, 5), ([(1, "token", {"text": "Hello"})], False))
+        started = time.monotonic()
+        self.assertEqual(record.wait(1, 5), ([(2, "token", {"text": " world"})], False))
+        self.assertLess(time.monotonic() - started, 1)
+
+    def test_await_events_flushes_held_text_on_its_deadline(self):
+        record = self.held_record()
+        started = time.monotonic()
+        events, done = asyncio.run(record.await_events(1, 5))
+        self.assertEqual(events, [(2, "token", {"text": " world"})])
+        self.assertLess(time.monotonic() - started, 1)
+
+    def test_other_events_flush_held_text_first(self):
+        record = self.held_record()
+        record.publish("tool_start", {"tools": []})
+        self.assertEqual([event for _, event, _ in record.events], ["token", "token", "tool_start"])
+
+
+class FakeOpenAIMixin:
+    # A local fake OpenAI server (services/fake_openai.py) per test class, script replaced per test
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+        cls.fake_openai = start_fake_openai(FakeScript(first_token_latency=0, token_latency=0))
+        cls.addClassCleanup(cls.fake_openai.shutdown)
+
+    def setUp(self):
+        super().setUp()
+        self.script()
+        self.fake_openai.requests = 0
+        settings = override_settings(OPENAI_BASE_URL=self.fake_openai.base_url, COMPLETION_CACHE=None)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.addCleanup(self.reset_clients)
+        self.reset_clients()
+
+    def reset_clients(self):
+        openai_services.get_openai_client.cache_clear()
+        openai_services.get_upstream_semaphore.cache_clear()
+
+    def script(self, **options):
+        self.fake_openai.script = FakeScript(**{"first_token_latency": 0, "token_latency": 0, **options})
+
+
+MESSAGES = [{"role": "user", "content": "Hi"}]
+
+
+@override_settings(OPENAI_MAX_RETRIES=3, OPENAI_RETRY_BASE_DELAY=0, OPENAI_RETRY_MAX_DELAY=5)
+class OpenAIRetryTests(FakeOpenAIMixin, SimpleTestCase):
+    def test_rate_limited_call_is_retried_after_retry_after(self):
+        # No backoff of its own (base delay 0), the wait comes from Retry-After
+        self.script(rate_limited=2, retry_after=0.2)
+        started = time.monotonic()
+        response = openai_services.OpenAIService().chat_with_tools(MESSAGES, [])
+        self.assertGreaterEqual(time.monotonic() - started, 0.4)
+        self.assertTrue(response.choices[0].message.content)
+        self.assertEqual(self.fake_openai.requests, 3)
+
+    def test_async_rate_limited_call_is_retried(self):
+        self.script(rate_limited=1, retry_after=0.2)
+
+        async def call():
+            return await openai_services.OpenAIService().achat_with_tools(MESSAGES, [])
+
+        started = time.monotonic()
+        asyncio.run(call())
+        self.assertGreaterEqual(time.monotonic() - started, 0.2)
+        self.assertEqual(self.fake_openai.requests, 2)
+
+    @override_settings(OPENAI_MAX_RETRIES=1)
+    def test_gives_up_after_max_retries(self):
+        self.script(rate_limited=5, retry_after=0)
+        with self.assertRaises(openai.RateLimitError):
+            openai_services.OpenAIService().chat_with_tools(MESSAGES, [])
+        self.assertEqual(self.fake_openai.requests, 2)
+
+    @override_settings(OPENAI_MAX_CONCURRENT_REQUESTS=1, OPENAI_CONCURRENCY_TIMEOUT=0.1)
+    def test_concurrency_limit(self):
+        with openai_services.upstream_slot():
+            with self.assertRaises(openai_services.UpstreamBusyError):
+                openai_services.OpenAIService().chat_with_tools(MESSAGES, [])
+        self.assertEqual(self.fake_openai.requests, 0)
+        openai_services.OpenAIService().chat_with_tools(MESSAGES, [])
+        self.assertEqual(self.fake_openai.requests, 1)
+
+
+def parse_events(body: bytes) -> list:
+    # SSE frames -> [(id, event, data)], keepalive comments skipped
+    events = []
+    for frame in body.decode().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in frame.splitlines() if not line.startswith(":"))
+        if fields:
+            events.append((int(fields["id"]), fields["event"], json.loads(fields["data"])))
+    return events
+
+
+class ChatStreamMixin(FakeOpenAIMixin):
+    # /stream-chat/ against the fake server, no rate limit (reconnects are exempt anyway)
+    def setUp(self):
+        super().setUp()
+        settings = override_settings(CHAT_RATE_LIMIT=None)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.addCleanup(self.reset_limits)
+        self.reset_limits()
+
+    def reset_limits(self):
+        ratelimit.get_rate_limiter.cache_clear()
+        ratelimit.get_admission.cache_clear()
+
+    def stream(self, stream_id: str, last_event_id: str | None = None):
+        headers = {"HTTP_LAST_EVENT_ID": last_event_id} if last_event_id else {}
+        return self.client.get("/stream-chat/", {"user_input": "Hi", "stream_id": stream_id}, **headers)
+
+    def record(self, stream_id: str) -> StreamRecord:
+        return get_stream_buffer().get(f"{self.client.session.session_key}:{stream_id}")
+
+
+class StreamResumeTests(ChatStreamMixin, TransactionTestCase):
+    def test_reconnect_replays_missed_events(self):
+        self.script(scenario="text", reply_tokens=20)
+        response = self.stream("s1")
+        first = parse_events(next(iter(response.streaming_content)))
+        # The client goes away after the first event, the turn carries on without it
+        response.close()
+        self.record("s1").producer.join(10)
+
+        resumed = parse_events(b"".join(self.stream("s1", last_event_id=str(first[-1][0])).streaming_content))
+        self.assertEqual([event_id for event_id, _, _ in resumed], list(range(first[-1][0] + 1, resumed[-1][0] + 1)))
+        self.assertEqual(resumed[-1][1], "done")
+        text = "".join(data["text"] for _, event, data in first + resumed if event == "token")
+        self.assertEqual(text.split(), [f"word{i}" for i in range(20)])
+        # Replayed from the buffer, the model was not asked again
+        self.assertEqual(self.fake_openai.requests, 1)
+
+    def test_reconnect_to_unknown_stream_does_not_rerun_the_turn(self):
+        events = parse_events(b"".join(self.stream("gone", last_event_id="3").streaming_content))
+        self.assertEqual([event for _, event, _ in events], ["error"])
+        self.assertEqual(self.fake_openai.requests, 0)
+
+
+class ChatSessionTests(ChatStreamMixin, TransactionTestCase):
+    def chat(self, client, user_input: str, reset: bool = False):
+        response = client.post("/chat/", {"user_input": user_input, "reset": reset}, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+
+    def questions(self, client) -> list:
+        history = get_conversation_store().load(client.session.session_key)
+        return [message["content"] for message in history if message["role"] == "user"]
+
+    def test_each_session_has_its_own_conversation(self):
+        other = TestClient()
+        self.chat(self.client, "Hi from A")
+        self.chat(other, "Hi from B")
+        self.chat(self.client, "Again from A")
+        self.assertEqual(self.questions(self.client), ["Hi from A", "Again from A"])
+        self.assertEqual(self.questions(other), ["Hi from B"])
+
+        self.chat(self.client, "", reset=True)
+        self.assertEqual(self.questions(self.client), [])
+        self.assertEqual(self.questions(other), ["Hi from B"])
+
+
+@override_settings(CHAT_ADMISSION={"OPTIONS": {"max_in_flight": 1, "max_queue": 0, "queue_timeout": 0.1}})
+class AdmissionTests(ChatStreamMixin, TransactionTestCase):
+    def test_stream_slot_is_held_until_the_producer_ends(self):
+        self.script(scenario="text", first_token_latency=0.5)
+        response = self.stream("s1")
+        next(iter(response.streaming_content))
+        response.close()
+        # The response is gone, the turn isn't: its slot still counts
+        self.assertEqual(ratelimit.get_admission().stats()["in_flight"], 1)
+        busy = self.client.post("/chat/", {"user_input": "Hi"}, content_type="application/json")
+        self.assertEqual(busy.status_code, 503)
+        self.assertIn("Retry-After", busy)
+
+        self.record("s1").producer.join(10)
+        self.assertEqual(ratelimit.get_admission().stats()["in_flight"], 0)
+        self.assertEqual(self.client.post("/chat/", {"reset": True}, content_type="application/json").status_code, 200)
+
+    @override_settings(CHAT_RATE_LIMIT={"OPTIONS": {"rate": 0.01, "burst": 2}})
+    def test_rate_limit(self):
+        ratelimit.get_rate_limiter.cache_clear()
+        # The first request is counted against the IP, it creates the session the others are counted on
+        self.client.post("/chat/", {"reset": True}, content_type="application/json")
+        codes = [
+            self.client.post("/chat/", {"reset": True}, content_type="application/json").status_code
+            for _ in range(3)
+        ]
+        self.assertEqual(codes, [200, 200, 429])
+        # Page loads are exempt
+        self.assertEqual(self.client.get("/chat/").status_code, 200)
+
+
+@override_settings(JOB_RUN_IN_PROCESS=False, JOB_MAX_ATTEMPTS=2, JOB_LEASE_SECONDS=300)
+class JobQueueTests(TransactionTestCase):
+    def patch_tool(self, name: str, function):
+        tools = {**registry._tools, name: dataclasses.replace(registry.get(name), function=function)}
+        patcher = mock.patch.object(registry, "_tools", tools)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def email(self, i: int) -> dict:
+        return {"to_email": f"c{i}@acme.com", "subject": "Hello", "body": "Hi"}
+
+    def test_job_is_not_claimed_twice(self):
+        job, _ = enqueue("send_email", self.email(0))
+        self.assertEqual(claim_next_job().pk, job.pk)
+        # Running and within its lease
+        self.assertIsNone(claim_next_job())
+
+    def test_workers_run_every_job_once(self):
+        runs, lock = [], threading.Lock()
+
+        def send_email(to_email, subject, body):
+            with lock:
+                runs.append(to_email)
+            return "sent"
+
+        self.patch_tool("send_email", send_email)
+        for i in range(20):
+            enqueue("send_email", self.email(i))
+        queue = JobQueue(workers=4, poll_interval=0.02)
+        queue.start()
+        try:
+            deadline = time.monotonic() + 20
+            while Job.objects.exclude(status=Job.SUCCEEDED).exists() and time.monotonic() < deadline:
+                time.sleep(0.05)
+        finally:
+            queue.stop(timeout=5)
+        self.assertEqual(sorted(runs), sorted(f"c{i}@acme.com" for i in range(20)))
+        self.assertFalse(Job.objects.exclude(status=Job.SUCCEEDED).exists())
+
+    def test_expired_lease_is_claimed_again(self):
+        job, _ = enqueue("send_email", self.email(0))
+        claim_next_job()
+        # The worker running it died: nothing refreshes updated_at any more
+        Job.objects.filter(pk=job.pk).update(updated_at=timezone.now() - timedelta(seconds=301))
+        reclaimed = claim_next_job()
+        self.assertEqual((reclaimed.pk, reclaimed.attempts), (job.pk, 2))
+
+    def test_failed_job_is_retried_then_fails(self):
+        def send_email(to_email, subject, body):
+            raise ConnectionError("SMTP server unavailable")
+
+        self.patch_tool("send_email", send_email)
+        job, _ = enqueue("send_email", self.email(0))
+        with self.assertLogs("apps.core.services.jobs", "ERROR"):
+            run_job(claim_next_job())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.error), (Job.QUEUED, "SMTP server unavailable"))
+        self.assertGreater(job.run_after, job.created_at)
+
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        with self.assertLogs("apps.core.services.jobs", "ERROR"):
+            run_job(claim_next_job())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+
+
+def turn(i: int) -> list:
+    return [{"role": "user", "content": f"question {i}"}, {"role": "assistant", "content": f"answer {i}"}]
+
+
+class DatabaseConversationStoreTests(TestCase):
+    def store(self, **options) -> DatabaseConversationStore:
+        store = DatabaseConversationStore(**options)
+        # Written inside the test transaction, not by the atexit flush
+        self.addCleanup(store.flush)
+        return store
+
+    def test_appends_are_held_until_flushed(self):
+        # Long interval: only the explicit flush writes
+        store = self.store(flush_interval=3600)
+        store.append("c1", turn(1), turn(1))
+        self.assertFalse(Message.objects.exists())
+        self.assertEqual(store.load("c1"), turn(1))
+
+        store.flush()
+        self.assertEqual(Message.objects.count(), 2)
+        store.append("c1", turn(2), turn(2))
+        self.assertEqual(store.load("c1"), turn(1) + turn(2))
+        self.assertEqual(store.load("c2"), [])
+
+    def test_load_returns_summary_and_window(self):
+        store = self.store(window_messages=4, flush_interval=0)
+        for i in range(1, 5):
+            store.append("c1", turn(i), turn(i))
+
+        summary, *window = store.load("c1")
+        self.assertEqual(window, turn(3) + turn(4))
+        self.assertTrue(summary["content"].startswith(SUMMARY_PREFIX))
+        self.assertIn("User: question 1", summary["content"])
+        self.assertIn("Assistant: answer 2", summary["content"])
+        # The summary is rebuilt on load, appending it again logs nothing
+        store.append("c1", [summary], [summary])
+        self.assertEqual(Message.objects.count(), 8)
+
+    def test_clear_drops_written_and_queued_messages(self):
+        store = self.store(flush_interval=3600)
+        store.append("c1", turn(1), turn(1))
+        store.flush()
+        store.append("c1", turn(2), turn(2))
+        store.clear("c1")
+        store.flush()
+        self.assertEqual(store.load("c1"), [])
+        self.assertFalse(Message.objects.exists())
@@ -4,5 +4,6 @@ from . import views
 urlpatterns = [
     path("chat/", views.chat_view, name="chat"),
     path("stream-chat/", views.stream_chat_view, name="stream_chat"),  # SSE stream
-    path("stream-test/", views.stream_test, name="stream_test")
+    path("stream-test/", views.stream_test, name="stream_test"),
+    path("metrics", views.metrics_view, name="metrics"),  # Prometheus scrape target
 ]
\ No newline at end of file
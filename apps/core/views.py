@@ -1,13 +1,43 @@
+from django.conf import settings
+from django.db import close_old_connections
 from django.shortcuts import render
-from django.http import JsonResponse, StreamingHttpResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
+from django.core.handlers.asgi import ASGIRequest
+from asgiref.sync import sync_to_async
+from contextlib import aclosing, closing
 from .services.agent import Agent
+from .services.conversation_store import get_conversation_store
+from .services.completion_cache import get_completion_cache
+from .services.tool_cache import get_tool_cache
+from .services.tracing import metrics
+from .services.ratelimit import get_admission, rate_limited, take_slot
+from .services.sse import StreamRecord, format_event, format_keepalive, get_coalescer, get_stream_buffer
+import asyncio
 import json
+import threading
 import time
+import uuid
 
-agent = Agent()
+def get_conversation_id(request):
+    # Every browser session gets its own conversation history
+    if not request.session.session_key:
+        request.session.create()
+    return request.session.session_key
+
+def load_agent(conversation_id, reset=False):
+    store = get_conversation_store()
+    if reset:
+        store.clear(conversation_id)
+        return Agent(conversation_id=conversation_id)
+    return Agent(history=store.load(conversation_id), conversation_id=conversation_id)
+
+def reconnecting(request):
+    # Stream reconnects are replayed from the buffer, they never reach the model
+    return bool(request.headers.get("Last-Event-ID") or request.GET.get("last_event_id"))
 
 @csrf_exempt
+@rate_limited(exempt=lambda request: request.method != "POST")
 def chat_view(request):
     if request.method != "POST":
         return render(request, "chat.html")
@@ -15,29 +45,164 @@ def chat_view(request):
         data = json.loads(request.body)
         user_input = data.get("user_input", "")
         reset = data.get("reset", False)
-        reply = agent.handle_message(user_input, reset=reset)
+        conversation_id = get_conversation_id(request)
+        agent = load_agent(conversation_id, reset=reset)
+        if reset and not user_input:
+            # Plain reset (Clear button), nothing to send to the model
+            return JsonResponse({"reply": ""})
+        reply = agent.handle_message(user_input)
+        get_conversation_store().append(conversation_id, agent.history, agent.new_messages)
         return JsonResponse({"reply": reply})
     except Exception as e:
         return JsonResponse({"reply": f"[Error: {str(e)}]"})
 
 @csrf_exempt
-def stream_chat_view(request):
+@rate_limited(exempt=reconnecting)
+async def stream_chat_view(request):
+    # Typed SSE events (see services/sse.py). The turn runs in a background producer writing to a
+    # per-stream buffer, this response only follows it: a dropped connection doesn't stop the turn,
+    # and the browser's automatic reconnect (Last-Event-ID) resumes from the buffer.
     user_input = request.GET.get("user_input", "")
     reset = request.GET.get("reset", "false").lower() == "true"
+    stream_id = request.GET.get("stream_id") or uuid.uuid4().hex
+    last_event_id = request.headers.get("Last-Event-ID") or request.GET.get("last_event_id")
+    conversation_id = await sync_to_async(get_conversation_id)(request)
+    asgi = isinstance(request, ASGIRequest)
+
+    key = f"{conversation_id}:{stream_id}"
+    # A shared buffer (DjangoStreamBuffer) reads the cache, kept off the event loop
+    buffer = get_stream_buffer()
+    record = await sync_to_async(buffer.get, thread_sensitive=False)(key)
+    after_id = 0
+    if record is not None and last_event_id:
+        after_id = int(last_event_id) if last_event_id.isdigit() else 0
+    elif record is None and last_event_id:
+        # Reconnect to a stream that expired (or ran on another worker), never rerun the turn for it
+        record = StreamRecord()
+        record.append("error", {"message": "[This reply is no longer available, please ask again.]"})
+        record.finish()
+    elif record is None:
+        record = await sync_to_async(buffer.create, thread_sensitive=False)(key)
+        # The producer holds the admission slot until the turn ends, the response only follows it
+        slot = take_slot(request)
+        if asgi:
+            record.producer = asyncio.get_running_loop().create_task(
+                aproduce_stream(record, conversation_id, user_input, reset, slot)
+            )
+        else:
+            # Under WSGI an async iterator would be buffered whole, so the producer is a thread
+            record.producer = threading.Thread(
+                target=produce_stream,
+                args=(record, conversation_id, user_input, reset, slot),
+                name=f"stream-{stream_id[:8]}",
+                daemon=True,
+            )
+            record.producer.start()
+
+    events = afollow_stream(record, after_id) if asgi else follow_stream(record, after_id)
+    response = StreamingHttpResponse(events, content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
 
-    def event_stream():
+def produce_stream(record, conversation_id, user_input, reset, slot=None):
+    grace = getattr(settings, "SSE_ABANDON_GRACE", 30)
+    record.coalescer = get_coalescer()
+    agent = None
+    try:
+        agent = load_agent(conversation_id, reset=reset)
+        with closing(agent.stream_message(user_input)) as events:
+            for event, data in events:
+                if record.abandoned(grace):
+                    # Nobody came back for it, stop paying for the model
+                    return
+                record.publish(event, data)
+        record.publish("done", {})
+    except Exception as e:
+        record.publish("error", {"message": f"[Error streaming: {str(e)}]"})
+    finally:
         try:
-            for chunk in agent.stream_message(user_input, reset=reset):
-                if chunk is None:
-                    continue
-                yield f"data: {chunk}\n\n"
+            if agent is not None:
+                get_conversation_store().append(conversation_id, agent.history, agent.new_messages)
+        finally:
+            record.finish()
+            close_old_connections()
+            if slot is not None:
+                slot.release()
 
-            # To avoid false positives, we explicitly say that the stream is done
-            yield "data: [DONE]\n\n"
-        except Exception as e:
-            yield f"data: [Error streaming: {str(e)}]\n\n"
+async def aproduce_stream(record, conversation_id, user_input, reset, slot=None):
+    # ASGI twin of produce_stream, an asyncio task on the server's event loop
+    grace = getattr(settings, "SSE_ABANDON_GRACE", 30)
+    record.coalescer = get_coalescer()
+    agent = None
+    try:
+        agent = await sync_to_async(load_agent)(conversation_id, reset=reset)
+        async with aclosing(agent.astream_message(user_input)) as events:
+            async for event, data in events:
+                if record.abandoned(grace):
+                    return
+                record.publish(event, data)
+        record.publish("done", {})
+    except Exception as e:
+        record.publish("error", {"message": f"[Error streaming: {str(e)}]"})
+    finally:
+        try:
+            if agent is not None:
+                await sync_to_async(get_conversation_store().append)(
+                    conversation_id, agent.history, agent.new_messages
+                )
+        finally:
+            record.finish()
+            if slot is not None:
+                # A shared admission releases through the cache
+                await sync_to_async(slot.release, thread_sensitive=False)()
+
+def follow_stream(record, after_id):
+    keepalive = getattr(settings, "SSE_KEEPALIVE_SECONDS", 15)
+    record.attach()
+    try:
+        while True:
+            events, done = record.wait(after_id, keepalive)
+            if not events and not done:
+                yield format_keepalive()
+                continue
+            for event_id, event, data in events:
+                yield format_event(event_id, event, data)
+                after_id = event_id
+            if done:
+                return
+    finally:
+        record.detach()
+
+async def afollow_stream(record, after_id):
+    # On disconnect Django cancels us, the producer carries on for SSE_ABANDON_GRACE seconds
+    keepalive = getattr(settings, "SSE_KEEPALIVE_SECONDS", 15)
+    record.attach()
+    try:
+        while True:
+            events, done = await record.await_events(after_id, keepalive)
+            if not events and not done:
+                yield format_keepalive()
+                continue
+            for event_id, event, data in events:
+                yield format_event(event_id, event, data)
+                after_id = event_id
+            if done:
+                return
+    finally:
+        record.detach()
 
-    return StreamingHttpResponse(event_stream(), content_type="text/event-stream")
+def metrics_view(request):
+    # Prometheus text format. Turn/span metrics are only collected with AGENT_TRACING_ENABLED,
+    # cache counters are always there. Values are per process.
+    gauges = {f"agentc_tool_cache_{key}": value for key, value in get_tool_cache().stats().items()}
+    completion_cache = get_completion_cache()
+    if completion_cache:
+        gauges.update({f"agentc_completion_cache_{key}": value for key, value in completion_cache.stats().items()})
+    admission = get_admission()
+    if admission:
+        gauges.update({f"agentc_admission_{key}": value for key, value in admission.stats().items()})
+    return HttpResponse(metrics.render(gauges), content_type="text/plain; version=0.0.4; charset=utf-8")
 
 def stream_test(request):
     # Small test for SSE stream
@@ -8,6 +8,9 @@ const errorBanner = document.getElementById('error-banner');
 const typingIndicator = document.getElementById('typing-indicator');
 
 let activeEventSource = null;
+const typingIndicatorText = typingIndicator.textContent;
+// Automatic reconnects tried before a stream is given up
+const MAX_RECONNECTS = 3;
 
 // Init
 window.onload = () => {
@@ -74,11 +77,12 @@ function setStreamingActive(active, msgDiv) {
     }
   } else {
     typingIndicator.classList.add('hidden');
+    typingIndicator.textContent = typingIndicatorText;
     document.querySelectorAll('.stream-dots').forEach(el => el.remove());
   }
 }
 
-// SSE streaming send function (plain text)
+// SSE streaming send function (typed events: token, tool_start, tool_result, done, error)
 async function sendMessageSSE(reset = false) {
   const text = userInput.value.trim();
   if (!text && !reset) return;
@@ -114,10 +118,12 @@ async function sendMessageSSE(reset = false) {
   chatWindow.appendChild(msgDiv);
   chatWindow.scrollTop = chatWindow.scrollHeight;
 
-  // Build query params and encode them
+  // Build query params and encode them. stream_id names this turn on the server, so that an
+  // automatic reconnect (EventSource sends Last-Event-ID) resumes it instead of asking again.
   const params = new URLSearchParams({
     user_input: text,
-    reset: "false"
+    reset: "false",
+    stream_id: (window.crypto && crypto.randomUUID) ? crypto.randomUUID() : String(Date.now()) + Math.random()
   });
   const url = `/stream-chat/?${params.toString()}`;
 
@@ -130,50 +136,73 @@ async function sendMessageSSE(reset = false) {
   // Open EventSource
   const es = new EventSource(url);
   activeEventSource = es;
+  let reconnects = 0;
 
   setStreamingActive(true, msgDiv);
   hideErrorBanner();
 
-  es.onopen = () => {
-    hideErrorBanner();
+  const finish = () => {
+    try { es.close(); } catch (_) {}
+    setStreamingActive(false, msgDiv);
+    if (activeEventSource === es) activeEventSource = null;
   };
 
-  es.onmessage = (e) => {
-    // end sentinel
-    if (e.data === "[DONE]" || e.data === "[END]") {
-      try { es.close(); } catch (err) {}
-      setStreamingActive(false, msgDiv);
-      activeEventSource = null;
-      return;
-    }
-
-    // Append incoming chunk as plain text BEFORE dots (so dots stay at end)
+  // Append text BEFORE dots (so dots stay at end)
+  const appendText = (chunk) => {
     const dots = msgDiv.querySelector('.stream-dots');
     if (dots) {
-      const node = document.createTextNode(e.data);
-      msgDiv.insertBefore(node, dots);
+      msgDiv.insertBefore(document.createTextNode(chunk), dots);
     } else {
-      msgDiv.textContent += e.data;
+      msgDiv.textContent += chunk;
     }
     chatWindow.scrollTop = chatWindow.scrollHeight;
   };
 
-  es.onerror = (err) => {
-    try {
-      if (es.readyState !== EventSource.CLOSED) {
-        console.error("EventSource error:", err);
-        showErrorBanner("Stream error: connection interrupted.");
-        msgDiv.textContent += "\n\n[Stream interrupted — check console]";
-      }
-    } catch (e) {
-      msgDiv.textContent += "\n\n[Stream interrupted — check console]";
-    } finally {
-      try { es.close(); } catch (_) {}
-      setStreamingActive(false, msgDiv);
-      activeEventSource = null;
-    }
+  es.onopen = () => {
+    reconnects = 0;
+    hideErrorBanner();
   };
 
+  es.addEventListener('token', (e) => {
+    appendText(JSON.parse(e.data).text);
+  });
+
+  // Ids of the tool calls still running: one tool_start lists every call of a step, each call then
+  // reports its own tool_result
+  const runningTools = new Set();
+
+  es.addEventListener('tool_start', (e) => {
+    const data = JSON.parse(e.data);
+    data.tools.forEach(t => runningTools.add(t.id));
+    typingIndicator.textContent = `Using ${data.tools.map(t => t.name).join(", ")}…`;
+  });
+
+  es.addEventListener('tool_result', (e) => {
+    runningTools.delete(JSON.parse(e.data).id);
+    if (runningTools.size === 0) typingIndicator.textContent = typingIndicatorText;
+  });
+
+  es.addEventListener('done', finish);
+
+  es.addEventListener('error', (e) => {
+    // Named "error" event sent by the server (has data), vs a dropped connection (no data)
+    if (e.data) {
+      appendText(JSON.parse(e.data).message);
+      finish();
+      return;
+    }
+    reconnects += 1;
+    if (es.readyState === EventSource.CLOSED || reconnects > MAX_RECONNECTS) {
+      console.error("EventSource error:", e);
+      showErrorBanner("Stream error: connection interrupted.");
+      appendText("\n\n[Stream interrupted — check console]");
+      finish();
+      return;
+    }
+    // The browser reconnects by itself and the server replays what was missed
+    showErrorBanner("Connection lost, reconnecting…");
+  });
+
   // Clear input & disable controls while streaming
   userInput.value = '';
   userInput.disabled = true;